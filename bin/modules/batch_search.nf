@@ -0,0 +1,58 @@
+//============================================================================//
+// Default params
+//============================================================================//
+params.out_dir = "output"
+params.search = "diamond"
+
+//============================================================================//
+// Define processes
+//============================================================================//
+process concatenate_batch {
+  tag "$batchID"
+  beforeScript "module load gcc conda2"
+
+  input:
+  tuple batchID, sampleIDs, file(sequences)
+
+  output:
+  tuple batchID, file("${batchID}.fasta")
+
+  script:
+  """
+  # Link each sample's sequences as <sampleID>.fasta, so the sequences are
+  # labelled <sampleID>__<sequence name>
+  samples=(${sampleIDs.join(' ')})
+  files=(${sequences})
+  mkdir labelled
+  for i in "\${!samples[@]}" ; do
+    ln -s ../\${files[\$i]} labelled/\${samples[\$i]}.fasta
+  done
+
+  python $workflow.projectDir/bin/python/concatenate_and_label_sequences.py \
+  "labelled/*.fasta" \
+  ${batchID}.fasta
+  """
+}
+
+process split_batch {
+  tag "$batchID"
+  // Publish the per-sample hits where unbatched runs put them
+  publishDir "$params.out_dir/$params.search", mode: "copy",
+    saveAs: { name -> name.tokenize('/').last() }
+  beforeScript "module load gcc conda2"
+
+  input:
+  tuple batchID, results
+
+  output:
+  file("split/*") optional true
+
+  script:
+  """
+  # Write the hits of each sample to split/<sampleID>_${params.search}.out,
+  # removing the <sampleID>__ label from the query names
+  cat ${results} | python $workflow.projectDir/bin/python/deconcatenate_lines_by_ID.py \
+  split \
+  ${params.search}.out
+  """
+}
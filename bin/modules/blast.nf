@@ -13,13 +13,14 @@ params.blast_restrict_to_taxids = "no"
 params.blast_ignore_taxids = "no"
 params.out_dir = 'output'
 params.log_file = "${workflow.launchDir}/${params.out_dir}/reports/virID.log"
+params.publish_hits = "T"
 
 //============================================================================//
 // Define process
 //============================================================================//
 process blast {
   tag "$sampleID"
-  publishDir "$params.out_dir/blast", mode: "copy"
+  publishDir "$params.out_dir/blast", mode: "copy", enabled: params.publish_hits == "T"
   beforeScript "module load gcc conda2"
 
   input:
@@ -8,6 +8,10 @@ params.source = "diamond"
 params.taxid_blacklist = "$workflow.projectDir/resources/2019-08-09_blacklist.tsv"
 params.taxonomy_column = "taxonID"
 params.score_column = "bitscore"
+params.LCA_cache_file = ""
+params.LCA_counts = "F"
+params.LCA_table = "T"
+params.compress_intermediates = "F"
 
 //============================================================================//
 // Define process
@@ -21,18 +25,22 @@ process blast_to_LCA {
   tuple sampleID, assignment_file
 
   output:
-  tuple sampleID, file("*.tsv")
+  tuple sampleID, file("${sampleID}_${params.source}.tsv*") optional (params.LCA_table == "F")
+  tuple sampleID, file("${sampleID}_${params.source}_counts.tsv*") optional (params.LCA_counts == "F")
 
   script:
   """
   python $workflow.projectDir/bin/python/get_LCA.py \
   -i ${assignment_file} \
-  -o ${sampleID}_${params.source}.tsv \
+  ${params.LCA_table == "T" ? "-o ${sampleID}_${params.source}.tsv${params.compress_intermediates == "T" ? ".gz" : ""}" : ""} \
+  ${params.LCA_counts == "T" ? "--counts_outfile ${sampleID}_${params.source}_counts.tsv${params.compress_intermediates == "T" ? ".gz" : ""}" : ""} \
   -c "${params.column_names}" \
   -t ${params.taxonomy_column} \
   -s ${params.score_column} \
   -b ${params.taxid_blacklist} \
   -w ${params.within_percent_of_top_score} \
-  -l ${sampleID}_conversion.log
+  -l ${sampleID}_conversion.log \
+  -p ${task.cpus} \
+  --streaming ${params.LCA_cache_file ? "--cache_file ${params.LCA_cache_file}" : ""}
   """
 }
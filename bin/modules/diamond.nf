@@ -7,13 +7,14 @@ params.temp_dir = "temp"
 params.diamond_evalue = "10"
 params.out_dir = "output"
 params.log_file = "${workflow.launchDir}/${params.out_dir}/reports/virID.log"
+params.publish_hits = "T"
 
 //============================================================================//
 // Define process
 //============================================================================//
 process diamond {
   tag "$sampleID"
-  publishDir "$params.out_dir/diamond", mode: "copy"
+  publishDir "$params.out_dir/diamond", mode: "copy", enabled: params.publish_hits == "T"
   beforeScript "module load gcc conda2"
 
   input:
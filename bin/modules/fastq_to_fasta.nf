@@ -21,6 +21,7 @@ process fastq_to_fasta {
   """
   # Concatenate the paired and unpaired files. The entire purpose of splitting
   # them is to make sure paired reads are appropriately marked with /1 and /2.
+  # Concatenated gzip files are a valid gzip file, which seqtk reads directly.
   cat ${paired_fastq} ${unpaired_fastq} > reads.fastq
 
   # Convert to fasta
@@ -15,33 +15,33 @@ process generate_output {
   tuple sampleID, blast_file, diamond_file, contigs, mapped_counts, mapped_coverage, mapped_bam, contaminant
 
   output:
-  tuple sampleID, file("*tsv")
+  tuple sampleID, file("*tsv*")
 
   script:
   """
   cut -f1 ${contaminant} > contaminant_list.txt
 
   # If contaminant file has contents, subtract those sequences before generating
-  # counts.
+  # counts. zcat -f reads both compressed and uncompressed inputs.
   if [[ -s contaminant_list.txt ]] ; then
-    grep -v -f contaminant_list.txt ${blast_file} > blast_contaminants_removed.txt
-    grep -v -f contaminant_list.txt ${diamond_file} > diamond_contaminants_removed.txt
+    zcat -f ${blast_file} | grep -v -f contaminant_list.txt > blast_contaminants_removed.txt
+    zcat -f ${diamond_file} | grep -v -f contaminant_list.txt > diamond_contaminants_removed.txt
   else
-    cp ${blast_file} blast_contaminants_removed.txt
-    cp ${diamond_file} diamond_contaminants_removed.txt
+    zcat -f ${blast_file} > blast_contaminants_removed.txt
+    zcat -f ${diamond_file} > diamond_contaminants_removed.txt
   fi
 
   # Generate counts files - blast
   python $workflow.projectDir/bin/python/get_counts.py \
   -i blast_contaminants_removed.txt \
-  -o ${sampleID}_blast_counts.tsv \
+  -o ${sampleID}_blast_counts.tsv${params.compress_intermediates == "T" ? ".gz" : ""} \
   -l ${sampleID}_get_counts.log \
   -c ${mapped_counts}
 
   # Generate counts files - diamond
   python $workflow.projectDir/bin/python/get_counts.py \
   -i diamond_contaminants_removed.txt \
-  -o ${sampleID}_diamond_counts.tsv \
+  -o ${sampleID}_diamond_counts.tsv${params.compress_intermediates == "T" ? ".gz" : ""} \
   -l ${sampleID}_get_counts.log \
   -c ${mapped_counts}
 
@@ -50,7 +50,7 @@ process generate_output {
   -t ${blast_file} \
   -T ${diamond_file} \
   -f ${contigs} \
-  -o ${sampleID}_merged.tsv \
+  -o ${sampleID}_merged.tsv${params.compress_intermediates == "T" ? ".gz" : ""} \
   -c ${mapped_counts} \
   -v ${mapped_coverage} \
   -m contaminant_list.txt \
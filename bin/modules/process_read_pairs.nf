@@ -15,13 +15,16 @@ process process_read_pairs {
   tuple sampleID, file(reads)
 
   output:
-  tuple sampleID, file('*_paired.fastq'), file('*_unpaired.fastq')
+  tuple sampleID, file('*_paired.fastq*'), file('*_unpaired.fastq*')
 
   script:
   """
   python $workflow.projectDir/bin/python/process_read_pairs.py \
   -f ${reads} \
   -o ${sampleID} \
-  -l ${sampleID}_process_read_pairs.log
+  -l ${sampleID}_process_read_pairs.log \
+  -M ${task.memory.toMega().intdiv(2)} \
+  -T . \
+  ${params.compress_intermediates == "T" ? "-z gzip" : ""}
   """
 }
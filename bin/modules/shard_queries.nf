@@ -0,0 +1,51 @@
+//============================================================================//
+// Default params
+//============================================================================//
+params.out_dir = "output"
+params.search = "diamond"
+params.shard_max_Mbp = 50
+params.publish_hits = "T"
+
+//============================================================================//
+// Define processes
+//============================================================================//
+process shard_queries {
+  tag "$sampleID"
+  beforeScript "module load gcc conda2"
+
+  input:
+  tuple sampleID, sequences
+
+  output:
+  tuple sampleID, file("shards/*")
+
+  script:
+  """
+  # Split the queries into shards of consecutive sequences with about
+  # params.shard_max_Mbp residues each, named
+  # <sampleID>.shard_<i>_of_<n>.fasta
+  python $workflow.projectDir/bin/python/shard_fasta.py \
+  -i ${sequences} \
+  -o shards/${sampleID} \
+  -r ${(params.shard_max_Mbp as long) * 1000000}
+  """
+}
+
+process gather_hits {
+  tag "$sampleID"
+  publishDir "$params.out_dir/$params.search", mode: "copy", enabled: params.publish_hits == "T"
+  beforeScript "module load gcc conda2"
+
+  input:
+  tuple sampleID, file(hits)
+
+  output:
+  tuple sampleID, file("${sampleID}_${params.search}.out")
+
+  script:
+  """
+  # Concatenate the hits of the shards in shard order, which is the order of
+  # the queries, so the hits of each query stay consecutive
+  cat \$(ls ${hits} | sort) > ${sampleID}_${params.search}.out
+  """
+}
@@ -0,0 +1,6 @@
+#!/usr/bin/env python3
+# Runs virid/shard_fasta.py. Kept so the script can still be run, and imported, by
+# this name - see virid/cli.py.
+from virid.cli import shim
+
+shim(__name__, "shard_fasta")
@@ -0,0 +1,11 @@
+"""
+virID's python code, as an importable package.
+
+The modules can be imported and used in-process, e.g.
+
+    from virid import get_counts
+    counts_DF = get_counts.assign_counts(taxon_counts)
+
+and run as subcommands of the virid command (see cli.py). Importing a module
+doesn't load the taxonomy - it is loaded the first time it is used.
+"""
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+
+#------------------------------------------------------------------------------#
+# Import packages
+#------------------------------------------------------------------------------#
+import argparse
+import inspect
+import multiprocessing
+import os
+import pathlib
+from glob import glob
+
+import pandas as pd
+
+from . import get_counts
+from .get_counts import write_to_log
+from .counts_matrix import CountsMatrix
+from .compressed_io import open_input, open_output, strip_compression_suffix
+
+#------------------------------------------------------------------------------#
+# Define Functions
+#------------------------------------------------------------------------------#
+def get_sample_name(infile):
+    """ Sample name of an input file - its name without directory or suffixes. """
+    return pathlib.Path(strip_compression_suffix(infile)).stem
+
+def read_sample_counts(infile, count_column = 'read_count', origin = ''):
+    """
+    Reads a get_LCA.py or merge_and_postprocess.py output file and returns a
+    dictionary of structure LCA_taxonID:counts. Each line counts as one read
+    unless the file has a count_column, in which case its value is used. If
+    origin is specified, only lines with that value in the origin column are
+    counted.
+    """
+    with open_input(infile) as infile_handle:
+        header = infile_handle.readline().rstrip("\n").split("\t")
+    if not 'LCA_taxonID' in header:
+        raise ValueError(infile + " has no LCA_taxonID column.")
+    if origin != '' and not 'origin' in header:
+        raise ValueError(infile + " has no origin column to select " + origin + " from.")
+
+    usecols = ['LCA_taxonID'] + [column for column in [count_column, 'origin']
+                                 if column in header]
+    with open_input(infile) as infile_handle:
+        DF = pd.read_csv(infile_handle, sep = '\t', usecols = usecols)
+
+    if origin != '':
+        DF = DF[DF['origin'] == origin]
+
+    # As in get_counts.py, missing LCA_taxonIDs count towards 0, which is skipped
+    LCA_taxonIDs = DF['LCA_taxonID'].fillna(0).astype(int)
+    if count_column in DF.columns:
+        counts = DF[count_column].fillna(0)
+    else:
+        counts = pd.Series(1, index = DF.index)
+    taxon_counts = counts.groupby(LCA_taxonIDs.values, sort = False).sum()
+
+    return dict(zip(taxon_counts.index.tolist(), taxon_counts.values))
+
+def count_sample(infile, count_column = 'read_count', origin = ''):
+    """
+    Returns the (taxonIDs, counts) arrays of every taxon at a cannonical level
+    that the reads of infile are assigned to.
+    """
+    taxon_counts = read_sample_counts(infile, count_column, origin)
+    return get_counts.distribute_counts(taxon_counts)
+
+def count_sample_star(arguments):
+    return count_sample(*arguments)
+
+def count_samples(infiles, count_column = 'read_count', origin = '', threads = 1):
+    """
+    Counts the samples of infiles, threads at a time, and returns a list of
+    their (taxonIDs, counts) arrays.
+    """
+    #State progress
+    function_name = inspect.stack()[0][3]
+    print(function_name + ': Counting ' + str(len(infiles)) + ' samples.')
+
+    arguments = [(infile, count_column, origin) for infile in infiles]
+    if threads > 1 and len(infiles) > 1:
+        # Forked workers share the taxonomy loaded by get_counts
+        get_counts.taxonomy.resolve()
+        get_counts.lineage_table.resolve()
+        pool = multiprocessing.get_context("fork").Pool(min(threads, len(infiles)))
+        try:
+            columns = pool.map(count_sample_star, arguments, chunksize = 1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        columns = [count_sample_star(argument) for argument in arguments]
+
+    print(function_name + ': Finished.')
+    return columns
+
+def write_taxa_table(counts_matrix, taxa_outfile):
+    """
+    Writes the lineage, superkingdom, taxon and level of every row of
+    counts_matrix to taxa_outfile, indexed by taxonID.
+    """
+    #State progress
+    function_name = inspect.stack()[0][3]
+    print(function_name + ': Writing the taxa table to ' + taxa_outfile)
+
+    taxa_DF = get_counts.describe_taxa(counts_matrix.taxonIDs)
+    write_table(taxa_DF, taxa_outfile, index = True)
+
+    print(function_name + ': Finished.')
+    return taxa_DF
+
+def make_aggregated_table(counts_matrix, taxa_DF):
+    """
+    Returns the counts matrix in the layout of aggregate_counts.py - the
+    lineage, superkingdom, taxon and level columns followed by the taxonID and
+    sample columns in sorted order, with float counts.
+    """
+    counts_DF = counts_matrix.to_dataframe(dtype = float)
+    aggregated = pd.concat([taxa_DF, counts_DF], axis = 1).reset_index()
+
+    first_colnames = ['lineage', 'superkingdom', 'taxon', 'level']
+    other_colnames = sorted(['taxonID'] + counts_matrix.samples)
+    return aggregated[first_colnames + other_colnames]
+
+def write_table(output_DF, output_path, index = False):
+    #Make the output directory if necessary
+    output_directory = os.path.dirname(output_path)
+    pathlib.Path(output_directory).mkdir(parents=True, exist_ok=True)
+
+    #Write the output file, compressed if its name ends in .gz, .bgz or .zst
+    with open_output(output_path) as outfile:
+        output_DF.to_csv(outfile, sep='\t', index=index)
+
+#------------------------------------------------------------------------------#
+# Define and execute main
+#------------------------------------------------------------------------------#
+def main():
+    parser = argparse.ArgumentParser(description="""
+    The purpose of this script is to count the reads of many samples at once
+    and aggregate them into a single taxa x samples matrix, in place of running
+    get_counts.py on each sample followed by aggregate_counts.py.
+
+    Input:
+    # - input_files_glob - A glob detailing the get_LCA.py (or
+        merge_and_postprocess.py) output files, one per sample. The sample name
+        is the file name without its suffixes.
+
+    Output:
+    # - outfile - A sparse matrix of the counts of each taxon in each sample,
+        keyed by taxonID, as a compressed .npz file. It can be read with
+        counts_matrix.CountsMatrix.load() or scipy.sparse.load_npz().
+    # - taxa_outfile - A tab-delimited table of the lineage, superkingdom,
+        taxon and level of each taxonID in the matrix.
+    # - tsv_outfile - Optionally, the counts in the tab-delimited layout written
+        by aggregate_counts.py.
+    """)
+
+    parser.add_argument(
+        '-i',
+        '--input_files_glob',
+        type=str,
+        required=True,
+        help="""
+        A glob specifying the per-sample get_LCA.py output files. Must be in
+        quotes. Files are taken in sorted order.
+        """
+    )
+    parser.add_argument(
+        '-o',
+        '--outfile',
+        type=str,
+        required=True,
+        help="""
+        Path to the output .npz matrix.
+        """
+    )
+    parser.add_argument(
+        '-m',
+        '--taxa_outfile',
+        type=str,
+        required=False,
+        default='',
+        help="""
+        Path to the output taxa table. <default: the outfile with .npz replaced
+        by _taxa.tsv>
+        """
+    )
+    parser.add_argument(
+        '-t',
+        '--tsv_outfile',
+        type=str,
+        required=False,
+        default='',
+        help="""
+        If specified, also write the counts to this path in the layout of
+        aggregate_counts.py. Note that this table is dense. <default: none>
+        """
+    )
+    parser.add_argument(
+        '-c',
+        '--count_column',
+        type=str,
+        required=False,
+        default='read_count',
+        help="""
+        Column holding the number of reads of each line, e.g. the read_count
+        column of merge_and_postprocess.py outputs. Each line counts as one
+        read in files without this column. <default: read_count>
+        """
+    )
+    parser.add_argument(
+        '-r',
+        '--origin',
+        type=str,
+        required=False,
+        default='',
+        help="""
+        Only count lines with this value in the origin column, e.g. DIAMOND,
+        for merge_and_postprocess.py outputs that hold the assignments of
+        several classifiers. <default: count every line>
+        """
+    )
+    parser.add_argument(
+        '-p',
+        '--threads',
+        type=int,
+        required=False,
+        default=1,
+        help="""
+        Number of samples to read and count in parallel. <default: 1>
+        """
+    )
+    parser.add_argument(
+        '-l',
+        '--log_file',
+        type=str,
+        required=False,
+        default='',
+        help="""
+        Path to the log file.
+        """
+    )
+
+    args = parser.parse_args()
+
+    input_files_glob = args.input_files_glob
+    outfile = args.outfile
+    taxa_outfile = args.taxa_outfile
+    tsv_outfile = args.tsv_outfile
+    count_column = args.count_column
+    origin = args.origin
+    threads = args.threads
+    log_file = args.log_file
+
+    if taxa_outfile == '':
+        taxa_outfile = (outfile[:-len(".npz")] if outfile.endswith(".npz") else outfile) + "_taxa.tsv"
+
+    #Main
+    write_to_log(log_file, "build_counts_matrix.py: Starting.")
+
+    infiles = sorted(glob(input_files_glob))
+    if len(infiles) == 0:
+        raise ValueError(
+        """
+        Failed to find input files. Check that the glob is correct and
+        is in quotes.
+        """
+        )
+    samples = [get_sample_name(infile) for infile in infiles]
+    if len(set(samples)) != len(samples):
+        raise ValueError("Some input files have the same sample name.")
+
+    columns = count_samples(infiles, count_column, origin, threads)
+    counts_matrix = CountsMatrix.from_columns(samples, columns)
+    counts_matrix.save(outfile)
+    write_to_log(log_file, "build_counts_matrix.py: Wrote the counts of {0} taxa in {1} samples to {2}".format(
+        counts_matrix.shape[0], counts_matrix.shape[1], outfile))
+
+    taxa_DF = write_taxa_table(counts_matrix, taxa_outfile)
+
+    if tsv_outfile != '':
+        write_table(make_aggregated_table(counts_matrix, taxa_DF), tsv_outfile)
+
+    write_to_log(log_file, "build_counts_matrix.py: Finished.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+#------------------------------------------------------------------------------#
+# Import packages
+#------------------------------------------------------------------------------#
+import argparse
+import time
+
+from .taxonomy_index import TaxonomyIndex, DEFAULT_ETE3_SQLITE
+from .lineage_table import LineageTable, DEFAULT_LINEAGE_TABLE
+
+#------------------------------------------------------------------------------#
+# Main
+#------------------------------------------------------------------------------#
+def main():
+
+    #--------------------------------------------------------------------------#
+    # Take inputs
+    #--------------------------------------------------------------------------#
+    parser = argparse.ArgumentParser(description="""
+    Builds the cannonical lineage table used by get_LCA.py, get_counts.py and
+    merge_and_postprocess.py. For every taxonID it stores the taxonIDs of its
+    superkingdom, kingdom, phylum, class, order, family, genus, species and
+    strain along with their prefixed names.
+
+    The scripts build the table themselves the first time they run against a
+    taxonomy, so running this is optional. It is useful to build the table once
+    before launching many jobs in parallel.
+    """)
+    parser.add_argument(
+        '-d',
+        '--taxonomy_database',
+        type=str,
+        required=False,
+        default=DEFAULT_ETE3_SQLITE,
+        help='''
+        Path to the ETE3 taxa.sqlite database. <default: {0}>
+        '''.format(DEFAULT_ETE3_SQLITE)
+    )
+    parser.add_argument(
+        '-o',
+        '--outfile',
+        type=str,
+        required=False,
+        default=DEFAULT_LINEAGE_TABLE,
+        help='''
+        Path to the output .npz file. The other scripts only look for the table
+        at the default location. <default: {0}>
+        '''.format(DEFAULT_LINEAGE_TABLE)
+    )
+    args = parser.parse_args()
+
+    taxonomy_database = args.taxonomy_database
+    outfile = args.outfile
+
+    #--------------------------------------------------------------------------#
+    # Main
+    #--------------------------------------------------------------------------#
+    print("Starting. Reading the taxonomy from " + taxonomy_database)
+    start_time = time.time()
+    taxonomy = TaxonomyIndex.load(taxonomy_database)
+
+    print("Building the lineage table.")
+    table = LineageTable.build(taxonomy)
+    table.save(outfile)
+
+    print("Wrote the lineages of {0} taxonIDs to {1} in {2:.1f} seconds.".format(
+        len(table.taxonIDs), outfile, time.time() - start_time))
+
+if __name__ == '__main__':
+    main()
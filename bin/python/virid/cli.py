@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+The virid command, which runs the scripts of bin/python as subcommands:
+
+    virid get_LCA -i hits.tsv -o hits_LCA.tsv
+    virid counts add -s cohort_store -i "output/*_LCA.tsv"
+
+Each subcommand only imports its own module, when it is run, so listing the
+subcommands or running one that doesn't need pandas, pysam or the taxonomy
+doesn't load them. The arguments after the subcommand are those of the script.
+
+The scripts in bin/python are shims that call shim(), so they can still be run
+by path and imported by their old names.
+"""
+
+import importlib
+import sys
+
+# Subcommand: (module, summary)
+COMMANDS = [
+    ("get_LCA", ("get_LCA", "Find the LCA of the hits of each query of a BLAST or DIAMOND output.")),
+    ("get_counts", ("get_counts", "Count the reads assigned to each taxon.")),
+    ("merge_and_postprocess", ("merge_and_postprocess", "Merge and annotate the assignments of several classifiers.")),
+    ("aggregate_counts", ("aggregate_counts", "Aggregate per-sample count tables.")),
+    ("build_counts_matrix", ("build_counts_matrix", "Count many samples into a sparse counts matrix.")),
+    ("counts", ("virid_counts", "Maintain an append-only counts store.")),
+    ("normalize_counts", ("normalize_counts", "Normalize count tables and matrices.")),
+    ("heatmap_from_count_table", ("heatmap_from_count_table", "Draw heatmaps of an aggregated count table.")),
+    ("taxdb", ("virid_taxdb", "Build and inspect taxonomy snapshots.")),
+    ("build_lineage_table", ("build_lineage_table", "Build the cannonical lineage table.")),
+    ("process_read_pairs", ("process_read_pairs", "Split a fastq into paired and unpaired reads.")),
+    ("shard_fasta", ("shard_fasta", "Split a query fasta into shards balanced by residues.")),
+    ("extract_unassigned_reads", ("extract_unassigned_reads", "Extract the reads of unassigned contigs from the mapped bam.")),
+    ("concatenate_and_label_sequences", ("concatenate_and_label_sequences", "Label the reads of several files by sample and concatenate them.")),
+    ("deconcatenate_lines_by_ID", ("deconcatenate_lines_by_ID", "Split labelled lines back into per-sample files.")),
+    ("reverse_subseq", ("reverse_subseq", "Extract the sequences whose IDs are not in a list.")),
+    ("get_enriched_kmers", ("get_enriched_kmers", "Find kmers enriched in experimental samples."))
+]
+
+def import_command(module_name):
+    return importlib.import_module("virid." + module_name)
+
+def shim(name, module_name):
+    """
+    Called by the scripts of bin/python. Runs the main() of module_name when
+    the script is run, or makes importing the script import the module.
+    """
+    module = import_command(module_name)
+    if name == "__main__":
+        module.main()
+    else:
+        sys.modules[name] = module
+
+def print_commands():
+    print("usage: virid <command> [arguments]\n")
+    print("Run virid <command> -h for the arguments of a command.\n")
+    print("commands:")
+    width = max(len(command) for command, details in COMMANDS)
+    for command, (module_name, summary) in COMMANDS:
+        print("  " + command.ljust(width) + "  " + summary)
+
+def main(argv=None):
+    if argv == None:
+        argv = sys.argv[1:]
+
+    if len(argv) == 0 or argv[0] in ["-h", "--help"]:
+        print_commands()
+        sys.exit(0 if len(argv) > 0 else 1)
+
+    commands = dict(COMMANDS)
+    command = argv[0]
+    if not command in commands:
+        print_commands()
+        sys.exit("\nvirid: unknown command " + command)
+
+    # The command's own parser reads sys.argv
+    sys.argv = ["virid " + command] + argv[1:]
+    import_command(commands[command][0]).main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Transparent reading and writing of gzip, bgzip and zstd compressed files,
+shared by the bin/python scripts.
+
+open_input() detects the compression of a file from its magic bytes rather
+than its name, so compressed and plain inputs can be mixed freely.
+open_output() picks the compression from the file name - .gz for gzip, .bgz
+for bgzip and .zst for zstd - and writes anything else uncompressed.
+
+Where a multi-threaded (de)compressor is on the PATH (pigz, bgzip and zstd),
+the data is piped through it, so (de)compression runs in parallel with the
+script. Otherwise the gzip module, Biopython's BGZF writer or the zstandard
+module are used. The number of compression threads defaults to the
+VIRID_COMPRESSION_THREADS environment variable, or 1.
+"""
+
+import io
+import os
+import gzip
+import shutil
+import subprocess
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+COMPRESSION_SUFFIXES = {
+    ".gz": "gzip",
+    ".bgz": "bgzip",
+    ".zst": "zstd"
+}
+
+# File name suffix of each compression
+COMPRESSION_EXTENSIONS = {compression: suffix for suffix, compression in COMPRESSION_SUFFIXES.items()}
+COMPRESSION_EXTENSIONS[""] = ""
+
+THREADS_ENV_VAR = "VIRID_COMPRESSION_THREADS"
+
+#------------------------------------------------------------------------------#
+# Detection
+#------------------------------------------------------------------------------#
+def detect_compression(path):
+    """
+    Returns 'gzip', 'zstd' or '' for an uncompressed file, from the first
+    bytes of the file. bgzip files are gzip files as far as reading goes.
+    """
+    with open(path, "rb") as infile_handle:
+        magic = infile_handle.read(4)
+    if magic.startswith(GZIP_MAGIC):
+        return "gzip"
+    if magic == ZSTD_MAGIC:
+        return "zstd"
+    return ""
+
+def compression_from_name(path):
+    """ Returns the compression implied by the suffix of path, or ''. """
+    for suffix, compression in COMPRESSION_SUFFIXES.items():
+        if path.endswith(suffix):
+            return compression
+    return ""
+
+def strip_compression_suffix(path):
+    """ Removes a .gz, .bgz or .zst suffix from path. """
+    compression = compression_from_name(path)
+    if compression == "":
+        return path
+    return path[:path.rindex(".")]
+
+def text_mode(mode):
+    """ Makes the text mode explicit, as gzip.open() defaults to binary. """
+    if not "b" in mode and not "t" in mode:
+        return mode + "t"
+    return mode
+
+def default_threads():
+    try:
+        return max(int(os.environ.get(THREADS_ENV_VAR, "1")), 1)
+    except ValueError:
+        raise ValueError(THREADS_ENV_VAR + " must be an integer.")
+
+#------------------------------------------------------------------------------#
+# Pipes to external (de)compressors
+#------------------------------------------------------------------------------#
+class PipeFile(object):
+    """
+    File object that reads the output of a decompression process, or writes
+    to the input of a compression process. close() waits for the process and
+    raises OSError if it failed.
+    """
+
+    def __init__(self, command, path, mode):
+        self.command = command
+        self.path = path
+        self.raw = None
+        if mode[0] == "r":
+            self.process = subprocess.Popen(command + [path], stdout=subprocess.PIPE)
+            handle = self.process.stdout
+        else:
+            self.raw = open(path, mode[0] + "b")
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=self.raw)
+            handle = self.process.stdin
+        self.reading = mode[0] == "r"
+        if "b" in mode:
+            self.handle = handle
+        else:
+            self.handle = io.TextIOWrapper(handle, encoding="utf-8")
+
+    def close(self):
+        if self.handle.closed:
+            return
+        self.handle.close()
+        returncode = self.process.wait()
+        if self.raw != None:
+            self.raw.close()
+
+        # A reader closed before the end of the file stops the process with
+        # SIGPIPE, which isn't an error.
+        if returncode != 0 and not (self.reading and returncode == -13):
+            raise OSError(" ".join(self.command) + " failed on " + self.path +
+                          " with exit code " + str(returncode))
+
+    def __getattr__(self, name):
+        return getattr(self.handle, name)
+
+    def __iter__(self):
+        return iter(self.handle)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class TextWriter(object):
+    """
+    Minimal text-mode wrapper for binary writers that io.TextIOWrapper doesn't
+    accept, such as Biopython's BgzfWriter.
+    """
+
+    def __init__(self, handle):
+        self.handle = handle
+
+    def write(self, text):
+        self.handle.write(text.encode("utf-8"))
+        return len(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+    def __getattr__(self, name):
+        return getattr(self.handle, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.handle.close()
+
+#------------------------------------------------------------------------------#
+# Opening files
+#------------------------------------------------------------------------------#
+def open_input(path, mode="rt", buffering=-1):
+    """
+    Opens path for reading in mode 'rt' or 'rb', decompressing it if it is
+    gzip, bgzip or zstd compressed. buffering is passed to open() for
+    uncompressed inputs.
+    """
+    compression = detect_compression(path)
+    if compression == "":
+        return open(path, mode, buffering=buffering)
+    mode = text_mode(mode)
+
+    if compression == "gzip":
+        if shutil.which("pigz") != None:
+            return PipeFile(["pigz", "-dc"], path, mode)
+        return gzip.open(path, mode)
+
+    if shutil.which("zstd") != None:
+        return PipeFile(["zstd", "-dcq"], path, mode)
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError(path + " is zstd compressed, but neither the zstd command nor " +
+                         "the zstandard python module is available.")
+    handle = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"))
+    if "b" in mode:
+        return handle
+    return io.TextIOWrapper(handle, encoding="utf-8")
+
+def open_output(path, mode="wt", threads=None, compression=None, buffering=-1):
+    """
+    Opens path for writing (mode 'wt' or 'wb') or appending ('at' or 'ab').
+    The output is compressed according to the name of path unless compression
+    is given ('gzip', 'bgzip', 'zstd' or '' for none), using threads
+    compression threads. Appending to a compressed file adds a new member or
+    frame to it, which all readers handle. buffering is passed to open() for
+    uncompressed outputs.
+    """
+    if compression == None:
+        compression = compression_from_name(path)
+    if compression == "":
+        return open(path, mode, buffering=buffering)
+    mode = text_mode(mode)
+    if threads == None:
+        threads = default_threads()
+
+    if compression == "gzip":
+        if shutil.which("pigz") != None:
+            return PipeFile(["pigz", "-c", "-p", str(threads)], path, mode)
+        return gzip.open(path, mode, compresslevel=6)
+
+    if compression == "bgzip":
+        if shutil.which("bgzip") != None:
+            return PipeFile(["bgzip", "-c", "-@", str(threads)], path, mode)
+        from Bio import bgzf
+        handle = bgzf.BgzfWriter(path, mode[0] + "b")
+        if "b" in mode:
+            return handle
+        return TextWriter(handle)
+
+    if compression == "zstd":
+        if shutil.which("zstd") != None:
+            return PipeFile(["zstd", "-cq", "-T" + str(threads)], path, mode)
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("Writing " + path + " needs the zstd command or the " +
+                             "zstandard python module.")
+        handle = zstandard.ZstdCompressor(threads=threads).stream_writer(open(path, mode[0] + "b"))
+        if "b" in mode:
+            return handle
+        return TextWriter(handle)
+
+    raise ValueError("Unknown compression " + str(compression) +
+                     ". Options are gzip, bgzip, zstd or ''.")
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Sparse taxa x samples matrix of read counts, built by build_counts_matrix.py.
+
+Rows are keyed by integer taxonID rather than by lineage string, and only the
+nonzero counts are stored, column by column (compressed sparse column, CSC):
+
+    taxonIDs - taxonID of each row, in the order the taxa were first seen
+    samples  - name of each column
+    data     - the nonzero counts, sample after sample
+    indices  - the row of each count in data
+    indptr   - the counts of sample i are data[indptr[i]:indptr[i + 1]]
+
+The matrix is saved as a compressed .npz file with the same layout as
+scipy.sparse.save_npz, so scipy.sparse.load_npz() reads it directly. The
+lineage, superkingdom, taxon and level of each taxonID are not stored in the
+matrix, as they come from the taxonomy - build_counts_matrix.py writes them
+to a separate table.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+# Bump when the layout of the saved matrix changes
+COUNTS_MATRIX_VERSION = 1
+
+class CountsMatrix(object):
+
+    def __init__(self, taxonIDs, samples, data, indices, indptr):
+        self.taxonIDs = np.asarray(taxonIDs, dtype=np.int64)
+        self.samples = [str(sample) for sample in samples]
+        self.data = np.asarray(data)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.shape = (len(self.taxonIDs), len(self.samples))
+
+        if len(self.indptr) != len(self.samples) + 1:
+            raise ValueError("indptr must have one more entry than there are samples.")
+        if len(set(self.samples)) != len(self.samples):
+            raise ValueError("The sample names of a counts matrix must be unique.")
+
+    #--------------------------------------------------------------------------#
+    # Construction
+    #--------------------------------------------------------------------------#
+    @classmethod
+    def from_columns(cls, samples, columns, taxonIDs=None):
+        """
+        Builds a matrix from the counts of each sample. columns is a list with,
+        for each sample, a (taxonIDs, counts) tuple of arrays. Rows are ordered
+        by the first sample each taxonID appears in, and by its order within
+        that sample, unless the row taxonIDs are given.
+        """
+        if len(samples) != len(columns):
+            raise ValueError("There must be one column of counts per sample.")
+
+        if taxonIDs is None:
+            taxonIDs = np.zeros(0, dtype=np.int64)
+            if len(columns) > 0:
+                all_taxonIDs = np.concatenate([np.asarray(column_taxonIDs, dtype=np.int64)
+                                               for column_taxonIDs, counts in columns])
+                unique_taxonIDs, first = np.unique(all_taxonIDs, return_index=True)
+                taxonIDs = all_taxonIDs[np.sort(first)]
+        taxonIDs = np.asarray(taxonIDs, dtype=np.int64)
+
+        # Row of each taxonID
+        order = np.argsort(taxonIDs, kind="mergesort")
+        sorted_taxonIDs = taxonIDs[order]
+
+        data = []
+        indices = []
+        indptr = np.zeros(len(columns) + 1, dtype=np.int64)
+        for i, (column_taxonIDs, counts) in enumerate(columns):
+            column_taxonIDs = np.asarray(column_taxonIDs, dtype=np.int64)
+            counts = np.asarray(counts)
+            positions = np.searchsorted(sorted_taxonIDs, column_taxonIDs)
+            positions = np.minimum(positions, max(len(sorted_taxonIDs) - 1, 0))
+            if len(column_taxonIDs) > 0 and \
+                    (len(sorted_taxonIDs) == 0 or
+                     (sorted_taxonIDs[positions] != column_taxonIDs).any()):
+                raise ValueError("Sample " + str(samples[i]) + " has taxonIDs " +
+                                 "that aren't rows of the matrix.")
+            rows = order[positions]
+
+            # Keep the nonzero counts, in row order
+            nonzero = counts != 0
+            rows = rows[nonzero]
+            counts = counts[nonzero]
+            row_order = np.argsort(rows, kind="mergesort")
+            indices.append(rows[row_order])
+            data.append(counts[row_order])
+            indptr[i + 1] = indptr[i] + len(rows)
+
+        if len(data) > 0:
+            data = np.concatenate(data)
+            indices = np.concatenate(indices)
+        else:
+            data = np.zeros(0, dtype=np.int64)
+            indices = np.zeros(0, dtype=np.int64)
+        return cls(taxonIDs, samples, data, indices, indptr)
+
+    #--------------------------------------------------------------------------#
+    # Saving and loading
+    #--------------------------------------------------------------------------#
+    def save(self, path):
+        """ Writes the matrix to a compressed .npz file. """
+        directory = os.path.dirname(path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+
+        # np.savez appends .npz to names that don't end in it
+        temporary_path = path + "." + str(os.getpid()) + ".tmp.npz"
+        np.savez_compressed(temporary_path,
+                            format=np.array(b"csc"),
+                            shape=np.array(self.shape, dtype=np.int64),
+                            data=self.data,
+                            indices=self.indices,
+                            indptr=self.indptr,
+                            taxonIDs=self.taxonIDs,
+                            samples=np.array(self.samples, dtype=str),
+                            version=np.array(COUNTS_MATRIX_VERSION))
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if not 'version' in data.files or int(data['version']) != COUNTS_MATRIX_VERSION:
+                raise ValueError("The counts matrix " + path + " was made by a " +
+                                 "different version of virID.")
+            return cls(data['taxonIDs'], data['samples'].tolist(), data['data'],
+                       data['indices'], data['indptr'])
+
+    #--------------------------------------------------------------------------#
+    # Access
+    #--------------------------------------------------------------------------#
+    def get_column(self, sample):
+        """ Returns the (taxonIDs, counts) of the nonzero counts of a sample. """
+        i = self.samples.index(sample)
+        start = self.indptr[i]
+        end = self.indptr[i + 1]
+        return self.taxonIDs[self.indices[start:end]], self.data[start:end]
+
+    def subset(self, samples):
+        """ Returns a matrix of the given samples, dropping rows left empty. """
+        columns = [self.get_column(sample) for sample in samples]
+        taxonIDs = None
+        if len(columns) > 0:
+            present = np.zeros(len(self.taxonIDs), dtype=bool)
+            for i in [self.samples.index(sample) for sample in samples]:
+                present[self.indices[self.indptr[i]:self.indptr[i + 1]]] = True
+            taxonIDs = self.taxonIDs[present]
+        return CountsMatrix.from_columns(list(samples), columns, taxonIDs)
+
+    def to_dense(self, dtype=None):
+        """ Returns the counts as a dense (taxa, samples) array. """
+        if dtype == None:
+            dtype = self.data.dtype
+        dense = np.zeros(self.shape, dtype=dtype)
+        columns = np.repeat(np.arange(len(self.samples)), np.diff(self.indptr))
+        dense[self.indices, columns] = self.data
+        return dense
+
+    def to_dataframe(self, dtype=None):
+        """ Returns the counts as a dense dataframe indexed by taxonID. """
+        return pd.DataFrame(self.to_dense(dtype), columns=self.samples,
+                            index=pd.Index(self.taxonIDs, name="taxonID"))
+
+    def to_scipy(self):
+        """ Returns the counts as a scipy.sparse.csc_matrix. """
+        from scipy import sparse
+        return sparse.csc_matrix((self.data, self.indices, self.indptr), shape=self.shape)
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Persistent, append-only store of the counts of many samples, managed with
+virid_counts.py.
+
+A store is a directory holding:
+
+    manifest.json - the samples in the store, in the order they were added,
+                    with the chunk file of each
+    taxonIDs.bin  - the taxonID dictionary, the int64 taxonID of each row in
+                    the order the taxa were first added
+    chunks/       - one .npz file per sample with the rows and counts of its
+                    nonzero counts
+
+Adding a sample writes its chunk, appends the taxonIDs not yet in the
+dictionary and rewrites the manifest, so the cost is proportional to the new
+sample, not to the store. Replacing or removing a sample only touches its own
+chunk. The manifest records how many taxonIDs of the dictionary are in use and
+is replaced atomically last, so a store interrupted while being updated still
+reads as it was before the update. Writers hold a lock on the store, so
+concurrent updates are applied one after the other.
+
+materialize() reads the chunks of all or some samples into a CountsMatrix,
+with rows in dictionary order and without taxa that none of the samples have.
+"""
+
+import os
+import json
+import time
+import fcntl
+import numpy as np
+
+from .counts_matrix import CountsMatrix
+
+# Bump when the layout of the store changes
+COUNTS_STORE_VERSION = 1
+
+STORE_MANIFEST = "manifest.json"
+STORE_TAXONIDS = "taxonIDs.bin"
+STORE_CHUNKS = "chunks"
+STORE_LOCK = ".lock"
+
+class CountsStore(object):
+
+    def __init__(self, path, manifest=None):
+        self.path = os.path.abspath(path)
+        if manifest == None:
+            manifest = self.read_manifest()
+        self.manifest = manifest
+
+    #--------------------------------------------------------------------------#
+    # Files
+    #--------------------------------------------------------------------------#
+    @classmethod
+    def create(cls, path):
+        """ Creates an empty store at path, or opens the store already there. """
+        os.makedirs(os.path.join(path, STORE_CHUNKS), exist_ok=True)
+        if os.path.exists(os.path.join(path, STORE_MANIFEST)):
+            return cls(path)
+
+        open(os.path.join(path, STORE_TAXONIDS), "ab").close()
+        store = cls(path, {
+            "version": COUNTS_STORE_VERSION,
+            "created": time.strftime("%c"),
+            "n_taxonIDs": 0,
+            "next_chunk": 0,
+            "samples": []
+        })
+        store.write_manifest()
+        return store
+
+    def read_manifest(self):
+        manifest_path = os.path.join(self.path, STORE_MANIFEST)
+        if not os.path.exists(manifest_path):
+            raise ValueError("Did not find a counts store at " + self.path)
+        with open(manifest_path) as infile:
+            manifest = json.load(infile)
+        if manifest.get("version") != COUNTS_STORE_VERSION:
+            raise ValueError("The counts store " + self.path + " was made by a " +
+                             "different version of virID.")
+        return manifest
+
+    def write_manifest(self):
+        """ Replaces the manifest, so readers see either the old or new one. """
+        self.manifest["updated"] = time.strftime("%c")
+        manifest_path = os.path.join(self.path, STORE_MANIFEST)
+        temporary_path = manifest_path + "." + str(os.getpid()) + ".tmp"
+        with open(temporary_path, "w") as outfile:
+            json.dump(self.manifest, outfile, indent=2)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+        os.replace(temporary_path, manifest_path)
+
+    def lock(self):
+        """
+        Takes the writer lock of the store, waiting for other writers, and
+        re-reads the manifest. Returns the lock file, which unlocks when closed.
+        """
+        lock_file = open(os.path.join(self.path, STORE_LOCK), "a")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        self.manifest = self.read_manifest()
+        return lock_file
+
+    def chunk_path(self, chunk):
+        return os.path.join(self.path, STORE_CHUNKS, chunk)
+
+    #--------------------------------------------------------------------------#
+    # Taxon dictionary
+    #--------------------------------------------------------------------------#
+    def read_taxonIDs(self):
+        """ Returns the taxonIDs of the dictionary that are in use. """
+        n_taxonIDs = self.manifest["n_taxonIDs"]
+        if n_taxonIDs == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.fromfile(os.path.join(self.path, STORE_TAXONIDS), dtype=np.int64,
+                           count=n_taxonIDs)
+
+    def add_taxonIDs(self, taxonIDs):
+        """
+        Returns the dictionary row of each of taxonIDs, appending those that
+        aren't in the dictionary yet, in order of first appearance.
+        """
+        known = self.read_taxonIDs()
+        taxonIDs = np.asarray(taxonIDs, dtype=np.int64)
+
+        order = np.argsort(known, kind="mergesort")
+        positions = np.minimum(np.searchsorted(known[order], taxonIDs), max(len(known) - 1, 0))
+        found = np.zeros(len(taxonIDs), dtype=bool)
+        if len(known) > 0:
+            found = known[order][positions] == taxonIDs
+
+        # New taxonIDs, in order of first appearance
+        new_taxonIDs, first = np.unique(taxonIDs[~found], return_index=True)
+        new_taxonIDs = taxonIDs[~found][np.sort(first)]
+
+        rows = np.zeros(len(taxonIDs), dtype=np.int64)
+        rows[found] = order[positions[found]]
+        if len(new_taxonIDs) > 0:
+            new_order = np.argsort(new_taxonIDs, kind="mergesort")
+            new_positions = np.searchsorted(new_taxonIDs[new_order], taxonIDs[~found])
+            rows[~found] = len(known) + new_order[new_positions]
+
+            # Overwrite anything past the rows in use, left by an interrupted update
+            with open(os.path.join(self.path, STORE_TAXONIDS), "r+b") as outfile:
+                outfile.seek(len(known) * 8)
+                outfile.write(new_taxonIDs.astype(np.int64).tobytes())
+                outfile.truncate()
+                outfile.flush()
+                os.fsync(outfile.fileno())
+            self.manifest["n_taxonIDs"] = len(known) + len(new_taxonIDs)
+        return rows
+
+    #--------------------------------------------------------------------------#
+    # Samples
+    #--------------------------------------------------------------------------#
+    @property
+    def samples(self):
+        return [entry["sample"] for entry in self.manifest["samples"]]
+
+    def get_entry(self, sample):
+        for entry in self.manifest["samples"]:
+            if entry["sample"] == sample:
+                return entry
+        raise ValueError("The sample " + sample + " is not in the counts store " + self.path)
+
+    def add_samples(self, samples, columns, replace=False):
+        """
+        Adds the counts of samples to the store. columns holds the (taxonIDs,
+        counts) arrays of each sample. Samples already in the store are
+        replaced, keeping their position, if replace is True, and otherwise
+        raise a ValueError.
+        """
+        if len(samples) != len(columns):
+            raise ValueError("There must be one column of counts per sample.")
+        if len(set(samples)) != len(samples):
+            raise ValueError("Some samples to add have the same name.")
+
+        lock_file = self.lock()
+        try:
+            existing = set(self.samples)
+            if not replace and len(existing & set(samples)) > 0:
+                raise ValueError("The samples " + ", ".join(sorted(existing & set(samples))) +
+                                 " are already in the counts store. Use replace to " +
+                                 "replace them.")
+
+            replaced_chunks = []
+            for sample, (taxonIDs, counts) in zip(samples, columns):
+                counts = np.asarray(counts)
+                nonzero = counts != 0
+                rows = self.add_taxonIDs(np.asarray(taxonIDs, dtype=np.int64)[nonzero])
+
+                chunk = "chunk_{0}.npz".format(self.manifest["next_chunk"])
+                self.manifest["next_chunk"] += 1
+                np.savez(self.chunk_path(chunk), rows=rows, counts=counts[nonzero])
+
+                entry = {"sample": sample, "chunk": chunk, "n_taxa": int(nonzero.sum()),
+                         "added": time.strftime("%c")}
+                if sample in existing:
+                    old_entry = self.get_entry(sample)
+                    replaced_chunks.append(old_entry["chunk"])
+                    old_entry.update(entry)
+                else:
+                    self.manifest["samples"].append(entry)
+
+            self.write_manifest()
+            for chunk in replaced_chunks:
+                os.remove(self.chunk_path(chunk))
+        finally:
+            lock_file.close()
+
+    def remove_samples(self, samples):
+        """ Removes samples from the store. Their taxonIDs stay in the dictionary. """
+        lock_file = self.lock()
+        try:
+            entries = [self.get_entry(sample) for sample in samples]
+            self.manifest["samples"] = [entry for entry in self.manifest["samples"]
+                                        if not entry["sample"] in set(samples)]
+            self.write_manifest()
+            for entry in entries:
+                os.remove(self.chunk_path(entry["chunk"]))
+        finally:
+            lock_file.close()
+
+    #--------------------------------------------------------------------------#
+    # Reading
+    #--------------------------------------------------------------------------#
+    def read_chunk(self, sample):
+        """ Returns the (rows, counts) arrays of a sample. """
+        with np.load(self.chunk_path(self.get_entry(sample)["chunk"])) as data:
+            return data["rows"], data["counts"]
+
+    def materialize(self, samples=None):
+        """
+        Returns a CountsMatrix of samples, all samples if None, in the given
+        order. Only the chunks of those samples are read.
+        """
+        if samples == None:
+            samples = self.samples
+        chunks = [self.read_chunk(sample) for sample in samples]
+        taxonIDs = self.read_taxonIDs()
+
+        # Keep the rows of the dictionary that the samples have counts for
+        present = np.zeros(len(taxonIDs), dtype=bool)
+        for rows, counts in chunks:
+            present[rows] = True
+        new_row = np.cumsum(present) - 1
+
+        data = []
+        indices = []
+        indptr = np.zeros(len(chunks) + 1, dtype=np.int64)
+        for i, (rows, counts) in enumerate(chunks):
+            order = np.argsort(rows, kind="mergesort")
+            indices.append(new_row[rows[order]])
+            data.append(counts[order])
+            indptr[i + 1] = indptr[i] + len(rows)
+
+        if len(chunks) > 0:
+            data = np.concatenate(data)
+            indices = np.concatenate(indices)
+        else:
+            data = np.zeros(0, dtype=np.int64)
+            indices = np.zeros(0, dtype=np.int64)
+        return CountsMatrix(taxonIDs[present], samples, data, indices, indptr)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import shutil
+import pathlib
+from collections import OrderedDict
+from .compressed_io import open_output, compression_from_name
+
+# Default number of output files kept open at once
+MAX_OPEN_FILES = 256
+
+# Write buffer of each open output file
+OUTPUT_BUFFER_SIZE = 128 * 1024
+
+# Buffer for copying a staged output file into its compressor
+COMPRESSION_BUFFER_SIZE = 1024 * 1024
+
+def usage():
+    print("""
+        The purpose of this function is to read in a tab-delimited stdin,
+        isolate the first column, and isolate the sample ID, where
+        the first column is <sampleID>__<...some other string...>. It then
+        writes each line to a file determined by the sampleID.
+
+        If none of the samples have a sampleID, all sequences are just printed
+        to the specified outfile. Please note that if the outfiles exist already
+        they will be appended to.
+
+        Usage:
+        cat input.txt | deconcatenate_lines_by_ID.py <directory> <out_name> [max_open_files]
+
+        Where,
+            <directory> Is path to output directory, with or without suffix '/'
+            <out_name> Is the default output file name. If there are no
+                       sampleID's, output will be <directory>/<out_name>. If
+                       there are sampleID's, output will be
+                      <directory>/<sampleID>_<out_name>. Outputs are
+                       compressed if <out_name> ends in .gz, .bgz or .zst.
+                       Compressed outputs are written uncompressed alongside
+                       and compressed once all lines are read.
+            [max_open_files] Is the number of output files kept open at once,
+                       default 256. Lines are written as they are read, and
+                       the least recently written file is closed (to be
+                       reopened in append mode) when more are needed. With
+                       more samples than this in interleaved input, raising
+                       it (within the open file limit, ulimit -n) avoids
+                       reopening files.
+    """)
+
+    sys.exit()
+
+def remove_sampleID(line):
+
+    #remove the ID, which is separated by "__", from the first column
+    return line.partition("__")[2]
+
+class OutputFilePool(object):
+    """
+    Append-mode output files, of which at most max_open are open at once. The
+    least recently written file is closed to make room for another, and
+    reopened in append mode if it is written to again.
+
+    Outputs named to be compressed are written to an uncompressed staging
+    file instead, which close() compresses onto the output in one pass. That
+    way the pool never holds a compressor process per file, and reopening a
+    file doesn't start a new compressor or add a compressed member.
+    """
+
+    def __init__(self, max_open=MAX_OPEN_FILES):
+        if max_open < 1:
+            raise ValueError("max_open_files must be at least 1.")
+        self.max_open = max_open
+        self.handles = OrderedDict()
+
+        # Output path: staging path, for compressed outputs
+        self.staged = OrderedDict()
+
+    def staging_path(self, path):
+        if compression_from_name(path) == "":
+            return path
+        staging_path = self.staged.get(path)
+        if staging_path == None:
+            staging_path = path + "." + str(os.getpid()) + ".tmp"
+            self.staged[path] = staging_path
+        return staging_path
+
+    def get(self, path):
+        handle = self.handles.get(path)
+        if handle != None:
+            self.handles.move_to_end(path)
+            return handle
+
+        if len(self.handles) >= self.max_open:
+            oldest_path, oldest_handle = self.handles.popitem(last=False)
+            oldest_handle.close()
+        handle = open(self.staging_path(path), 'a', buffering=OUTPUT_BUFFER_SIZE)
+        self.handles[path] = handle
+        return handle
+
+    def write(self, path, line):
+        self.get(path).write(line)
+
+    def close(self):
+        while len(self.handles) > 0:
+            path, handle = self.handles.popitem(last=False)
+            handle.close()
+
+        # Compress the staged outputs, appending to any existing output
+        while len(self.staged) > 0:
+            path, staging_path = self.staged.popitem(last=False)
+            with open(staging_path, 'rb') as staging_handle, open_output(path, 'ab') as outfile_handle:
+                shutil.copyfileobj(staging_handle, outfile_handle, COMPRESSION_BUFFER_SIZE)
+            os.remove(staging_path)
+
+def main():
+
+    print('Starting.')
+
+    #Check that all args are there
+    if not len(sys.argv) in [3, 4]:
+        usage()
+
+    #Label the args
+    directory = sys.argv[1]
+    if not directory.endswith("/"):
+        directory = directory + "/"
+    out_name = sys.argv[2]
+    max_open_files = MAX_OPEN_FILES
+    if len(sys.argv) == 4:
+        max_open_files = int(sys.argv[3])
+
+    #Make directory if necessary
+    pathlib.Path(directory).mkdir(parents=True, exist_ok=True)
+
+    #Determine if there are sampleID's.
+    ID_status = ''
+
+    #Output path of each sampleID, and the open output files
+    outfiles = dict()
+    output_files = OutputFilePool(max_open_files)
+
+    print('Reading in stdin, writing to files...')
+
+    try:
+        #Start reading from stdin
+        for line in sys.stdin:
+
+            #Isolate the first column, and split it by "__", which should
+            #separate sampleID
+            header = line.partition('\t')[0].split("__")
+            if len(header) >2:
+                raise ValueError("""There seems to be more than one '__' in the
+                fist column.""")
+
+            #If there is no sampleID...
+            if len(header) == 1:
+
+                #Determine if any previous lines had a sampleID
+                if ID_status == True:
+                    raise ValueError("""A previous line had a sampleID but this line
+                                        does not. Something is wrong.""")
+                ID_status = False
+
+                #Write to the output file
+                output_files.write(directory + out_name, line)
+
+            #If there is a sampleID...
+            else:
+
+                #Determine if any previous lines did not have a sampleID
+                if ID_status == False:
+                    raise ValueError("""A previous line did not have a sampleID but
+                                        this line does. Something is wrong.""")
+                ID_status = True
+
+                #Get the output file path of the sampleID
+                sampleID = header[0]
+                outfile = outfiles.get(sampleID)
+                if outfile == None:
+                    outfile = directory + sampleID + "_" + out_name
+                    outfiles[sampleID] = outfile
+
+                #Remove the sampleID from the first column and write the line
+                output_files.write(outfile, remove_sampleID(line))
+    finally:
+        output_files.close()
+
+    print('Finished.')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Bounded-memory external merge sort of tab-delimited files by their first
+column, used by get_LCA.py to group hits by query_ID when the infile isn't
+already grouped (e.g. concatenated BLAST shards or multi-sample files).
+
+Lines are read into memory until the memory budget is used up, sorted by their
+first field and spilled to a temporary file as a sorted run. The runs are then
+lazily k-way merged. Both the in-memory sort and the merge are stable, so lines
+with the same key stay in their original order, and all the lines of a key
+come out consecutively. If the whole file fits in the budget, nothing is
+written to disk.
+"""
+
+import os
+import heapq
+import shutil
+import tempfile
+
+from .compressed_io import open_input
+
+# Rough number of bytes Python uses to hold a line on top of its characters
+LINE_OVERHEAD = 100
+
+# Maximum number of runs merged at once. With more runs than this they are
+# merged in several passes, so the number of open files stays bounded.
+MAX_MERGE_FANIN = 64
+
+# Size of the read and write buffers of each run file
+RUN_BUFFER_SIZE = 256 * 1024
+
+def first_field(line):
+    """ Sort key - the text before the first tab. """
+    end = line.find("\t")
+    if end == -1:
+        return line.rstrip("\n")
+    return line[:end]
+
+def write_run(lines, temp_dir, run_number):
+    """ Writes sorted lines to a new run file in temp_dir and returns its path. """
+    path = os.path.join(temp_dir, "run_{0}.tsv".format(run_number))
+    with open(path, "w", buffering=RUN_BUFFER_SIZE) as outfile_handle:
+        outfile_handle.writelines(lines)
+    return path
+
+def read_run(path):
+    """ Yields the lines of a run file. """
+    with open(path, buffering=RUN_BUFFER_SIZE) as infile_handle:
+        for line in infile_handle:
+            yield line
+
+def make_sorted_runs(lines, temp_dir, memory_limit):
+    """
+    Takes an iterable of lines and sorts them in chunks of at most
+    memory_limit bytes. Returns (runs, last_chunk), where runs are the paths
+    of the spilled run files and last_chunk is the sorted final chunk, which
+    is kept in memory.
+    """
+    runs = []
+    chunk = []
+    chunk_size = 0
+    for line in lines:
+        if line.strip() == "":
+            continue
+        if not line.endswith("\n"):
+            line += "\n"
+        chunk.append(line)
+        chunk_size += len(line) + LINE_OVERHEAD
+        if chunk_size >= memory_limit:
+            chunk.sort(key=first_field)
+            runs.append(write_run(chunk, temp_dir, len(runs)))
+            chunk = []
+            chunk_size = 0
+
+    chunk.sort(key=first_field)
+    return runs, chunk
+
+def reduce_runs(runs, temp_dir):
+    """
+    Merges consecutive batches of runs until at most MAX_MERGE_FANIN are left.
+    Merging neighbouring runs keeps the merge stable.
+    """
+    merge_pass = 0
+    while len(runs) > MAX_MERGE_FANIN:
+        merged_runs = []
+        for i in range(0, len(runs), MAX_MERGE_FANIN):
+            batch = runs[i:i + MAX_MERGE_FANIN]
+            path = os.path.join(temp_dir, "pass_{0}_run_{1}.tsv".format(merge_pass, len(merged_runs)))
+            with open(path, "w", buffering=RUN_BUFFER_SIZE) as outfile_handle:
+                outfile_handle.writelines(heapq.merge(*[read_run(run) for run in batch],
+                                                      key=first_field))
+            for run in batch:
+                os.remove(run)
+            merged_runs.append(path)
+        runs = merged_runs
+        merge_pass += 1
+    return runs
+
+def sort_lines(lines, memory_limit, temp_dir=""):
+    """
+    Generator that yields the lines of an iterable sorted by their first
+    field, using at most about memory_limit bytes for buffered lines. Runs are
+    spilled to a temporary directory inside temp_dir (the system default if
+    temp_dir is '') that is removed once the generator finishes or is closed.
+    Blank lines are dropped and every line yielded ends in a newline.
+    """
+    if temp_dir != "":
+        os.makedirs(temp_dir, exist_ok=True)
+    run_dir = tempfile.mkdtemp(prefix="virID_sort_", dir=temp_dir or None)
+    try:
+        runs, last_chunk = make_sorted_runs(lines, run_dir, memory_limit)
+        if runs == []:
+            for line in last_chunk:
+                yield line
+            return
+
+        # The last chunk is merged from memory, as the newest run
+        runs = reduce_runs(runs, run_dir)
+        for line in heapq.merge(*[read_run(run) for run in runs], iter(last_chunk),
+                                key=first_field):
+            yield line
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+def sort_file(infile, outfile, memory_limit, temp_dir=""):
+    """
+    Writes the lines of infile, which may be compressed, to outfile sorted by
+    their first field.
+    """
+    with open_input(infile) as infile_handle, \
+         open(outfile, "w", buffering=RUN_BUFFER_SIZE) as outfile_handle:
+        outfile_handle.writelines(sort_lines(infile_handle, memory_limit, temp_dir))
@@ -0,0 +1,307 @@
+import pysam
+import argparse
+import pathlib
+import os
+from .compressed_io import open_input, open_output
+
+# Write buffer of the fastq output
+FASTQ_BUFFER_SIZE = 1 << 20
+
+def open_bamfile(bam_path, threads=1):
+    """
+    Opens a SAM or BAM file. threads extra threads decompress the BGZF blocks
+    of a BAM.
+    """
+    return pysam.AlignmentFile(bam_path, "r", threads=threads)
+
+def format_fastq_record(read):
+    return "@{}\n{}\n+\n{}\n".format(read.qname, read.seq, read.qual)
+
+def fetch_unplaced_reads(bamfile):
+    """
+    Returns an iterator over the unmapped reads without a position, which a
+    sorted BAM keeps after all other reads. Unmapped reads whose mate is
+    mapped are placed on the contig of their mate, and so are returned when
+    that contig is fetched instead.
+    """
+    if bamfile.nocoordinate == 0:
+        return iter([])
+    try:
+        # htslib's region for reads without a coordinate
+        return bamfile.fetch("*")
+    except ValueError:
+        print("pysam {} can't fetch the reads without a coordinate, so they are read from the "
+              "end of the last contig instead.".format(pysam.__version__))
+        return read_after_placed_reads(bamfile)
+
+def read_after_placed_reads(bamfile):
+    """
+    Yields the reads without a position by using the index to fetch the last
+    contig that has reads, and reading on from the end of its last read, so
+    the other placed reads are never read.
+    """
+    placed_contigs = [stats.contig for stats in bamfile.get_index_statistics()
+                      if stats.total > 0]
+
+    # The iterator shares the file handle, so the position after each read is
+    # where the next read of the file starts
+    unplaced_offset = None
+    if len(placed_contigs) > 0:
+        for read in bamfile.fetch(placed_contigs[-1]):
+            unplaced_offset = bamfile.tell()
+
+    if unplaced_offset == None:
+        bamfile.reset()
+    else:
+        bamfile.seek(unplaced_offset)
+
+    for read in bamfile.fetch(until_eof=True):
+        if read.reference_id < 0:
+            yield read
+
+def extract_reads_indexed(bamfile, unassigned_contigs, outfile_handle):
+    """
+    Uses the index of a sorted BAM to fetch only the unplaced reads and the
+    reads of unassigned_contigs, writing them to outfile_handle in fastq
+    format. Returns the number of reads in the BAM, from the index, and the
+    number of reads written.
+    """
+    written = 0
+    for read in fetch_unplaced_reads(bamfile):
+        outfile_handle.write(format_fastq_record(read))
+        written += 1
+
+    # Contigs in the order of the BAM, skipping any that weren't mapped to
+    references = set(bamfile.references)
+    for contig in sorted(unassigned_contigs & references, key=bamfile.get_tid):
+        for read in bamfile.fetch(contig):
+            outfile_handle.write(format_fastq_record(read))
+            written += 1
+
+    return bamfile.mapped + bamfile.unmapped, written
+
+def extract_reads_streaming(bamfile, unassigned_contigs, outfile_handle):
+    """
+    Reads the BAM once from start to end, writing the reads that are unmapped
+    or on unassigned_contigs to outfile_handle in fastq format. Used for files
+    without an index. Returns the number of reads in the BAM and the number of
+    reads written.
+    """
+    readcount = 0
+    written = 0
+    for read in bamfile.fetch(until_eof=True):
+
+        # Count number of reads in the bam
+        readcount += 1
+
+        reference_name = read.reference_name
+        if reference_name == None or reference_name in unassigned_contigs:
+            outfile_handle.write(format_fastq_record(read))
+            written += 1
+
+    return readcount, written
+
+def extract_unassigned_reads(bam_path, unassigned_contigs, output_path, threads=1):
+    """
+    Writes the unmapped reads of a BAM and the reads mapped to
+    unassigned_contigs to output_path in fastq format, compressed if
+    output_path ends in .gz, .bgz or .zst. Reads are streamed, so memory use
+    doesn't depend on the size of the BAM. Returns the number of reads in the
+    BAM and the number of reads written.
+    """
+    # Generate the output directory if necessary
+    out_dir = os.path.dirname(output_path)
+    pathlib.Path(out_dir).mkdir(parents=True, exist_ok=True)
+
+    bamfile = open_bamfile(bam_path, threads)
+    try:
+        with open_output(output_path, "w", threads=threads,
+                         buffering=FASTQ_BUFFER_SIZE) as outfile_handle:
+            if bamfile.is_bam and bamfile.has_index():
+                return extract_reads_indexed(bamfile, unassigned_contigs, outfile_handle)
+            print("No index found for {}. Reading the whole file.".format(bam_path))
+            return extract_reads_streaming(bamfile, unassigned_contigs, outfile_handle)
+    finally:
+        bamfile.close()
+
+def parse_contig_assignments(assignment_file_path, contig_name_col=0, unassigned_col=9):
+    """
+    Finds contig_names that are unassigned twice.
+
+    Inputs:
+    - assignment_file_path: Path to tab-delimited file
+    - contig_name_col: Index of the col which will have the contig name
+    - unassigned_col: Index of the col which will say if it is unassigned, i.e.
+        will say 'UNASSIGNED'
+
+    Output: A set of contig names where there are n unassigned lines.
+
+    """
+    traking = set()
+    unassigned = set()
+    with open_input(assignment_file_path) as infile_handle:
+
+        for line in infile_handle:
+            line = line.split("\t")
+
+            contig_name = line[contig_name_col]
+            unassigned_status = line[unassigned_col]
+
+            if unassigned_status == "UNASSIGNED":
+
+                if contig_name in traking:
+                    unassigned.add(contig_name)
+
+                else:
+                    traking.add(contig_name)
+
+    return unassigned
+
+def write_output(msg, output_path, append=False):
+    """
+    Writes the msg to the output path. Makes sure the output_path
+    directory exists and all that good stuff. The output is compressed if
+    output_path ends in .gz, .bgz or .zst.
+    """
+
+    # Generate the output directory if necessary
+    out_dir = os.path.dirname(output_path)
+    pathlib.Path(out_dir).mkdir(parents=True, exist_ok=True)
+
+    # Write output
+    if append==True:
+        with open_output(output_path, "a") as outfile_handle:
+            outfile_handle.write(msg)
+    elif append==False:
+        with open_output(output_path, "w") as outfile_handle:
+            outfile_handle.write(msg)
+
+def main():
+    #--------------------------------------------------------------------------#
+    #Take inputs
+    #--------------------------------------------------------------------------#
+    parser = argparse.ArgumentParser(description="""
+            The purpose of this script is to read in the virID merged assignment
+            file and associated virID mapped bam and 1) write out the
+            unassembled reads and the reads that are mapped to unassigned
+            contigs to a fasta, and 2) (optional) write out a tab-delimted
+            metrics file detailing the total number of reads and the number of
+            unmapped+unassigned reads.
+            """)
+
+    # Required arguments
+    parser.add_argument(
+        '-b',
+        '--bam_path',
+        type=str,
+        required=True,
+        help='''
+        Path to the virID mapped bam, which consists of reads mapped back to the
+        contigs.
+        '''
+    )
+    parser.add_argument(
+        '-a',
+        '--assignment_file_path',
+        type=str,
+        required=True,
+        help='''
+        Path to the virID MERGED output assignment file.
+        '''
+    )
+    parser.add_argument(
+        '-u',
+        '--unassigned_reads_path',
+        type=str,
+        required=True,
+        help='''
+        Desired path to the output fastq containing unmapped reads. Ending
+        it in .gz, .bgz or .zst compresses it.
+        '''
+    )
+
+    parser.add_argument(
+        '-s',
+        '--sample_name',
+        type=str,
+        required=True,
+        help='''
+        Name of the sample. Used when writing the metrics file.
+        '''
+        )
+
+    # Optional
+    parser.add_argument(
+        '-m',
+        '--metrics',
+        type=str,
+        required=False,
+        default="",
+        help='''
+        Path to the optional metrics file.
+        '''
+        )
+    parser.add_argument(
+        '-c',
+        '--unassigned_contigs_list',
+        type=str,
+        required=False,
+        default="",
+        help='''
+        Path to a list detailing the headers of unassigned contigs.
+        '''
+        )
+    parser.add_argument(
+        '-t',
+        '--threads',
+        type=int,
+        required=False,
+        default=1,
+        help='''
+        Number of extra threads used to decompress the bam and compress the
+        output. <default: 1>
+        '''
+        )
+
+
+
+    args = parser.parse_args()
+
+    # Define input variables
+    bam_path = args.bam_path
+    assignment_file_path = args.assignment_file_path
+    unassigned_reads_path = args.unassigned_reads_path
+    sample_name = args.sample_name
+    metrics = args.metrics
+    unassigned_contigs_list = args.unassigned_contigs_list
+    threads = args.threads
+
+    #--------------------------------------------------------------------------#
+    # Main
+    #--------------------------------------------------------------------------#
+    print("Starting extract_unassigned_reads.py for {}".format(sample_name))
+
+    # Get contigs which were unassigned by both megablast and diamond
+    unassigned_contigs = parse_contig_assignments(assignment_file_path)
+
+    # If specified, write out list of unassigned contigs
+    if unassigned_contigs_list != "":
+        write_output("\n".join(list(unassigned_contigs)), unassigned_contigs_list)
+
+    # Write the unmapped reads and the reads of unassigned contigs to fastq.
+    # A sorted and indexed bam (as made by map_contigs.sh) is read only where
+    # those reads are.
+    input_readcount, unmapped_readcount = extract_unassigned_reads(bam_path,
+                                                                   unassigned_contigs,
+                                                                   unassigned_reads_path,
+                                                                   threads)
+
+    # Write total # and # unmapped reads out to metrics file
+    if metrics != "":
+        metrics_output = "{}\t{}\t{}\n".format(sample_name, input_readcount, unmapped_readcount)
+        write_output(metrics_output, metrics, append=True)
+
+    print("Finished.")
+
+if __name__ == '__main__':
+    main()
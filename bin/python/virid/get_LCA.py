@@ -0,0 +1,1228 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Mar 18 12:29:53 2019
+
+@author: jnom
+"""
+
+import sys
+minimum_python_version = (3, 6, 7)
+if  sys.version_info < minimum_python_version:
+    print("""
+    This script uses a dictionary I want to be ordered, so it is recommendend
+    you use a python version of at least 3.6.7. You can proceed with a lower
+    version, but the taxonomy columns may not be in the correct order in the
+    output. To proceed anyway, remove this clause from the script.
+    """)
+    sys.exit()
+
+import argparse
+import time
+import pathlib
+import os
+from .taxonomy_index import TaxonomyIndex
+from .lazy import LazyHandle
+taxonomy = LazyHandle(TaxonomyIndex.load)
+from .lca_engine import LCAEngine, LCACache
+lca_engine = LazyHandle(lambda: LCAEngine(taxonomy.resolve()))
+from .lineage_table import LineageTable, CANNONICAL_PREFIXES
+lineage_table = LazyHandle(lambda: LineageTable.load(taxonomy.resolve()))
+from .external_sort import sort_lines, sort_file
+from .compressed_io import open_input, open_output, detect_compression, compression_from_name
+import numpy as np
+from collections import Counter
+import itertools
+import multiprocessing
+import shutil
+import tempfile
+
+#------------------------------------------------------------------------------#
+# Constants
+#------------------------------------------------------------------------------#
+# Size of the write buffer used when streaming output lines to the outfile
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+
+# Number of query_ID groups whose LCAs are looked up together when streaming
+LCA_BLOCK_SIZE = 4096
+
+# Number of infile shards made per worker process with --threads
+SHARDS_PER_THREAD = 4
+
+# Smallest number of query_IDs SeenQueryIDs holds in a set before moving them
+# to its sorted array
+SEEN_QUERY_IDS_SET_SIZE = 1024 * 1024
+
+#------------------------------------------------------------------------------#
+# Functions
+#------------------------------------------------------------------------------#
+ # Taxonomy functions
+def get_level(taxonID):
+    level = taxonomy.get_rank(taxonID)
+
+    #Unknown taxonID yields None
+    if level == None:
+        level = "UNKNOWN"
+    return level
+
+def get_name(taxonID):
+    name = taxonomy.get_name(taxonID)
+
+    #Unknown taxonID yields None
+    if name == None:
+        name = "UNKNOWN"
+
+    name = name.replace(" ", "_")
+    return name
+
+def get_lineage(taxonID):
+    try:
+        lineage = taxonomy.get_lineage(taxonID)
+    except ValueError:
+        print("Cannot find taxonID " + str(taxonID))
+        lineage = [taxonID]
+    if lineage == None:
+        lineage = [0]
+
+    return lineage
+
+def get_query_ID_counts(infile_contents):
+    """ This returns a counter object with the counts for each query_ID."""
+    query_ID_list = [line.split('\t')[0] for line in infile_contents]
+    counts = Counter(query_ID_list)
+    return counts
+
+def read_blacklist_file(blacklist_file_path):
+    """
+    Input is path to blacklist file. Blacklist file can be either
+    structured as <taxonID>\t<any other stuff, i.e. lineage...>
+    or just as <taxonID>. A taxonID ending in '+' (e.g. 10239+) blacklists
+    that taxonID and everything below it in the taxonomy.
+
+    This function returns a tuple of two sets - the taxonIDs that are in the
+    blacklist, and the taxonIDs whose whole clade is in the blacklist.
+    """
+    blacklist = set()
+    clade_blacklist = set()
+    with open_input(blacklist_file_path) as infile:
+        for line in infile:
+            taxonID = line.rstrip('\n').split('\t')[0]
+            if taxonID.endswith('+'):
+                clade_blacklist.add(int(taxonID[:-1]))
+            else:
+                blacklist.add(int(taxonID))
+
+    return blacklist, clade_blacklist
+
+def build_taxon_filter(blacklist, clade_blacklist):
+    """
+    Works out once which taxonIDs pass filtration. Returns a boolean array
+    indexed by taxonID that is True for taxonIDs that can be found in the
+    taxonomy (directly or as a merged taxonID), aren't in the blacklist, and
+    aren't in the clade of a taxonID in the clade blacklist.
+    """
+    taxon_filter = taxonomy.known_mask()
+    blacklist = [taxonID for taxonID in blacklist if 0 <= taxonID < len(taxon_filter)]
+    taxon_filter[blacklist] = False
+    if len(clade_blacklist) > 0:
+        taxon_filter &= ~taxonomy.clade_mask(clade_blacklist, len(taxon_filter))
+    return taxon_filter
+
+def taxonID_passes_filtration(line, taxonomy_column_index, current_taxonIDs, taxon_filter):
+    """
+    Filters based on taxonID. Returns False if the line fails. current_taxonIDs
+    is the set of taxonIDs that already passed for the current query_ID, and
+    the taxonID is added to it if the line passes.
+    """
+    taxonID = line[taxonomy_column_index]
+
+    # taxonID is "N/A", which happens from blast sometimes
+    if taxonID == "N/A":
+        return False
+
+    # taxonID is blank
+    elif taxonID == '':
+        return False
+
+    # taxonID in blacklist, or can't be found in the taxonomy
+    elif not 0 <= int(taxonID) < len(taxon_filter) or not taxon_filter[int(taxonID)]:
+        return False
+
+    # taxonID is already in the current_contents
+    elif taxonID in current_taxonIDs:
+        return False
+
+    # Otherwise, it passsed
+    else:
+        current_taxonIDs.add(taxonID)
+        return True
+
+def filter_current_contents_by_score(current_contents, score_index, within_percent_of_top_score):
+
+    # Find scores
+    scores = [float(item[score_index]) for item in current_contents]
+
+    # Get the threshold, then a boolean for which scores pass the threshold
+    max_score = max(scores)
+    threshold = (1.0 - (within_percent_of_top_score)/100)*max_score
+    score_boolean = np.array([score >= threshold for score in scores])
+
+    # Convert current_contents to a np array so I can do boolean subsetting.
+    # Return list.
+    current_contents_array = np.array(current_contents)
+    return current_contents_array[score_boolean].tolist()
+
+def look_up_LCA_taxonID(taxonIDs):
+    """
+    This is the parent function. It takes in a list of taxonIDs and returns
+    the taxonID of the LCA of those taxonIDs.
+    """
+    # If taxonIDs is only length of 1, just return the taxonID
+    if len(taxonIDs) == 1:
+        return taxonIDs[0]
+
+    # Find the taxonID of the LCA
+    LCA_taxonID = lca_engine.lca_of(taxonIDs)
+
+    return LCA_taxonID
+
+def get_cannonical_lineage(taxonID, prefix_dictionary):
+    """
+    Returns a list with the prefixed name of the taxon at each level in
+    prefix_dictionary in the lineage of taxonID, or 0 if there is none.
+    """
+    return lineage_table.get_cannonical_lineages([taxonID], list(prefix_dictionary.keys()))[0]
+
+def aggregate_list(input_list):
+    """
+    Takes in a list of sublists and reformats. For example
+
+    Input: [[name1, taxonID1, lineage1], [name2, taxonID2, lineage2]]
+    Output: [[name1, name2], [taxonID1, taxonID2], [lineage1, lineage2]]
+    """
+    aggregated = []
+
+    # Iterate as many times as the sublists
+    for i in range(len(input_list[0])):
+        # We don't care about query_ID bc they're all the same
+        if i == 0:
+            continue
+        aggregated.append([sublist[i] for sublist in input_list])
+
+    return aggregated
+
+def prepare_query_group(query_ID, current_contents, score_index,
+                        within_percent_of_top_score):
+    """
+    Takes the lines of one query_ID that passed filtration, runs sanity checks
+    and filters them by score. Returns None if no lines passed filtration.
+    """
+
+    # If current_contents is empty, that means that none of the lines for that
+    # query_ID made it :(. Report that.
+    if current_contents == []:
+        print("None of the lines from query_ID " + query_ID +
+             " made it through filtration.")
+        return None
+
+    # Sanity checks - make sure all the current_contents have the same query_ID
+    ID_from_contents = set([item[0] for item in current_contents])
+    if len(ID_from_contents) > 1:
+        raise ValueError("There is more than one unique query_ID in current contents" +
+                        ", which means something is very wrong.")
+    if ID_from_contents.pop() != query_ID:
+        raise ValueError("The current contents doesn't contain the same query_ID " +
+                        "as the current query_ID. Something is wrong.")
+
+    # Filter the current_contents by bitscore
+    return filter_current_contents_by_score(current_contents,
+                                            score_index,
+                                            within_percent_of_top_score)
+
+def format_LCA_output_line(query_ID, current_contents, LCA_taxonID,
+                           LCA_cannonical_lineage, n_output_columns):
+    """
+    Returns the tab-delimited output line of one query_ID - the aggregated
+    fields, the LCA_taxonID and the cannonical lineage of the LCA.
+    """
+
+    # Aggregate current_contents to group each field in each sublist together
+    # Then, make the list of lists a list of comma-delimited strings and
+    # replace spaces with underscores
+    aggregated = aggregate_list(current_contents)
+    aggregated = [",".join(item).replace(" ", "_") for item in aggregated]
+
+    # Add the query_ID, LCA_taxonID and lineage to the aggregated list
+    loop_output = [query_ID]
+    loop_output.extend(aggregated)
+    loop_output.append(LCA_taxonID)
+    loop_output.extend(LCA_cannonical_lineage)
+
+    # Make sure the output is the size you'd expect
+    if len(loop_output) != n_output_columns:
+        raise ValueError("The loop output " + str(loop_output) + " is not the same length " +
+                        " as the preset colnames in the header.")
+
+    # Make all list items strings, and then condense list into a tab-delimited string
+    loop_output = "\t".join([str(item) for item in loop_output])
+
+    return loop_output
+
+def get_LCA_output_line(query_ID, current_contents, taxonomy_column_index,
+                        score_index, within_percent_of_top_score,
+                        prefix_dictionary, n_output_columns, lca_cache,
+                        taxon_counts=None):
+    """
+    Takes the lines of one query_ID that passed filtration and returns its
+    tab-delimited output line. Returns None if no lines passed filtration. If
+    taxon_counts is given, the query_ID is counted towards its LCA_taxonID.
+    """
+    current_contents = prepare_query_group(query_ID, current_contents,
+                                           score_index, within_percent_of_top_score)
+    if current_contents == None:
+        return None
+
+    # Now, need to get cannonical LCA lineage from a list of taxonIDs. The
+    # same set of taxonIDs gives the same result, so check the cache first.
+    taxonIDs = [int(item[taxonomy_column_index]) for item in current_contents]
+    key = frozenset(taxonIDs)
+    cached = lca_cache.get(key)
+    if cached == None:
+        LCA_taxonID = look_up_LCA_taxonID(taxonIDs)
+        LCA_cannonical_lineage = get_cannonical_lineage(LCA_taxonID, prefix_dictionary)
+        lca_cache.put(key, (LCA_taxonID, LCA_cannonical_lineage))
+    else:
+        LCA_taxonID, LCA_cannonical_lineage = cached
+
+    if taxon_counts != None:
+        count_LCA_taxonID(taxon_counts, LCA_taxonID)
+
+    return format_LCA_output_line(query_ID, current_contents, LCA_taxonID,
+                                  LCA_cannonical_lineage, n_output_columns)
+
+class SeenQueryIDs(object):
+    """
+    The query_IDs whose groups have been read, to catch a query_ID whose lines
+    aren't all consecutive. Only the 64 bit hash of each query_ID is kept, in
+    a set for the latest ones and in a sorted numpy array for the rest, so
+    this takes about 16 bytes per query_ID rather than the query_IDs
+    themselves. The hashes are only comparable within a process and the
+    processes forked from it.
+    """
+
+    def __init__(self):
+        self.recent = set()
+        self.hashes = np.empty(0, dtype=np.int64)
+        self.unchecked = []
+
+    def add(self, query_ID):
+        """
+        Adds query_ID, returning False if it is in the set. Whether it is in
+        the array is only checked by check_unchecked(), for many query_IDs at
+        once.
+        """
+        query_hash = hash(query_ID)
+        if query_hash in self.recent:
+            return False
+        self.recent.add(query_hash)
+        self.unchecked.append(query_ID)
+        return True
+
+    def check_unchecked(self):
+        """
+        Returns the first query_ID added since the last call that was already
+        in the array, or None.
+        """
+        unchecked = self.unchecked
+        self.unchecked = []
+        if len(self.hashes) > 0 and len(unchecked) > 0:
+            unchecked_hashes = np.fromiter((hash(query_ID) for query_ID in unchecked),
+                                           dtype=np.int64, count=len(unchecked))
+            positions = np.searchsorted(self.hashes, unchecked_hashes)
+            positions[positions == len(self.hashes)] = 0
+            repeated = np.flatnonzero(self.hashes[positions] == unchecked_hashes)
+            if len(repeated) > 0:
+                return unchecked[repeated[0]]
+
+        # The set may hold an eighth of the array, so merges take linear time
+        if len(self.recent) >= max(SEEN_QUERY_IDS_SET_SIZE, len(self.hashes) // 8):
+            self.flush()
+        return None
+
+    def flush(self):
+        """
+        Moves the hashes of the set into the sorted array. The query_IDs added
+        since the last check_unchecked() must have been checked.
+        """
+        if len(self.recent) == 0:
+            return
+        recent = np.fromiter(self.recent, dtype=np.int64, count=len(self.recent))
+        self.hashes = np.union1d(self.hashes, recent)
+        self.recent = set()
+
+    def sorted_hashes(self):
+        """
+        Returns the sorted array of all the hashes, e.g. to pickle them, once
+        they have been checked.
+        """
+        self.flush()
+        return self.hashes
+
+    def update(self, hashes):
+        """
+        Adds a sorted array of hashes from sorted_hashes(), returning False if
+        any of them was already added.
+        """
+        self.flush()
+        merged = np.union1d(self.hashes, hashes)
+        is_new = len(merged) == len(self.hashes) + len(hashes)
+        self.hashes = merged
+        return is_new
+
+def repeated_query_ID_error(query_ID=None):
+    """ The error raised when the lines of a query_ID aren't consecutive. """
+    described = "A query_ID" if query_ID == None else "The query_ID " + str(query_ID)
+    return ValueError(described + " appears again after the lines of other query_IDs. " +
+                      "--streaming and --threads need the lines of each query_ID to be " +
+                      "consecutive, as in BLAST and DIAMOND output. Use --external_sort " +
+                      "to sort the infile by query_ID first.")
+
+def check_query_IDs(seen_query_IDs):
+    """ Raises a ValueError if seen_query_IDs has a repeated query_ID. """
+    if seen_query_IDs == None:
+        return
+    query_ID = seen_query_IDs.check_unchecked()
+    if query_ID != None:
+        raise repeated_query_ID_error(query_ID)
+
+def iterate_query_groups(infile_handle, n_columns, seen_query_IDs=None):
+    """
+    Yields (query_ID, lines) for each run of consecutive lines that share a
+    query_ID, where each line is a list of fields. Blank lines are ignored and
+    lines that don't have n_columns fields are reported and skipped.
+
+    Only one group is held in memory at a time, so the input must be grouped
+    by query_ID. BLAST and DIAMOND output is. If seen_query_IDs is given, the
+    query_IDs are added to it, and a query_ID that comes up in a second group
+    soon after its first raises a ValueError. The caller checks for older
+    repeats with seen_query_IDs.check_unchecked().
+    """
+    def split_lines(infile_handle):
+        for line in infile_handle:
+            line = line.rstrip("\n")
+            if line == "":
+                continue
+            yield line.split("\t")
+
+    for query_ID, group in itertools.groupby(split_lines(infile_handle), key=lambda line: line[0]):
+        if seen_query_IDs != None and not seen_query_IDs.add(query_ID):
+            raise repeated_query_ID_error(query_ID)
+        lines = []
+        for line in group:
+            if len(line) != n_columns:
+                print("The line " + str(line) + " is not the same length as the colnames, " +
+                     " so skipping it.")
+                continue
+            lines.append(line)
+        yield query_ID, lines
+
+def stream_LCA_output(infile, outfile, header, n_columns, taxonomy_column_index,
+                      score_index, within_percent_of_top_score, taxon_filter,
+                      prefix_dictionary, n_output_columns, lca_cache,
+                      taxon_counts=None, sort_memory=0, temp_dir=""):
+    """
+    Streaming version of the main loop. Reads the infile one query_ID group at
+    a time and writes each output line straight to a buffered outfile handle,
+    so memory depends on the largest group rather than on the file size. If
+    outfile is '', no output lines are written, which is only useful along
+    with taxon_counts.
+
+    If sort_memory is above 0, the infile doesn't need to be grouped by
+    query_ID - it is first sorted by query_ID with an external merge sort that
+    buffers at most about sort_memory bytes of lines, spilling sorted runs to
+    temp_dir. Otherwise, a query_ID whose lines aren't consecutive raises a
+    ValueError.
+    """
+
+    with open_input(infile) as infile_handle:
+        infile_lines = infile_handle
+        seen_query_IDs = SeenQueryIDs()
+        if sort_memory > 0:
+            infile_lines = sort_lines(infile_handle, sort_memory, temp_dir)
+            seen_query_IDs = None
+
+        if outfile == "":
+            write_LCA_lines(infile_lines, None, n_columns,
+                            taxonomy_column_index, score_index,
+                            within_percent_of_top_score, taxon_filter,
+                            prefix_dictionary, n_output_columns, lca_cache,
+                            taxon_counts, seen_query_IDs)
+            return
+
+        #Make output directory if necessary
+        output_directory = os.path.dirname(outfile)
+        pathlib.Path(output_directory).mkdir(parents=True, exist_ok=True)
+
+        # Write to a temporary file and rename it once complete, so an error
+        # such as a repeated query_ID doesn't leave a truncated outfile
+        temporary_path = outfile + "." + str(os.getpid()) + ".tmp"
+        try:
+            with open_output(temporary_path, "w", compression=compression_from_name(outfile),
+                             buffering=OUTPUT_BUFFER_SIZE) as outfile_handle:
+                outfile_handle.write(header + "\n")
+                write_LCA_lines(infile_lines, outfile_handle, n_columns,
+                                taxonomy_column_index, score_index,
+                                within_percent_of_top_score, taxon_filter,
+                                prefix_dictionary, n_output_columns, lca_cache,
+                                taxon_counts, seen_query_IDs)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        os.replace(temporary_path, outfile)
+
+def write_LCA_lines(infile_lines, outfile_handle, n_columns, taxonomy_column_index,
+                    score_index, within_percent_of_top_score, taxon_filter,
+                    prefix_dictionary, n_output_columns, lca_cache,
+                    taxon_counts=None, seen_query_IDs=None):
+    """
+    Takes an iterable of infile lines grouped by query_ID and writes the output
+    line of each query_ID to outfile_handle, unless it is None. If
+    taxon_counts is given, each query_ID is counted towards its LCA_taxonID.
+    If seen_query_IDs is given, it is used to check that the lines of each
+    query_ID are consecutive, before the output lines of a block are written.
+    """
+
+    # Groups are collected into blocks so their LCAs can be found in one batch
+    block = []
+    for query_ID, lines in iterate_query_groups(infile_lines, n_columns, seen_query_IDs):
+
+        # Check if taxonID is already in the contents, is blank, or is in the blacklist
+        current_contents = []
+        current_taxonIDs = set()
+        for line in lines:
+            if taxonID_passes_filtration(line, taxonomy_column_index, current_taxonIDs, taxon_filter):
+                current_contents.append(line)
+
+        current_contents = prepare_query_group(query_ID, current_contents,
+                                               score_index, within_percent_of_top_score)
+        if current_contents == None:
+            continue
+
+        block.append((query_ID, current_contents))
+        if len(block) == LCA_BLOCK_SIZE:
+            check_query_IDs(seen_query_IDs)
+            write_LCA_block(block, outfile_handle, taxonomy_column_index,
+                            prefix_dictionary, n_output_columns, lca_cache,
+                            taxon_counts)
+            block = []
+
+    check_query_IDs(seen_query_IDs)
+    write_LCA_block(block, outfile_handle, taxonomy_column_index,
+                    prefix_dictionary, n_output_columns, lca_cache,
+                    taxon_counts)
+
+def find_query_group_start(infile_handle, offset):
+    """
+    Takes a binary infile handle and a byte offset, and returns the offset of
+    the first line at or after it that starts a new query_ID group - i.e. whose
+    query_ID differs from that of the line before it. Returns the file size if
+    there is no such line.
+    """
+    if offset == 0:
+        return 0
+
+    # Skip to the start of the next full line, then skip the rest of the
+    # group that line belongs to
+    infile_handle.seek(offset - 1)
+    if infile_handle.read(1) != b"\n":
+        infile_handle.readline()
+
+    previous_query_ID = None
+    while True:
+        position = infile_handle.tell()
+        line = infile_handle.readline()
+        if line == b"":
+            return position
+        query_ID = line.rstrip(b"\n").split(b"\t")[0]
+        if previous_query_ID != None and query_ID != previous_query_ID:
+            return position
+        previous_query_ID = query_ID
+
+def find_shard_boundaries(infile, n_shards):
+    """
+    Splits the infile into at most n_shards byte ranges of roughly equal size
+    that each start at the beginning of a query_ID group. Returns a list of
+    (start, end) tuples.
+    """
+    file_size = os.path.getsize(infile)
+    boundaries = [0]
+    with open(infile, "rb") as infile_handle:
+        for i in range(1, n_shards):
+            boundary = find_query_group_start(infile_handle, file_size * i // n_shards)
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+    if file_size > boundaries[-1]:
+        boundaries.append(file_size)
+
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+def read_byte_range(infile, start, end):
+    """ Yields the decoded lines of the infile between two byte offsets. """
+    with open(infile, "rb") as infile_handle:
+        infile_handle.seek(start)
+        position = start
+        while position < end:
+            line = infile_handle.readline()
+            if line == b"":
+                break
+            position += len(line)
+            yield line.decode("utf-8")
+
+def load_taxonomy_handles():
+    """ Loads the taxonomy, LCA engine and lineage table, which load lazily. """
+    for handle in [taxonomy, lca_engine, lineage_table]:
+        handle.resolve()
+
+# Set by the parent process before the shard pool is created, and inherited by
+# the forked workers along with the taxonomy and LCA engine.
+shard_context = dict()
+
+def process_LCA_shard(shard):
+    """
+    Worker for --threads. Processes one (start, end, shard_outfile) byte range
+    of the infile and writes its output lines, without a header, to
+    shard_outfile, or nowhere if shard_outfile is None. Returns the worker's
+    LCA cache counts, its cache entries if the cache is being saved, its
+    taxon counts as (LCA_taxonID, count) tuples if taxa are being counted, and
+    the sorted hashes of its query_IDs if they are being checked.
+    """
+    start, end, shard_outfile = shard
+    context = shard_context
+    lca_cache = context['lca_cache']
+    hits, misses = lca_cache.hits, lca_cache.misses
+    taxon_counts = dict() if context['count_taxa'] else None
+    seen_query_IDs = SeenQueryIDs() if context['check_query_IDs'] else None
+
+    outfile_handle = None
+    if shard_outfile != None:
+        outfile_handle = open(shard_outfile, "w", buffering=OUTPUT_BUFFER_SIZE)
+    try:
+        write_LCA_lines(read_byte_range(context['infile'], start, end), outfile_handle,
+                        context['n_columns'], context['taxonomy_column_index'],
+                        context['score_index'], context['within_percent_of_top_score'],
+                        context['taxon_filter'], context['prefix_dictionary'],
+                        context['n_output_columns'], lca_cache, taxon_counts,
+                        seen_query_IDs)
+    finally:
+        if outfile_handle != None:
+            outfile_handle.close()
+
+    entries = list(lca_cache.entries.items()) if context['return_cache_entries'] else []
+    counts = list(taxon_counts.items()) if taxon_counts != None else []
+    query_hashes = seen_query_IDs.sorted_hashes() if seen_query_IDs != None else None
+    return lca_cache.hits - hits, lca_cache.misses - misses, entries, counts, query_hashes
+
+def sharded_LCA_output(infile, outfile, header, threads, n_columns,
+                       taxonomy_column_index, score_index,
+                       within_percent_of_top_score, taxon_filter,
+                       prefix_dictionary, n_output_columns, lca_cache,
+                       return_cache_entries, taxon_counts=None,
+                       check_query_IDs=True):
+    """
+    Multi-process version of stream_LCA_output. Splits the infile at query_ID
+    group boundaries into byte-range shards, processes them in a pool of
+    threads worker processes that share the parent's taxonomy by forking, and
+    concatenates the shard outputs in their original order. The output, and
+    taxon_counts if given, are identical to a single-process streaming run.
+
+    If check_query_IDs, a query_ID whose lines aren't consecutive raises a
+    ValueError, within a shard or across shards. The outfile is only written
+    once every shard has been checked, so a failed run doesn't leave one.
+    """
+    write_lines = outfile != ""
+
+    #Make output directory if necessary
+    output_directory = os.path.dirname(outfile)
+    if write_lines:
+        pathlib.Path(output_directory).mkdir(parents=True, exist_ok=True)
+
+    # Several shards per worker evens out differences in shard run time
+    shards = find_shard_boundaries(infile, threads * SHARDS_PER_THREAD)
+
+    shard_context.update({
+        'infile': infile,
+        'n_columns': n_columns,
+        'taxonomy_column_index': taxonomy_column_index,
+        'score_index': score_index,
+        'within_percent_of_top_score': within_percent_of_top_score,
+        'taxon_filter': taxon_filter,
+        'prefix_dictionary': prefix_dictionary,
+        'n_output_columns': n_output_columns,
+        'lca_cache': lca_cache,
+        'return_cache_entries': return_cache_entries,
+        'count_taxa': taxon_counts != None,
+        'check_query_IDs': check_query_IDs
+    })
+    seen_query_IDs = SeenQueryIDs() if check_query_IDs else None
+
+    # Load the taxonomy before forking, so the workers share it
+    load_taxonomy_handles()
+
+    if not write_lines:
+        shards = [(start, end, None) for start, end in shards]
+        pool = multiprocessing.get_context("fork").Pool(threads)
+        try:
+            for hits, misses, entries, counts, query_hashes in pool.imap(process_LCA_shard, shards):
+                merge_shard_results(lca_cache, hits, misses, entries, taxon_counts, counts,
+                                    seen_query_IDs, query_hashes)
+        finally:
+            pool.close()
+            pool.join()
+        return
+
+    temp_dir = tempfile.mkdtemp(prefix="get_LCA_shards_", dir=output_directory or ".")
+    try:
+        shards = [(start, end, os.path.join(temp_dir, "shard_{0}.tsv".format(i)))
+                  for i, (start, end) in enumerate(shards)]
+
+        # The shards are concatenated next to the outfile, which is replaced
+        # once every shard has passed the repeated query_ID check
+        temporary_path = os.path.join(temp_dir, "outfile")
+        with open_output(temporary_path, "w", threads, compression_from_name(outfile),
+                         buffering=OUTPUT_BUFFER_SIZE) as outfile_handle:
+            outfile_handle.write(header + "\n")
+
+            pool = multiprocessing.get_context("fork").Pool(threads)
+            try:
+                for (start, end, shard_outfile), (hits, misses, entries, counts, query_hashes) in \
+                        zip(shards, pool.imap(process_LCA_shard, shards)):
+                    merge_shard_results(lca_cache, hits, misses, entries, taxon_counts, counts,
+                                        seen_query_IDs, query_hashes)
+
+                    with open(shard_outfile) as shard_handle:
+                        shutil.copyfileobj(shard_handle, outfile_handle)
+                    os.remove(shard_outfile)
+            finally:
+                pool.close()
+                pool.join()
+        os.replace(temporary_path, outfile)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def merge_shard_results(lca_cache, hits, misses, entries, taxon_counts, counts,
+                        seen_query_IDs=None, query_hashes=None):
+    """
+    Adds the LCA cache counts, cache entries and taxon counts returned by a
+    shard worker to the parent's. Shards are merged in infile order, so taxa
+    keep the order in which they were first seen. If seen_query_IDs is given,
+    raises a ValueError if the shard has a query_ID of an earlier shard.
+    """
+    if seen_query_IDs != None and not seen_query_IDs.update(query_hashes):
+        raise repeated_query_ID_error()
+
+    lca_cache.hits += hits
+    lca_cache.misses += misses
+    for key, value in entries:
+        lca_cache.put(key, value)
+    for LCA_taxonID, count in counts:
+        taxon_counts[LCA_taxonID] = taxon_counts.get(LCA_taxonID, 0) + count
+
+def write_LCA_block(block, outfile_handle, taxonomy_column_index,
+                    prefix_dictionary, n_output_columns, lca_cache,
+                    taxon_counts=None):
+    """
+    Takes a list of (query_ID, current_contents) tuples, looks up the LCAs
+    that aren't already cached in one batch, and writes their output lines to
+    outfile_handle unless it is None. If taxon_counts is given, each query_ID
+    is counted towards its LCA_taxonID.
+    """
+    taxonID_groups = [[int(item[taxonomy_column_index]) for item in current_contents]
+                      for query_ID, current_contents in block]
+    keys = [frozenset(taxonIDs) for taxonIDs in taxonID_groups]
+
+    # Find the LCA and lineage of each set of taxonIDs not in the cache
+    results = dict()
+    uncached = []
+    for key, taxonIDs in zip(keys, taxonID_groups):
+
+        # Repeats within the block count as cache hits
+        if key in results:
+            lca_cache.hits += 1
+            continue
+        cached = lca_cache.get(key)
+        if cached == None:
+            results[key] = None
+            uncached.append((key, taxonIDs))
+        else:
+            results[key] = cached
+
+    LCA_taxonIDs = lca_engine.lca_batch([taxonIDs for key, taxonIDs in uncached])
+    LCA_cannonical_lineages = lineage_table.get_cannonical_lineages(
+        LCA_taxonIDs, list(prefix_dictionary.keys()))
+    for (key, taxonIDs), LCA_taxonID, LCA_cannonical_lineage in zip(
+            uncached, LCA_taxonIDs, LCA_cannonical_lineages):
+        results[key] = (LCA_taxonID, LCA_cannonical_lineage)
+        lca_cache.put(key, results[key])
+
+    for (query_ID, current_contents), key in zip(block, keys):
+        LCA_taxonID, LCA_cannonical_lineage = results[key]
+        if taxon_counts != None:
+            count_LCA_taxonID(taxon_counts, LCA_taxonID)
+        if outfile_handle == None:
+            continue
+        loop_output = format_LCA_output_line(query_ID, current_contents, LCA_taxonID,
+                                             LCA_cannonical_lineage, n_output_columns)
+        outfile_handle.write(loop_output + "\n")
+
+def count_LCA_taxonID(taxon_counts, LCA_taxonID):
+    """
+    Counts one read towards LCA_taxonID. taxon_counts is a dictionary of
+    structure LCA_taxonID:read_count, in the order taxa were first seen, as
+    made by get_counts.get_taxonID_counts().
+    """
+    LCA_taxonID = int(LCA_taxonID)
+    taxon_counts[LCA_taxonID] = taxon_counts.get(LCA_taxonID, 0) + 1
+
+def write_taxon_counts(taxon_counts, counts_outfile, log_file):
+    """
+    Distributes the counts of each LCA_taxonID to every taxon in its lineage
+    and writes the counts table, exactly as get_counts.py would from the
+    outfile.
+    """
+    # Imported here, as get_counts loads pandas, which only counting needs
+    from . import get_counts
+
+    write_to_log(log_file, "get_LCA.py: Writing the counts of " + str(len(taxon_counts)) +
+                 " LCA taxonIDs to " + counts_outfile)
+    counts = get_counts.assign_counts(taxon_counts)
+    get_counts.write_output(counts, counts_outfile)
+
+def finish_LCA_cache(lca_cache, cache_file, log_file):
+    """ Reports the LCA cache hit/miss counts and saves it if specified. """
+    write_to_log(log_file, "get_LCA.py: " + lca_cache.report())
+    if cache_file != "":
+        lca_cache.save(cache_file, taxonomy.fingerprint)
+
+def write_output(output, output_file_path):
+
+    #Make output directory if necessary
+    output_directory = os.path.dirname(output_file_path)
+    pathlib.Path(output_directory).mkdir(parents=True, exist_ok=True)
+
+    #Write to output file, compressed if its name ends in .gz, .bgz or .zst
+    with open_output(output_file_path, "w") as outfile:
+        outfile.write(output)
+
+def write_to_log(log_file, message):
+
+    current_date_time = time.strftime("%c")
+
+    #if the log_file wasn't input, just print message to screen
+    if log_file == '':
+        print(message)
+        print(current_date_time)
+        return None
+
+    #Check if the file exists. If not, make the directory if necessary
+    log_file_directory = os.path.dirname(log_file)
+    pathlib.Path(log_file_directory).mkdir(parents=True, exist_ok=True)
+
+    #Open the log_file in append mode and write message to it
+    with open(log_file, 'a') as infile:
+        infile.write(message + '\n')
+        infile.write(current_date_time + '\n')
+
+def main():
+
+    #--------------------------------------------------------------------------#
+    #Take inputs
+    #--------------------------------------------------------------------------#
+    parser = argparse.ArgumentParser(description="""
+            This program converts a BLAST or DIAMOND output file into report of
+            the most likely match.
+
+            The NCBI taxonomy is read once from the ETE3 database at
+            ~/.etetoolkit/taxa.sqlite and held in memory for all lookups. If
+            NCBITaxa() from ETE3 has not been previously run, ETE3 will first
+            download the NCBI taxonomy database to that location. The
+            cannonical lineage of every taxonID is kept in a table next to it
+            (see build_lineage_table.py), which is built on the first run
+            against a new taxonomy.
+
+            Also, to update the taxonomy database run
+            ncbi.update_taxonomy_database(). See
+            http://etetoolkit.org/docs/latest/tutorial/tutorial_ncbitaxonomy.html
+            for more information.
+            """)
+
+    # Required arguments
+    parser.add_argument(
+        '-i',
+        '--infile',
+        type=str,
+        required=True,
+        help='''
+        Path to the BLAST or DIAMOND output file, that will serve as
+        this scripts infile. Assumes the first column contains the sequence ID.
+        '''
+    )
+    parser.add_argument(
+        '-o',
+        '--outfile',
+        type=str,
+        required=False,
+        default='',
+        help='''The path to the output file. File format will be .tsv. May only
+        be left out if --counts_outfile is given, in which case only the counts
+        are written. <default: None>'''
+    )
+
+    #Optional arguments
+    parser.add_argument(
+        '-c',
+        '--column_names',
+        type=str,
+        required=False,
+        default="query_ID seq_title seq_ID taxonID evalue bitscore pident length",
+        help='''A space-delimited of column names. Remeber to wrap in quotes.
+        <default: query_ID seq_title seq_ID taxonID evalue bitscore pident length>
+        '''
+    )
+    parser.add_argument(
+        '-t',
+        '--taxonomy_column',
+        type=str,
+        required=False,
+        default="taxonID",
+        help='''Name of the column with the taxonIDs.
+        <default: taxonID>
+        '''
+    )
+    parser.add_argument(
+        '-s',
+        '--score_column',
+        type=str,
+        required=False,
+        default="bitscore",
+        help='''Name of the column with the scores you want to be filter by.
+        <default: bitscore>
+        '''
+    )
+    parser.add_argument(
+        '-b',
+        '--blacklist_file_path',
+        type=str,
+        required=False,
+        default="",
+        help="""
+        Path to a file containing taxonIDs which should be blacklisted. Can
+        either be a single column with taxonIDs or a tab-delimited file with
+        taxonIDs first and anything else afterwards. A taxonID ending in '+'
+        (e.g. 10239+) blacklists its whole clade. <default: no blacklist>
+        """
+    )
+    parser.add_argument(
+        '-w',
+        '--within_percentage_of_top_score',
+        type=int,
+        required=False,
+        default = 1,
+        help='''
+        Within what percentage of the top score is required to keep. A value of
+        1 keeps all hits within 1 percent of top bitscore.
+        <default: 1>
+        '''
+    )
+    parser.add_argument(
+        '-l',
+        '--log_file',
+        type=str,
+        required=False,
+        default = '',
+        help='''Path to the log file. If none entered, will print entries to
+            stdout. <default: None, prints to screen>''')
+    parser.add_argument(
+        '-S',
+        '--streaming',
+        action='store_true',
+        help='''
+        Process the infile one query_ID group at a time and write each output
+        line as it is made, rather than reading the whole infile into memory.
+        Requires that all lines of a query_ID are consecutive, as they are in
+        BLAST and DIAMOND output, and stops with an error if they aren't - use
+        --external_sort for such infiles. Peak memory then depends on the
+        largest group of lines for a single query_ID, plus about 16 bytes per
+        query_ID, rather than on the size of the infile.
+        '''
+    )
+    parser.add_argument(
+        '--cache_size',
+        type=int,
+        required=False,
+        default=100000,
+        help='''
+        Maximum number of sets of hit taxonIDs whose LCA and lineage are kept
+        in the LCA cache. Least recently used entries are dropped first. 0
+        disables the cache. <default: 100000>
+        '''
+    )
+    parser.add_argument(
+        '--cache_file',
+        type=str,
+        required=False,
+        default='',
+        help='''
+        Path to a file to persist the LCA cache in. If it exists, the cache
+        starts from its contents, and it is rewritten at the end of the run, so
+        later samples start warm. The cache is ignored if it was made with a
+        different taxonomy. <default: no cache file>
+        '''
+    )
+    parser.add_argument(
+        '-p',
+        '--threads',
+        type=int,
+        required=False,
+        default=1,
+        help='''
+        Number of processes to use. With more than one, the infile is split
+        into shards at query_ID group boundaries that are processed in
+        parallel, and the output is identical to a single-process --streaming
+        run. Implies --streaming. <default: 1>
+        '''
+    )
+    parser.add_argument(
+        '--external_sort',
+        action='store_true',
+        help='''
+        Sort the infile by query_ID before processing it, for infiles whose
+        lines aren't grouped by query_ID - e.g. concatenated BLAST shards or
+        multi-sample files. Uses an external merge sort that holds at most
+        --sort_memory of lines in memory and spills sorted runs to --temp_dir.
+        The lines of each query_ID keep their order, but the output is sorted
+        by query_ID. Implies --streaming.
+        '''
+    )
+    parser.add_argument(
+        '--sort_memory',
+        type=int,
+        required=False,
+        default=1024,
+        help='''
+        Memory budget of --external_sort in MB. Peak memory of the run is
+        roughly this plus the taxonomy. <default: 1024>
+        '''
+    )
+    parser.add_argument(
+        '--temp_dir',
+        type=str,
+        required=False,
+        default='',
+        help='''
+        Directory for the sorted runs of --external_sort. Needs about as much
+        free space as the infile. <default: the system temporary directory>
+        '''
+    )
+    parser.add_argument(
+        '--counts_outfile',
+        type=str,
+        required=False,
+        default='',
+        help='''
+        Path to a counts output file. If specified, each query_ID is counted
+        as one read towards its LCA_taxonID while the LCAs are found, and the
+        counts of every taxon are written in the same format as get_counts.py
+        makes from the outfile. This saves writing and re-reading the outfile
+        just to count reads. <default: no counts file>
+        '''
+    )
+
+
+    args = parser.parse_args()
+
+    # Define input variables
+    infile = args.infile
+    outfile = args.outfile
+    colnames = args.column_names.split(" ")
+    taxonomy_column = args.taxonomy_column
+    score_column = args.score_column
+    blacklist_file_path = args.blacklist_file_path
+    within_percent_of_top_score = args.within_percentage_of_top_score
+    log_file = args.log_file
+    streaming = args.streaming
+    cache_size = args.cache_size
+    cache_file = args.cache_file
+    threads = args.threads
+    counts_outfile = args.counts_outfile
+    external_sort = args.external_sort
+    sort_memory = args.sort_memory * 1024 * 1024 if external_sort else 0
+    temp_dir = args.temp_dir
+
+    if outfile == '' and counts_outfile == '':
+        raise ValueError("At least one of --outfile and --counts_outfile must be specified.")
+
+    #--------------------------------------------------------------------------#
+    # Constants
+    #--------------------------------------------------------------------------#
+    prefix_dictionary = CANNONICAL_PREFIXES
+    taxonomy_column_index = colnames.index(taxonomy_column)
+    score_index = colnames.index(score_column)
+
+    #--------------------------------------------------------------------------#
+    # Main
+    #--------------------------------------------------------------------------#
+
+    write_to_log(log_file, "get_LCA.py: Starting.")
+
+    # Read in blacklist if it is specified
+    if blacklist_file_path != "":
+        blacklist, clade_blacklist = read_blacklist_file(blacklist_file_path)
+    else:
+        blacklist, clade_blacklist = set(), set()
+
+    # Work out once which taxonIDs pass filtration
+    taxon_filter = build_taxon_filter(blacklist, clade_blacklist)
+
+    # Set up the LCA cache, starting from a saved one if specified
+    lca_cache = LCACache(cache_size)
+    if cache_file != "":
+        loaded = lca_cache.load(cache_file, taxonomy.fingerprint)
+        write_to_log(log_file, "get_LCA.py: Loaded " + str(loaded) +
+                     " entries from the LCA cache " + cache_file)
+
+    # Make the header, which holds the future column names.
+    header = '\t'.join(colnames) + "\tLCA_taxonID\t" + '\t'.join(list(prefix_dictionary.keys()))
+    n_output_columns = len(header.split('\t'))
+
+    # Count the reads of each LCA_taxonID along the way if specified
+    taxon_counts = dict() if counts_outfile != "" else None
+
+    if threads > 1:
+        # Shards are byte ranges of an uncompressed, grouped file, so sort or
+        # decompress the infile to a temporary file first if necessary
+        plain_infile = ""
+        if external_sort or detect_compression(infile) != "":
+            if temp_dir != "":
+                pathlib.Path(temp_dir).mkdir(parents=True, exist_ok=True)
+            plain_handle, plain_infile = tempfile.mkstemp(prefix="get_LCA_infile_",
+                                                          suffix=".tsv", dir=temp_dir or None)
+            os.close(plain_handle)
+            if external_sort:
+                write_to_log(log_file, "get_LCA.py: Sorting the infile by query_ID.")
+                sort_file(infile, plain_infile, sort_memory, temp_dir)
+            else:
+                write_to_log(log_file, "get_LCA.py: Decompressing the infile.")
+                with open_input(infile, "rb") as infile_handle, \
+                     open(plain_infile, "wb") as plain_handle:
+                    shutil.copyfileobj(infile_handle, plain_handle, OUTPUT_BUFFER_SIZE)
+
+        write_to_log(log_file, "get_LCA.py: Processing the infile in shards with " +
+                     str(threads) + " processes.")
+        try:
+            sharded_LCA_output(plain_infile or infile, outfile, header, threads,
+                               len(colnames), taxonomy_column_index, score_index,
+                               within_percent_of_top_score, taxon_filter,
+                               prefix_dictionary, n_output_columns, lca_cache,
+                               cache_file != "", taxon_counts, not external_sort)
+        finally:
+            if plain_infile != "":
+                os.remove(plain_infile)
+        finish_LCA_cache(lca_cache, cache_file, log_file)
+        if taxon_counts != None:
+            write_taxon_counts(taxon_counts, counts_outfile, log_file)
+        write_to_log(log_file, "get_LCA.py: Finished.")
+        return
+
+    if streaming or external_sort:
+        if external_sort:
+            write_to_log(log_file, "get_LCA.py: Sorting the infile by query_ID with a " +
+                         "memory budget of " + str(args.sort_memory) + "MB.")
+        write_to_log(log_file, "get_LCA.py: Processing the infile one query_ID group at a time.")
+        stream_LCA_output(infile, outfile, header, len(colnames),
+                          taxonomy_column_index, score_index,
+                          within_percent_of_top_score, taxon_filter,
+                          prefix_dictionary, n_output_columns, lca_cache,
+                          taxon_counts, sort_memory, temp_dir)
+        finish_LCA_cache(lca_cache, cache_file, log_file)
+        if taxon_counts != None:
+            write_taxon_counts(taxon_counts, counts_outfile, log_file)
+        write_to_log(log_file, "get_LCA.py: Finished.")
+        return
+
+    # Make a list to hold the output lines.
+    result = [header]
+
+    # Make holders to hold information until all data for a given query_ID is collected
+    current_contents = []
+    current_taxonIDs = set()
+
+    # Open entire infile to memory
+    infile_handle = open_input(infile)
+    infile_contents = infile_handle.read().split('\n')
+    infile_handle.close()
+
+    # Keep track of total counts and observed counts
+    query_ID_counts = get_query_ID_counts(infile_contents)
+    query_ID_observed = dict()
+
+    # Iterate over each line
+    for line in infile_contents:
+
+        # Break line into feilds
+        line = line.rstrip("\n").split("\t")
+
+        # Get the query_ID
+        query_ID = line[0]
+
+        # Add to the count
+        query_ID_observed[query_ID] = query_ID_observed.get(query_ID, 0) + 1
+
+        # If line is empty or weird, continue
+        if len(line) != len(colnames):
+            print("The line " + str(line) + " is not the same length as the colnames, " +
+                 " so skipping it.")
+            continue
+
+        # Check if taxonID is already in the contents, is blank, or is in the blacklist
+        # If it passes, append to current_contents
+        if taxonID_passes_filtration(line, taxonomy_column_index, current_taxonIDs, taxon_filter):
+            current_contents.append(line)
+
+        # If observed is less than counts, this means there are still more
+        # lines with that queryID, so continue.
+        if query_ID_observed[query_ID] < query_ID_counts[query_ID]:
+            continue
+
+        # If observed is equal to counts, time to do LCA calculation and to export
+        elif query_ID_observed[query_ID] == query_ID_counts[query_ID]:
+
+            loop_output = get_LCA_output_line(query_ID, current_contents,
+                                              taxonomy_column_index, score_index,
+                                              within_percent_of_top_score,
+                                              prefix_dictionary, n_output_columns,
+                                              lca_cache, taxon_counts)
+
+            # Add this to the result
+            if loop_output != None:
+                result.append(loop_output)
+
+            # Wipe current_contents to allow the next iteration of the loop
+            current_contents = []
+            current_taxonIDs = set()
+
+    # Sanity check - make sure the counters are the same
+    if query_ID_counts != Counter(query_ID_observed):
+        raise ValueError("The query_ID_counts is not the same as the query_ID_observed.")
+
+    if outfile != "":
+        write_output('\n'.join(result) + '\n', outfile)
+
+    finish_LCA_cache(lca_cache, cache_file, log_file)
+    if taxon_counts != None:
+        write_taxon_counts(taxon_counts, counts_outfile, log_file)
+    write_to_log(log_file, "get_LCA.py: Finished.")
+
+
+if __name__ == '__main__':
+    main()
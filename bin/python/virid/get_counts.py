@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+
+#------------------------------------------------------------------------------#
+# Import packages
+#------------------------------------------------------------------------------#
+import pandas as pd
+import numpy as np
+import pathlib
+import inspect
+from .taxonomy_index import TaxonomyIndex
+from .lazy import LazyHandle
+taxonomy = LazyHandle(TaxonomyIndex.load)
+from .lineage_table import LineageTable, CANNONICAL_PREFIXES
+lineage_table = LazyHandle(lambda: LineageTable.load(taxonomy.resolve()))
+from .compressed_io import open_input, open_output
+import argparse
+import time
+import os
+import csv
+import sys
+
+# Lets input feilds be extremely large.
+csv.field_size_limit(sys.maxsize)
+
+#------------------------------------------------------------------------------#
+# Defining functions
+#------------------------------------------------------------------------------#
+
+#Taxonomy functions
+def get_level(taxonID):
+    level = taxonomy.get_rank(taxonID)
+
+    # Unknown taxonID yields None
+    if level == None:
+        level = "UNKNOWN"
+    return level
+
+def get_name(taxonID):
+    name = taxonomy.get_name(taxonID)
+
+    # Unknown taxonID yields None
+    if name == None:
+        name = "UNKNOWN"
+
+    name = name.replace(" ", "_")
+    return name
+
+def get_lineage(taxonID):
+    try:
+        lineage = taxonomy.get_lineage(taxonID)
+    except ValueError:
+        print("Cannot find taxonID " + str(taxonID))
+        lineage = [taxonID]
+    if lineage == None:
+        lineage = [0]
+
+    return lineage
+
+def get_named_lineage_from_lineage(lineage, prefix_dictionary =
+                                {'strain': 'st__',
+                                'species': 's__',
+                                'genus': 'g__',
+                                'family': 'f__',
+                                'order': 'o__',
+                                'class': 'c__',
+                                'phylum': 'p__',
+                                'kingdom': 'k__',
+                                'superkingdom': 'sk__'}
+):
+
+    named_lineage = []
+
+    # The lineage table holds the prefixed names of taxa at cannonical levels
+    use_lineage_table = prefix_dictionary == CANNONICAL_PREFIXES
+
+    for taxonID in lineage:
+        name = None
+        if use_lineage_table:
+            name = lineage_table.get_prefixed_name(taxonID)
+        if name == None:
+            level = get_level(taxonID)
+            prefix = prefix_dictionary.get(level, 'UNKNOWN__')
+            name = prefix + get_name(taxonID)
+        named_lineage.append(name)
+
+    return named_lineage
+
+def write_to_log(log_file, message):
+
+    current_date_time = time.strftime("%c")
+
+    #if the log_file wasn't input, just print message to screen
+    if log_file == '':
+        print(message)
+        print(current_date_time)
+        return None
+
+    #Check if the file exists. If not, make the directory if necessary
+    log_file_directory = os.path.dirname(log_file)
+    pathlib.Path(log_file_directory).mkdir(parents=True, exist_ok=True)
+
+    #Open the log_file in append mode and write message to it
+    with open(log_file, 'a') as infile:
+        infile.write(message + '\n')
+        infile.write(current_date_time + '\n')
+
+def read_data_file(input_data_file, sep = '\t', column_names = ''):
+    """
+    This function reads in a tab-delimited file and assigns the column names
+    appropriately. If column names are provided they're used, else it uses the
+    first line of the file as the header. column_names is a string that is a
+    space-delimited list.
+    """
+
+    #State progress
+    function_name = inspect.stack()[0][3]
+    print(function_name + ': Reading the input file ' + input_data_file)
+
+    #Main
+    with open_input(input_data_file) as infile:
+        if column_names == '':
+            DF = pd.read_csv(infile, engine = 'python', sep = sep,
+            header = 0).fillna(0)
+        else:
+            DF = pd.read_csv(infile, engine = 'python', sep = sep,
+            header = None).fillna(0)
+            DF.columns = column_names.split(" ")
+
+    #Make sure the LCA_taxonID column is the correct datatype
+    DF['LCA_taxonID'] = DF['LCA_taxonID'].astype(int)
+
+    print(function_name + ': Finished.')
+
+    return DF
+
+def make_counts_dictionary_from_counts_file(counts_file, sep = '\t'):
+    """
+    The purpose of this function is to read in a counts file and make it a
+    dictionary. The structure of the counts file must be a two column file with
+    'query_ID' and 'counts' as the columns. There should be no colnames in
+    the file.
+    """
+
+    #State progress
+    function_name = inspect.stack()[0][3]
+    print(function_name + ''': Reading in the counts file to make a counts
+        dictionary.''')
+
+    counts_dictionary = dict()
+    with open_input(counts_file) as infile:
+        for line in infile:
+            line = line.split(sep)
+
+            if len(line) != 2:
+                raise ValueError(function_name + """: The counts_file should
+                have two columns. Make sure the delimiter, sep, is correct.""")
+
+            query_ID = line[0]
+            count = int(line[1])
+
+            if query_ID == '*':
+                continue
+
+            counts_dictionary[query_ID] = count
+
+    print(function_name + ': Finished.')
+    return counts_dictionary
+
+def add_read_counts_to_dataframe(input_DF, counts_dictionary):
+
+    '''
+    The purpose of this function is to add a column, labeled counts, to the
+    input dataframe. This assumes that the dictionary keys of the
+    counts_dictionary are equal to values in the query_ID column of the input
+    dataframe.
+    '''
+
+    #State progress
+    function_name = inspect.stack()[0][3]
+    print(function_name + ': Adding read counts to dataframe.')
+
+    #Make an output DF that is a copy of the input dataframe
+    output_DF = input_DF.copy()
+
+    #Get a list of query_IDs in the input_DF and make sure they are unique
+    output_DF_query_IDs = list(output_DF['query_ID'].unique())
+    if output_DF_query_IDs != list(output_DF['query_ID']):
+        raise ValueError(function_name + """: The query_ID's present in the
+        input_DF are not unique.""")
+
+    #Add a read_count column to the input dataframe
+    output_DF['read_count'] = 0
+
+    #For each query_ID, add counts to the output dictionary
+    for query_ID in output_DF_query_IDs:
+        if not query_ID in counts_dictionary:
+            raise ValueError("Cannot find the query_ID {0} in the counts dict".format(query_ID))
+        output_DF['read_count'][output_DF['query_ID'] == query_ID] = counts_dictionary[query_ID]
+
+    print(function_name + ': Finished.')
+    return output_DF
+
+def get_taxonID_counts(df):
+    '''
+    Get total counts for each LCA_taxonID. Required colnames are 'LCA_taxonID'
+    and 'read_count'. This takes the sum of read_counts for each taxonID and
+    returns a dictionary of structure taxonID:counts. Does NOT do any assigning
+    to lineages and whatnot.
+
+    Input:
+    # - df: A dataframe that contains, at least, the columns "LCA_taxonID" and
+    "read_count"
+
+    Output:
+    # - taxon_counts_dict: A dictionary of structure taxonID:read_count, where
+     read_count is the sum of all read counts of that taxonID
+    '''
+    def column_names_in_DF(input_DF, required_column_names):
+        output = True
+        for column_name in required_column_names:
+            if column_name not in input_DF.columns:
+                output = False
+        return output
+
+    if not column_names_in_DF(df, ['LCA_taxonID', 'read_count']):
+        raise ValueError("The columns LCA_taxonID and read_count are required.")
+
+    query_ID_to_taxon = dict(zip(df['query_ID'], df['LCA_taxonID']))
+    query_ID_to_counts = dict(zip(df['query_ID'], df['read_count']))
+
+    #Get total counts
+    taxon_counts_dict = dict()
+    for query_ID in query_ID_to_taxon:
+        taxon = query_ID_to_taxon[query_ID]
+        counts = query_ID_to_counts[query_ID]
+        taxon_counts_dict[taxon] = taxon_counts_dict.get(taxon, 0) + counts
+
+    return taxon_counts_dict
+
+def get_LCA_arrays(counts_dict):
+    """
+    Takes a dictionary of structure LCA_taxonID:counts and returns arrays of
+    the current taxonIDs and the counts of the LCA_taxonIDs, skipping nan, 0
+    and taxonIDs that can't be found.
+    """
+    LCA_taxonIDs = []
+    counts = []
+    for LCA_taxonID, count in counts_dict.items():
+
+        #Check if nan - it will not be equal to itself
+        if LCA_taxonID != LCA_taxonID:
+            continue
+
+        #Check if taxonID is 0 - no need to count
+        if LCA_taxonID == 0:
+            continue
+
+        LCA_taxonIDs.append(LCA_taxonID)
+        counts.append(count)
+
+    taxonIDs = taxonomy.translate_array(LCA_taxonIDs)
+    for LCA_taxonID, taxonID in zip(LCA_taxonIDs, taxonIDs.tolist()):
+        if taxonID == -1:
+            print("Cannot find taxonID " + str(LCA_taxonID))
+
+    found = taxonIDs != -1
+    return taxonIDs[found], np.asarray(counts)[found]
+
+def distribute_counts(counts_dict, cannonical_levels = list(CANNONICAL_PREFIXES.keys())):
+    """
+    Takes a dictionary of structure LCA_taxonID:counts and assigns the counts
+    of each LCA_taxonID to every taxon in its lineage. Returns arrays of the
+    taxonIDs at cannonical_levels that received counts, and their counts, in
+    the order the taxa are first seen when walking each lineage from the root.
+
+    Rather than walking the lineage of each LCA_taxonID, the counts are pushed
+    up the parent array of the taxonomy in a single pass over the taxa they
+    reach, deepest first.
+    """
+    taxonIDs, counts = get_LCA_arrays(counts_dict)
+
+    # Collect the lineages, climbing one level of the tree at a time
+    nodes = np.unique(taxonIDs)
+    frontier = nodes
+    while len(frontier) > 0:
+        parents = taxonomy.parent[frontier]
+        frontier = np.setdiff1d(parents[parents > 0], nodes)
+        nodes = np.union1d(nodes, frontier)
+
+    # Counts of each taxon, and the position of the first lineage it is in
+    positions = np.searchsorted(nodes, taxonIDs)
+    node_counts = np.zeros(len(nodes), dtype=counts.dtype)
+    np.add.at(node_counts, positions, counts)
+    first_seen = np.full(len(nodes), len(taxonIDs), dtype=np.int64)
+    np.minimum.at(first_seen, positions, np.arange(len(taxonIDs)))
+
+    # Push the counts of each level up to the level above, deepest first
+    depth = taxonomy.depth[nodes].astype(np.int64)
+    parent_positions = np.searchsorted(nodes, taxonomy.parent[nodes])
+    by_depth = np.argsort(depth, kind="mergesort")
+    bounds = np.searchsorted(depth[by_depth], np.arange(depth.max() + 2) if len(nodes) > 0 else [0])
+    for level in range(len(bounds) - 2, 0, -1):
+        level_nodes = by_depth[bounds[level]:bounds[level + 1]]
+        np.add.at(node_counts, parent_positions[level_nodes], node_counts[level_nodes])
+        np.minimum.at(first_seen, parent_positions[level_nodes], first_seen[level_nodes])
+
+    # Keep the taxa at cannonical levels, ordered by first lineage and by
+    # depth within it
+    order = np.lexsort((depth, first_seen))
+    nodes = nodes[order]
+    node_counts = node_counts[order]
+    cannonical_codes = [code for code, rank in enumerate(taxonomy.ranks)
+                        if rank in cannonical_levels]
+    cannonical = np.isin(taxonomy.rank_codes[nodes], cannonical_codes)
+    return nodes[cannonical], node_counts[cannonical]
+
+def describe_taxa(taxonIDs, prefix_dictionary = {'strain': 'st__',
+                                                 'species': 's__',
+                                                 'genus': 'g__',
+                                                 'family': 'f__',
+                                                 'order': 'o__',
+                                                 'class': 'c__',
+                                                 'phylum': 'p__',
+                                                 'kingdom': 'k__',
+                                                 'superkingdom': 'sk__'}
+):
+    """
+    Takes a list of taxonIDs at cannonical levels and returns a dataframe,
+    indexed by taxonID, with the lineage, superkingdom, taxon and level of
+    each.
+    """
+
+    def get_cannonical_lineage(taxonID, cannonical_levels):
+        lineage = get_lineage(taxonID)
+        cannonical_lineage = []
+        for taxon in lineage:
+            if get_level(taxon) in cannonical_levels:
+                cannonical_lineage.append(taxon)
+        return cannonical_lineage
+
+    def get_superkingdom_from_named_lineage(named_lineage):
+        superkingdom = "UNKNOWN"
+        for taxon in named_lineage:
+            if taxon.startswith("sk__"):
+                superkingdom = taxon
+                return superkingdom
+        return superkingdom
+
+    cannonical_levels = list(prefix_dictionary.keys())
+    use_lineage_table = prefix_dictionary == CANNONICAL_PREFIXES
+    taxonIDs = [int(taxonID) for taxonID in taxonIDs]
+
+    levels = [get_level(taxonID) for taxonID in taxonIDs]
+    names = [prefix_dictionary.get(level, "unknown__") + get_name(taxonID)
+             for taxonID, level in zip(taxonIDs, levels)]
+
+    # Read the named lineages from the lineage table, walking the lineage
+    # only where the table can't reproduce it
+    if use_lineage_table:
+        named_lineages = lineage_table.get_named_lineages(taxonIDs)
+    else:
+        named_lineages = [None] * len(taxonIDs)
+    for i, taxonID in enumerate(taxonIDs):
+        if named_lineages[i] == None:
+            cannonical_lineage = get_cannonical_lineage(taxonID, cannonical_levels)
+            named_lineages[i] = get_named_lineage_from_lineage(cannonical_lineage, prefix_dictionary)
+    superkingdoms = [get_superkingdom_from_named_lineage(named_lineage)
+                     for named_lineage in named_lineages]
+
+    return pd.DataFrame({'lineage': named_lineages,
+                         'superkingdom': superkingdoms,
+                         'taxon': names,
+                         'level': levels},
+                        columns = ['lineage', 'superkingdom', 'taxon', 'level'],
+                        index = pd.Index(taxonIDs, name = "taxonID"))
+
+def assign_counts(counts_dict, prefix_dictionary = {'strain': 'st__',
+                                                 'species': 's__',
+                                                 'genus': 'g__',
+                                                 'family': 'f__',
+                                                 'order': 'o__',
+                                                 'class': 'c__',
+                                                 'phylum': 'p__',
+                                                 'kingdom': 'k__',
+                                                 'superkingdom': 'sk__'}
+):
+    """
+    Takes a dictionary of structure LCA_taxonID:counts and assigns the counts
+    of each LCA_taxonID to every taxon in its lineage. Returns a dataframe,
+    indexed by taxonID, with the lineage, superkingdom, taxon, level and count
+    of every taxon at a level in prefix_dictionary.
+    """
+
+    #State progress
+    function_name = inspect.stack()[0][3]
+    print(function_name + ': Generating counts dataframe.')
+
+    taxonIDs, counts = distribute_counts(counts_dict, list(prefix_dictionary.keys()))
+
+    #Build the output dataframe - 'lineage', 'superkingdom', 'taxon', 'level', 'count'
+    out_df = describe_taxa(taxonIDs, prefix_dictionary)
+    out_df['count'] = counts
+
+    print(function_name + ': Finished.')
+
+    return out_df
+
+def write_output(output_DF, output_path):
+    #State progress
+    function_name = inspect.stack()[0][3]
+    print(function_name + ': Writing output to ' + output_path)
+
+    #Make the output directory if necessary
+    output_directory = os.path.dirname(output_path)
+    pathlib.Path(output_directory).mkdir(parents=True, exist_ok=True)
+
+    #Write the output file, compressed if its name ends in .gz, .bgz or .zst
+    with open_output(output_path) as outfile:
+        output_DF.to_csv(outfile, sep='\t', index=True)
+
+    print('write_output(): Finished.')
+
+def make_counts_file(infile, outfile, counts_file = '', log_file = ''):
+    """
+    Counts the reads of infile at each taxon level and writes them to outfile.
+    Used by main(), and for calling get_counts.py in-process.
+    """
+
+    write_to_log(log_file, "Starting.")
+
+    #import data
+    data = read_data_file(infile)
+
+    #if there are no counts, assume these are reads
+    if counts_file == '':
+        print('''Did not detect a counts file. Assuming the input dataset
+              is queried reads.''')
+        data['read_count'] = 1
+    else:
+        #Make counts_dictionary from counts_file
+        counts_dictionary = make_counts_dictionary_from_counts_file(counts_file)
+
+        #Add counts to the dataframe
+        data = add_read_counts_to_dataframe(data, counts_dictionary)
+
+    #Make a dict containing the aggregate counts for each taxonID
+    counts_dict = get_taxonID_counts(data)
+
+    #Assign counts to each taxonID's phylogeny
+    counts = assign_counts(counts_dict)
+
+    #write output
+    write_output(counts, outfile)
+
+    write_to_log(log_file, "Finished.")
+
+def main():
+
+    #Argparse input
+    parser = argparse.ArgumentParser(description="""
+    The purpose of this script is to take a converted DIAMOND or BLAST output
+    file (in csv format) and generate a counts file at each taxon level.
+
+    Input:
+    - infile: A converted DIAMOND or blast output file. This script assumes
+    there ARE colnames. Required column is 'LCA_taxonID'. If there is no
+    counts_file, this input is assumed to be from reads, meaning each line has
+    a read_count of 1.
+    - outfile: Path to the output file, which will be tab-delimited.
+
+    *Optional*
+    - counts_file: A tab-delimited file of structure <sequence name> <count>. If
+    this is provided, the counts for each entry in the infile will come from this
+    file.
+    - log_file: An optional file provided for logging purposes (start/end of the script).
+
+    """)
+    parser.add_argument('-i', '--infile', type=str, required=True,
+        help='''Path to the input data file. See -h for more information.''')
+    parser.add_argument('-o', '--outfile', type=str, required=True,
+        help='''Path to the output file (tab-delimited).''')
+    parser.add_argument('-c', '--counts_file', type=str, required=False, default = '',
+        help='''Path to the counts file. See -h for more information.''')
+    parser.add_argument('-l', '--log_file', type=str, required=False, default = '',
+        help='''Path to the log file.''')
+
+    args = parser.parse_args()
+
+    infile = args.infile
+    outfile = args.outfile
+    counts_file = args.counts_file
+    log_file = args.log_file
+
+    #Run script.
+    make_counts_file(infile, outfile, counts_file, log_file)
+
+if __name__ == '__main__':
+    main()
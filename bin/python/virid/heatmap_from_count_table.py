@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+
+import pandas as pd
+import numpy as np
+import matplotlib
+# Figures are only written to files, so draw them without a display
+matplotlib.use("Agg")
+import seaborn as sns
+import matplotlib.pyplot as plt
+import argparse
+import hashlib
+import multiprocessing
+import os
+import pathlib
+
+def str2bool(v):
+    """
+    Function to read in argparse booleans. From Maxim/Knight71 on stackoverflow
+    - see https://stackoverflow.com/questions/15008758/parsing-boolean-values-with-argparse
+    """
+    if isinstance(v, bool):
+       return v
+    if v.lower() in ('yes', 'true', 't', 'y', '1'):
+        return True
+    elif v.lower() in ('no', 'false', 'f', 'n', '0'):
+        return False
+    else:
+        raise argparse.ArgumentTypeError('Boolean value expected.')
+
+# Name, level and superkingdom of each heatmap made by main()
+PANELS = [
+    ("viral_genera", "genus", "Virus"),
+    ("viral_species", "species", "Virus"),
+    ("viral_family", "family", "Virus"),
+    ("bacterial_genera", "genus", "Bacteria"),
+    ("bacterial_species", "species", "Bacteria"),
+    ("all_genera", "genus", "all"),
+    ("all_species", "species", "all")
+]
+
+SUPERKINGDOM_NAMES = {
+    "Virus": ['sk__Viruses', 'Viruses'],
+    "Bacteria": ['sk__Bacteria', 'Bacteria']
+}
+
+# Heatmaps with more cells than this are drawn as a single image rather than
+# one vector shape per cell, which keeps wide pdf and svg outputs small
+RASTERIZE_ABOVE = 10000
+
+def prepare_panels(df, non_sample_cols, panels, TOP_NUMBER_OF_ROWS=50):
+    """
+    Selects the data of every heatmap in panels - a list of (name, level,
+    superkingdom) tuples - in one pass over df. The row means and log10 of
+    the whole table are computed once, and each panel takes the top rows of
+    its level and superkingdom by mean, dropping columns that only have 0s.
+
+    Returns a dictionary of name:(values, superkingdoms), where values is a
+    dataframe of the log10 counts and superkingdoms a series of the
+    superkingdom of each row, or name:None if no taxa met the conditions.
+    """
+    # Get sample cols
+    sample_cols = [colname for colname in df.columns.to_list() if colname not in non_sample_cols]
+
+    # Condense the numbers by taking log10 of everything, and replace
+    # negative infinity with 0
+    counts = df[sample_cols].values.astype(float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_counts = np.log10(counts)
+    log_counts[log_counts == np.NINF] = 0
+
+    # Rank every row by its mean, highest first
+    means = df[sample_cols].mean(axis=1).values
+    order = np.argsort(-means, kind="mergesort")
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+
+    # Rows of each level and superkingdom
+    levels = df.level.values
+    level_rows = {level: levels == level for level in set(panel[1] for panel in panels)}
+    superkingdom_rows = dict()
+    for name, level, superkingdom in panels:
+        if superkingdom == "all":
+            superkingdom_rows[superkingdom] = np.ones(len(df), dtype=bool)
+        elif superkingdom in SUPERKINGDOM_NAMES:
+            superkingdom_rows[superkingdom] = df.superkingdom.isin(SUPERKINGDOM_NAMES[superkingdom]).values
+        else:
+            raise ValueError("Superkingdom value must be 'Virus', 'Bacteria', or 'all'." +
+            " You entered {}".format(superkingdom))
+
+    prepared = dict()
+    for name, level, superkingdom in panels:
+
+        # Take the top rows by mean
+        rows = np.flatnonzero(level_rows[level] & superkingdom_rows[superkingdom])
+        rows = rows[np.argsort(rank[rows], kind="mergesort")][:TOP_NUMBER_OF_ROWS]
+
+        # If no taxa met the conditions, give a notice.
+        if len(rows) == 0:
+            print("The dataframe is of size zero.")
+            print("There may be no taxa of the superkingdom, or no taxa of the given level.")
+            print("level: {0}, superkingdom:{1}".format(level, superkingdom))
+            prepared[name] = None
+            continue
+
+        # Remove columns that only have 0s
+        values = log_counts[rows]
+        columns = (values != 0).any(axis=0)
+        values = pd.DataFrame(values[:, columns], index=df.index[rows],
+                              columns=[col for col, keep in zip(sample_cols, columns) if keep])
+        prepared[name] = (values, df.superkingdom.iloc[rows])
+
+    return prepared
+
+def compute_linkage(array):
+    """
+    Average-linkage hierarchical clustering of the rows of array with
+    euclidean distances, as sns.clustermap does by default.
+    """
+    try:
+        import fastcluster
+        return fastcluster.linkage(array, method='average', metric='euclidean')
+    except ImportError:
+        from scipy.cluster import hierarchy
+        return hierarchy.linkage(array, method='average', metric='euclidean')
+
+def linkage_key(array):
+    """ Key of the linkage of array - identical data shares a linkage. """
+    array = np.ascontiguousarray(array, dtype=float)
+    return (array.shape, hashlib.md5(array.tobytes()).hexdigest())
+
+def compute_linkages(prepared, cluster_samples=True, cluster_taxa=True, pool=None):
+    """
+    Computes the row and column linkages of every prepared panel. Panels that
+    cluster identical data share a linkage, so each distinct matrix is only
+    clustered once. The clustering is spread over pool if given.
+
+    Returns a dictionary of name:(row_linkage, col_linkage), with None for
+    the linkages that aren't needed.
+    """
+    arrays = dict()
+    keys = dict()
+    for name, panel in prepared.items():
+        row_key, col_key = None, None
+        if panel != None:
+            values = panel[0].values
+            if cluster_taxa and values.shape[0] > 1:
+                row_key = linkage_key(values)
+                arrays[row_key] = values
+            if cluster_samples and values.shape[0] > 1 and values.shape[1] > 1:
+                col_key = linkage_key(values.T)
+                arrays[col_key] = values.T
+        keys[name] = (row_key, col_key)
+
+    unique_keys = list(arrays.keys())
+    if pool != None:
+        linkages = pool.map(compute_linkage, [arrays[key] for key in unique_keys], chunksize=1)
+    else:
+        linkages = [compute_linkage(arrays[key]) for key in unique_keys]
+    linkages = dict(zip(unique_keys, linkages))
+    linkages[None] = None
+
+    return {name: (linkages[row_key], linkages[col_key]) for name, (row_key, col_key) in keys.items()}
+
+def draw_heatmap(values, superkingdoms, row_linkage=None, col_linkage=None, rasterize=None):
+    """
+    Draws a clustermap of the prepared values of a panel, clustering the rows
+    and columns with the given linkages. rasterize defaults to whether the
+    heatmap has more than RASTERIZE_ABOVE cells.
+    """
+    if rasterize == None:
+        rasterize = values.size > RASTERIZE_ABOVE
+
+    # If DF is only one row, can't do clustermap, do regular heatmap
+    if len(values) == 1:
+        print("There is only one taxa. Reporting a heatmap.")
+        figure, axes = plt.subplots()
+        heatmap = sns.heatmap(values,
+            cmap="Blues",
+            yticklabels=True,
+            ax=axes,
+            rasterized=rasterize
+        )
+        return heatmap
+
+    # Get a color palette to map to superkingdom status
+    network_pal = sns.color_palette('coolwarm', len(superkingdoms.unique()))
+    network_lut = dict(zip(superkingdoms.unique(), network_pal))
+    network_colors = pd.Series(superkingdoms).map(network_lut)
+
+    # Plot!
+    cluster_map = sns.clustermap(values,
+                   cmap="Blues",
+                   cbar_kws={'label': 'Log10 Number of Reads'},
+                   row_colors=network_colors,
+                   yticklabels=True,
+                   col_cluster=col_linkage is not None,
+                   row_cluster=row_linkage is not None,
+                   row_linkage=row_linkage,
+                   col_linkage=col_linkage,
+                   rasterized=rasterize
+                   )
+    plt.setp(cluster_map.ax_heatmap.yaxis.get_majorticklabels(), rotation=0)
+    plt.setp(cluster_map.ax_heatmap.set_yticklabels(cluster_map.ax_heatmap.get_ymajorticklabels(), fontsize = 8))
+    plt.setp(cluster_map.ax_heatmap.set_xticklabels(cluster_map.ax_heatmap.get_xmajorticklabels(), fontsize = 8))
+    plt.setp(cluster_map.ax_heatmap.set(xlabel='Samples (Note: It is possible not all are labeled!)', ylabel='Taxa'))
+    return cluster_map
+
+def render_heatmap(arguments):
+    """
+    Draws the heatmap of a panel and saves it. Takes a (values, superkingdoms,
+    row_linkage, col_linkage, rasterize, output_path) tuple so it can be
+    mapped over a process pool.
+    """
+    values, superkingdoms, row_linkage, col_linkage, rasterize, output_path = arguments
+    heatmap = draw_heatmap(values, superkingdoms, row_linkage, col_linkage, rasterize)
+    save_heatmap(heatmap, output_path)
+    plt.close('all')
+    return output_path
+
+def generate_heatmap(df,
+    level,
+    non_sample_cols,
+    TOP_NUMBER_OF_ROWS=50,
+    superkingdom="all",
+    cluster_samples=True,
+    cluster_taxa=True):
+
+    prepared = prepare_panels(df, non_sample_cols, [("panel", level, superkingdom)], TOP_NUMBER_OF_ROWS)
+    if prepared["panel"] == None:
+        return ''
+    row_linkage, col_linkage = compute_linkages(prepared, cluster_samples, cluster_taxa)["panel"]
+    return draw_heatmap(prepared["panel"][0], prepared["panel"][1], row_linkage, col_linkage)
+
+def save_heatmap(heatmap, output_path):
+    # If there is no heatmap, don't do anything
+    if heatmap == '':
+        return
+    else:
+        try:
+            heatmap.savefig(output_path)
+        except AttributeError:
+            heatmap.get_figure().savefig(output_path)
+
+def main():
+    #---------------------------------------------------------------------------#
+    # Parse inputs
+    #---------------------------------------------------------------------------#
+    parser = argparse.ArgumentParser(description="""
+    The purpose of this script is to generate heatmaps from an input virID
+    or PathSeq aggregated hit table.
+    """)
+
+    parser.add_argument(
+        "-i",
+        "--input_df",
+        type=str,
+        required=True,
+        help='''Path to the input hit table.''',
+    )
+    parser.add_argument(
+        "-f",
+        "--input_format",
+        type=str,
+        required=True,
+        help='''Format of the infile.. Options are "virID" or "pathseq".''',
+    )
+    parser.add_argument(
+        "-o",
+        "--output_prefix",
+        type=str,
+        required=True,
+        help='''Prefix/path to the output heatmaps.''',
+    )
+    parser.add_argument(
+        "-t",
+        "--TOP_NUMBER_OF_ROWS",
+        type=int,
+        required=True,
+        help='''Top number of taxa to display (based on mean abundance).''',
+    )
+    parser.add_argument(
+        "-r",
+        "--remove_suffix",
+        type=str,
+        required=False,
+        default="",
+        help='''A suffix to remove from the column names.''',
+    )
+    parser.add_argument(
+        "-F",
+        "--output_format",
+        type=str,
+        required=False,
+        default='pdf',
+        help='''
+        Format the output heatmaps be in. Options are "pdf", "svg",
+        "png", or any other matplotlib acceptable format.
+        ''',
+    )
+    parser.add_argument(
+        "-c",
+        "--cluster_samples",
+        type=str2bool,
+        required=False,
+        default=True,
+        help='''
+        Whether or not do heirarchecially cluster the samples (columns). True,
+        true, t, and similar iterations of False are acceptable inputs.
+        ''',
+    )
+    parser.add_argument(
+        "-C",
+        "--cluster_taxa",
+        type=str2bool,
+        required=False,
+        default=True,
+        help='''
+        Whether or not do heirarchecially cluster the taxa (rows). True, true,
+        t, and similar iterations of False are acceptable inputs.
+        ''',
+    )
+    parser.add_argument(
+        "-p",
+        "--processes",
+        type=int,
+        required=False,
+        default=1,
+        help='''
+        Number of processes to cluster and draw the heatmaps with. <default: 1>
+        ''',
+    )
+    parser.add_argument(
+        "-R",
+        "--rasterize",
+        type=str,
+        required=False,
+        default="auto",
+        help='''
+        Whether to draw the heatmap cells as a single image rather than one
+        vector shape per cell, which keeps pdf and svg heatmaps of very wide
+        tables small and fast to render. "auto" rasterizes heatmaps with more
+        than {0} cells. True, true, t, and similar iterations of False are
+        also acceptable inputs. <default: auto>
+        '''.format(RASTERIZE_ABOVE),
+    )
+
+    args = parser.parse_args()
+    input_df = args.input_df
+    input_format = args.input_format
+    output_prefix = args.output_prefix
+    TOP_NUMBER_OF_ROWS = args.TOP_NUMBER_OF_ROWS
+    remove_suffix = args.remove_suffix
+    output_format = args.output_format
+    cluster_samples=args.cluster_samples
+    cluster_taxa=args.cluster_taxa
+    processes = args.processes
+    rasterize = None if args.rasterize == "auto" else str2bool(args.rasterize)
+
+    #------------------------------------------------------------------------------#
+    # Setting defaults
+    #------------------------------------------------------------------------------#
+    print("Starting pyscript.")
+    print("Detected an input format of {0}".format(input_format))
+    if input_format.lower() == "pathseq":
+        non_sample_cols = ["tax_id", "taxonomy", "type", "name", "kingdom", "reference_length"]
+        taxonID = 'tax_id'
+        lineage = 'taxonomy'
+        level = 'type'
+        superkingdom = 'kingdom'
+        taxon = 'name'
+    elif input_format.lower() == "virid":
+        non_sample_cols = ["lineage", "superkingdom", "taxon", "level", "taxonID"]
+        taxonID = 'taxonID'
+        lineage = 'lineage'
+        level = 'level'
+        superkingdom = 'superkingdom'
+        taxon = 'taxon'
+    else:
+        raise ValueError("sample_format must be {0} or {1}".format("pathseq", "virID"))
+
+    # will use one column as the input index. Need to remove from non_sample_cols
+    index_col = taxon
+    non_sample_cols.remove(index_col)
+
+    # import data
+    print("Importing data.")
+    df = pd.read_csv(input_df, sep="\t", index_col = False).set_index(index_col)
+
+    # Remove suffix's if necessary
+    df.columns = [column.replace(remove_suffix, "") for column in df.columns.to_list()]
+
+    # if format is pathseq, rename 'kingdom' to 'superkingdom' and 'type' to 'level'
+    if input_format == "pathseq":
+        df = df.rename({'kingdom':'superkingdom', 'type':'level'}, axis='columns')
+        non_sample_cols = ['superkingdom' if item == 'kingdom' else item for item in non_sample_cols]
+        non_sample_cols = ['level' if item == 'type' else item for item in non_sample_cols]
+
+    # Select the data of every heatmap in one pass
+    print("Generating heatmaps.")
+    prepared = prepare_panels(df, non_sample_cols, PANELS, TOP_NUMBER_OF_ROWS)
+
+    # Make output dir if needed
+    output_directory = os.path.dirname(output_prefix)
+    pathlib.Path(output_directory).mkdir(parents=True, exist_ok=True)
+
+    pool = None
+    if processes > 1:
+        pool = multiprocessing.get_context("fork").Pool(processes)
+    try:
+        # Cluster each distinct matrix once
+        linkages = compute_linkages(prepared, cluster_samples, cluster_taxa, pool)
+
+        # Write heatmaps to output
+        print("Writing heatmaps.")
+        jobs = []
+        for name, level, superkingdom in PANELS:
+            if prepared[name] == None:
+                continue
+            values, superkingdoms = prepared[name]
+            row_linkage, col_linkage = linkages[name]
+            jobs.append((values, superkingdoms, row_linkage, col_linkage, rasterize,
+                         output_prefix + "_" + name + "." + output_format))
+        if pool != None:
+            pool.map(render_heatmap, jobs, chunksize=1)
+        else:
+            for job in jobs:
+                render_heatmap(job)
+    finally:
+        if pool != None:
+            pool.close()
+            pool.join()
+
+    print("Finished.")
+
+if __name__ == '__main__':
+    main()
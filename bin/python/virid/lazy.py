@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Module-level handles that are only created when first used.
+
+The scripts look the taxonomy, lineage table and LCA engine up through module
+globals. Making those globals LazyHandles means importing a script (or
+running a subcommand of the virid CLI that doesn't need the taxonomy) no
+longer pays for loading it:
+
+    taxonomy = LazyHandle(TaxonomyIndex.load)
+    taxonomy.get_rank(9606)     # loads the taxonomy, then calls get_rank
+
+Code that forks worker processes calls resolve() first, so the workers share
+the loaded object instead of each loading their own.
+"""
+
+class LazyHandle(object):
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._value = None
+
+    def resolve(self):
+        """ Returns the object, creating it on the first call. """
+        if self._value is None:
+            self._value = self._factory()
+        return self._value
+
+    @property
+    def resolved(self):
+        return self._value is not None
+
+    def __getattr__(self, name):
+        # Only called for attributes the handle itself doesn't have
+        return getattr(self.resolve(), name)
+
+    def __repr__(self):
+        if self._value is None:
+            return "<LazyHandle, not loaded>"
+        return "<LazyHandle of " + repr(self._value) + ">"
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Lowest common ancestor (LCA) lookups over the whole NCBI taxonomy.
+
+LCAEngine is built once per run from a TaxonomyIndex using binary lifting:
+up[k][taxonID] holds the ancestor 2**k levels above taxonID. A pairwise LCA
+then takes O(log depth) array lookups, and the LCA of many taxonIDs is a fold
+of the pairwise LCA. lca_batch() does the fold for many groups of taxonIDs at
+once with numpy, so no tree objects are built per query. LCACache memoizes
+the LCA and formatted lineage of sets of taxonIDs that come up repeatedly.
+
+Like the anytree implementation this replaces, taxonIDs that can't be found in
+the taxonomy are treated as direct children of the root, and merged taxonIDs
+are resolved to their current taxonID.
+"""
+
+import os
+import pathlib
+from collections import OrderedDict
+import numpy as np
+
+# Name of the (levels, n) lifting table in a taxonomy snapshot (see virid_taxdb.py)
+SNAPSHOT_UP = "lca_engine.up"
+
+class LCAEngine(object):
+
+    def __init__(self, taxonomy):
+        self.taxonomy = taxonomy
+        self.depth = taxonomy.depth
+
+        self.root = int(np.flatnonzero(taxonomy.parent == 0)[0])
+
+        # Taxonomy snapshots can include the lifting table
+        if SNAPSHOT_UP in taxonomy.snapshot_arrays:
+            self.up = list(taxonomy.snapshot_arrays[SNAPSHOT_UP])
+            return
+
+        # The root (and any absent taxonID) is its own parent, so lifting past
+        # the root stays at the root.
+        parent = taxonomy.parent.astype(np.int32)
+        taxonIDs = np.arange(len(parent), dtype=np.int32)
+        self_parent = parent <= 0
+        parent[self_parent] = taxonIDs[self_parent]
+
+        n_levels = max(1, int(self.depth.max()).bit_length())
+        self.up = [parent]
+        for k in range(1, n_levels):
+            previous = self.up[-1]
+            self.up.append(previous[previous])
+
+    def _lift(self, taxonID, distance):
+        """ Returns the ancestor distance levels above taxonID. """
+        k = 0
+        while distance > 0:
+            if distance & 1:
+                taxonID = int(self.up[k][taxonID])
+            distance >>= 1
+            k += 1
+        return taxonID
+
+    def lca(self, taxonID_1, taxonID_2):
+        """ Returns the LCA of two taxonIDs. """
+        a = self.taxonomy.translate(taxonID_1)
+        b = self.taxonomy.translate(taxonID_2)
+
+        # Unknown taxonIDs hang directly off the root
+        if a is None or b is None:
+            if int(taxonID_1) == int(taxonID_2):
+                return int(taxonID_1)
+            return self.root
+
+        if self.depth[a] < self.depth[b]:
+            a, b = b, a
+        a = self._lift(a, int(self.depth[a]) - int(self.depth[b]))
+        if a == b:
+            return a
+
+        for k in range(len(self.up) - 1, -1, -1):
+            if self.up[k][a] != self.up[k][b]:
+                a = int(self.up[k][a])
+                b = int(self.up[k][b])
+        return int(self.up[0][a])
+
+    def lca_of(self, taxonIDs):
+        """ Returns the LCA of a list of taxonIDs, folding the pairwise LCA. """
+        if len(taxonIDs) == 1:
+            return taxonIDs[0]
+
+        LCA_taxonID = taxonIDs[0]
+        for taxonID in taxonIDs[1:]:
+            LCA_taxonID = self.lca(LCA_taxonID, taxonID)
+        return LCA_taxonID
+
+    def lca_arrays(self, a, b):
+        """
+        Vectorized pairwise LCA of two equal-length arrays of current taxonIDs
+        (as returned by TaxonomyIndex.translate_array). Positions where either
+        taxonID is -1 (unknown) get the root.
+        """
+        a = np.asarray(a, dtype=np.int32)
+        b = np.asarray(b, dtype=np.int32)
+        unknown = (a < 0) | (b < 0)
+        a = np.where(unknown, self.root, a)
+        b = np.where(unknown, self.root, b)
+
+        # Make a the deeper of each pair, then lift it to the depth of b
+        swap = self.depth[a] < self.depth[b]
+        a, b = np.where(swap, b, a), np.where(swap, a, b)
+        distance = (self.depth[a] - self.depth[b]).astype(np.int32)
+        for k in range(len(self.up)):
+            lift = (distance >> k) & 1 == 1
+            a[lift] = self.up[k][a[lift]]
+
+        # Lift both until just below their LCA
+        for k in range(len(self.up) - 1, -1, -1):
+            differ = self.up[k][a] != self.up[k][b]
+            a[differ] = self.up[k][a[differ]]
+            b[differ] = self.up[k][b[differ]]
+
+        result = np.where(a == b, a, self.up[0][a])
+        result[unknown] = self.root
+        return result
+
+    def lca_batch(self, taxonID_groups):
+        """
+        Takes a list of lists of taxonIDs and returns a list with the LCA of
+        each group. A group with a single taxonID returns that taxonID as is.
+        """
+        if len(taxonID_groups) == 0:
+            return []
+
+        lengths = np.array([len(group) for group in taxonID_groups], dtype=np.int64)
+        if (lengths == 0).any():
+            raise ValueError("Cannot find the LCA of an empty group of taxonIDs.")
+        offsets = np.zeros(len(lengths), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=offsets[1:])
+
+        flat = np.fromiter((int(taxonID) for group in taxonID_groups for taxonID in group),
+                           dtype=np.int64, count=int(lengths.sum()))
+        translated = self.taxonomy.translate_array(flat)
+
+        # Fold column by column over the groups that are long enough
+        current = translated[offsets]
+        for j in range(1, int(lengths.max())):
+            rows = np.flatnonzero(lengths > j)
+            current[rows] = self.lca_arrays(current[rows], translated[offsets[rows] + j])
+
+        # Groups that repeat a single taxonID (including singletons and
+        # unknown taxonIDs) keep their input taxonID
+        first = np.repeat(flat[offsets], lengths)
+        all_same = np.logical_and.reduceat(flat == first, offsets)
+        result = current.astype(np.int64)
+        result[all_same] = flat[offsets[all_same]]
+        return result.tolist()
+
+class LCACache(object):
+    """
+    Bounded least-recently-used cache of LCA results. Keys are frozensets of
+    the taxonIDs of a query that passed filtration, and values are
+    (LCA_taxonID, cannonical_lineage) tuples, where cannonical_lineage is the
+    list of formatted lineage fields written to the output.
+
+    In read mode the same sets of hit taxonIDs come up for many reads, so most
+    queries can skip both the LCA lookup and lineage formatting. The cache can
+    be saved to a file and loaded by later runs; the file records the
+    fingerprint of the taxonomy it was built with and is ignored if the
+    taxonomy has changed.
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """ Returns the cached value for key, or None. """
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def report(self):
+        total = self.hits + self.misses
+        hit_rate = 100.0 * self.hits / total if total > 0 else 0.0
+        return "LCA cache hits: {0}, misses: {1} ({2:.1f}% hit rate), entries: {3}".format(
+            self.hits, self.misses, hit_rate, len(self.entries))
+
+    def save(self, cache_path, fingerprint):
+        """
+        Writes the cache as a tab-delimited file. The first line holds the
+        taxonomy fingerprint, then each line is <comma-delimited taxonIDs>
+        <LCA_taxonID> <cannonical lineage fields...>, least recently used first.
+        """
+        cache_directory = os.path.dirname(cache_path)
+        pathlib.Path(cache_directory).mkdir(parents=True, exist_ok=True)
+
+        temporary_path = cache_path + "." + str(os.getpid()) + ".tmp"
+        with open(temporary_path, "w") as outfile:
+            outfile.write("#taxonomy\t" + fingerprint + "\n")
+            for key, (LCA_taxonID, cannonical_lineage) in self.entries.items():
+                fields = [",".join(str(taxonID) for taxonID in sorted(key)), str(LCA_taxonID)]
+                fields.extend(str(item) for item in cannonical_lineage)
+                outfile.write("\t".join(fields) + "\n")
+        os.replace(temporary_path, cache_path)
+
+    def load(self, cache_path, fingerprint):
+        """
+        Loads entries saved by save(). Returns the number of entries loaded,
+        which is 0 if the file doesn't exist or was made with another taxonomy.
+        """
+        if not os.path.exists(cache_path):
+            return 0
+
+        with open(cache_path) as infile:
+            first_line = infile.readline().rstrip("\n").split("\t")
+            if first_line != ["#taxonomy", fingerprint]:
+                print("The LCA cache " + cache_path + " was made with a different " +
+                      "taxonomy, so ignoring it.")
+                return 0
+
+            loaded = 0
+            for line in infile:
+                fields = line.rstrip("\n").split("\t")
+                key = frozenset(int(taxonID) for taxonID in fields[0].split(","))
+                self.put(key, (int(fields[1]), fields[2:]))
+                loaded += 1
+
+        return loaded
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Materialized cannonical lineages of every taxonID, shared by get_LCA.py,
+get_counts.py and merge_and_postprocess.py.
+
+For each taxonID the table holds its cannonical rank vector - the taxonID of
+its superkingdom, kingdom, phylum, class, order, family, genus, species and
+strain (0 where the lineage has no taxon of that rank) - stored column by
+column in a (9, n) int32 array with a column per taxonID of the taxonomy.
+The taxonIDs of the columns are kept in a sorted array, so a lookup is a
+binary search followed by a gather, and unused taxonIDs take no space.
+Merged taxonIDs are looked up through a copy of the merged table. The prefixed name of every taxon at a
+cannonical rank (e.g. 's__Human_alphaherpesvirus_1') is kept in a single UTF-8
+blob sliced by offset, with the taxonIDs that have a name in a sorted array
+alongside. Rendering the lineage columns of many taxonIDs is then an array
+gather instead of a walk of each lineage with rank and name lookups.
+
+The table is built from a TaxonomyIndex once and saved as a compressed .npz
+file next to the ETE3 database. Later runs load the file, and rebuild it if it was made
+with a different taxonomy. build_lineage_table.py builds it ahead of time.
+Taxonomy snapshots built by virid_taxdb.py include the table, in which case
+it is memory-mapped along with the rest of the snapshot.
+"""
+
+import os
+from collections import OrderedDict
+import numpy as np
+
+from .taxonomy_index import DEFAULT_ETE3_SQLITE
+
+DEFAULT_LINEAGE_TABLE = os.path.join(os.path.dirname(DEFAULT_ETE3_SQLITE), "virID_lineages.npz")
+
+# Bump when the layout of the saved table changes
+LINEAGE_TABLE_VERSION = 2
+
+# Prefix of the table's arrays in a taxonomy snapshot (see virid_taxdb.py)
+SNAPSHOT_PREFIX = "lineage_table."
+
+CANNONICAL_PREFIXES = OrderedDict([
+    ('superkingdom', 'sk__'),
+    ('kingdom', 'k__'),
+    ('phylum', 'p__'),
+    ('class', 'c__'),
+    ('order', 'o__'),
+    ('family', 'f__'),
+    ('genus', 'g__'),
+    ('species', 's__'),
+    ('strain', 'st__')
+])
+
+# Tables returned by LineageTable.load(), by (path, taxonomy fingerprint)
+loaded_tables = dict()
+
+class LineageTable(object):
+
+    def __init__(self, taxonIDs, lineage, irregular, merged_old, merged_new,
+                 name_taxonIDs, name_offsets, name_blob, fingerprint):
+        # Sorted taxonIDs of the columns of lineage
+        self.taxonIDs = taxonIDs
+        # lineage[i][column] is the taxonID of the i-th cannonical rank
+        self.lineage = lineage
+        # True where the cannonical taxa of the lineage are not in rank order
+        # or repeat a rank, so the rank vector can't reproduce the full
+        # ordered list of cannonical taxa.
+        self.irregular = irregular
+        self.merged_old = merged_old
+        self.merged_new = merged_new
+        self.name_taxonIDs = name_taxonIDs
+        self.name_offsets = name_offsets
+        self.name_blob = name_blob
+        self.fingerprint = fingerprint
+        self.ranks = list(CANNONICAL_PREFIXES.keys())
+
+    #--------------------------------------------------------------------------#
+    # Construction
+    #--------------------------------------------------------------------------#
+    @classmethod
+    def build(cls, taxonomy):
+        """ Builds the table from a TaxonomyIndex. """
+        ranks = list(CANNONICAL_PREFIXES.keys())
+        size = taxonomy.max_taxonID + 1
+
+        # Position of each rank code in the cannonical ranks, -1 if not cannonical
+        rank_position = np.array([ranks.index(rank) if rank in ranks else -1
+                                  for rank in taxonomy.ranks], dtype=np.int8)
+
+        lineage = np.zeros((len(ranks), size), dtype=np.int32)
+        irregular = np.zeros(size, dtype=bool)
+        last_position = np.full(size, -1, dtype=np.int8)
+
+        # Walk down the tree one depth at a time, copying each node's rank
+        # vector from its parent and then filling in its own rank.
+        for depth, nodes in enumerate(taxonomy.nodes_by_depth()):
+            if depth > 0:
+                parents = taxonomy.parent[nodes]
+                lineage[:, nodes] = lineage[:, parents]
+                irregular[nodes] = irregular[parents]
+                last_position[nodes] = last_position[parents]
+
+            positions = rank_position[taxonomy.rank_codes[nodes]]
+            cannonical = positions >= 0
+            nodes = nodes[cannonical]
+            positions = positions[cannonical]
+
+            irregular[nodes] |= positions <= last_position[nodes]
+            last_position[nodes] = np.maximum(last_position[nodes], positions)
+
+            # The highest taxon of a rank wins, as in get_cannonical_lineage
+            first = lineage[positions, nodes] == 0
+            lineage[positions[first], nodes[first]] = nodes[first]
+
+        # Prefixed names of the taxa at cannonical ranks
+        positions = np.full(size, -1, dtype=np.int8)
+        present = taxonomy.parent != -1
+        positions[present] = rank_position[taxonomy.rank_codes[present]]
+        name_taxonIDs = np.flatnonzero(positions >= 0).astype(np.int32)
+
+        prefixes = [prefix.encode("utf-8") for prefix in CANNONICAL_PREFIXES.values()]
+        taxonomy_blob = bytes(taxonomy.name_blob).replace(b" ", b"_")
+        names = []
+        for taxonID in name_taxonIDs.tolist():
+            start = taxonomy.name_offsets[taxonID]
+            end = taxonomy.name_offsets[taxonID + 1]
+            names.append(prefixes[positions[taxonID]] + taxonomy_blob[start:end])
+
+        name_offsets = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum([len(name) for name in names], out=name_offsets[1:])
+        name_blob = np.frombuffer(b"".join(names), dtype=np.uint8)
+
+        # Keep the merged taxonIDs that aren't also current taxonIDs
+        merged = np.ones(len(taxonomy.merged_old), dtype=bool)
+        in_range = taxonomy.merged_old < size
+        merged[in_range] = ~present[taxonomy.merged_old[in_range]]
+
+        # Keep the columns of the taxonIDs in the taxonomy
+        taxonIDs = np.flatnonzero(present).astype(np.int32)
+        return cls(taxonIDs, np.ascontiguousarray(lineage[:, taxonIDs]), irregular[taxonIDs],
+                   taxonomy.merged_old[merged], taxonomy.merged_new[merged],
+                   name_taxonIDs, name_offsets, name_blob, taxonomy.fingerprint)
+
+    def to_arrays(self, prefix=""):
+        """ Returns a dictionary of the table's arrays, with names prefixed by prefix. """
+        arrays = {
+            'taxonIDs': self.taxonIDs,
+            'lineage': self.lineage,
+            'irregular': self.irregular,
+            'merged_old': self.merged_old,
+            'merged_new': self.merged_new,
+            'name_taxonIDs': self.name_taxonIDs,
+            'name_offsets': self.name_offsets,
+            'name_blob': self.name_blob
+        }
+        return {prefix + name: array for name, array in arrays.items()}
+
+    @classmethod
+    def from_arrays(cls, arrays, fingerprint, prefix=""):
+        return cls(arrays[prefix + 'taxonIDs'],
+                   arrays[prefix + 'lineage'], arrays[prefix + 'irregular'],
+                   arrays[prefix + 'merged_old'], arrays[prefix + 'merged_new'],
+                   arrays[prefix + 'name_taxonIDs'], arrays[prefix + 'name_offsets'],
+                   arrays[prefix + 'name_blob'], fingerprint)
+
+    def save(self, path):
+        """ Writes the table to a .npz file, replacing any existing file. """
+        directory = os.path.dirname(path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+
+        # Write to a temporary file first so concurrent runs never see a
+        # partially written table.
+        temporary_path = path + "." + str(os.getpid()) + ".tmp.npz"
+        np.savez_compressed(temporary_path,
+                 fingerprint=np.array(self.fingerprint),
+                 version=np.array(LINEAGE_TABLE_VERSION),
+                 ranks=np.array(self.ranks),
+                 **self.to_arrays())
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def from_file(cls, path):
+        with np.load(path) as data:
+            if not 'version' in data.files or int(data['version']) != LINEAGE_TABLE_VERSION:
+                raise ValueError("The lineage table " + path + " was made by a " +
+                                 "different version of virID.")
+            return cls.from_arrays(data, str(data['fingerprint']))
+
+    @classmethod
+    def load(cls, taxonomy, path=DEFAULT_LINEAGE_TABLE):
+        """
+        Loads the table for taxonomy from path. If the file doesn't exist or
+        was built from a different taxonomy, the table is rebuilt and saved.
+        If taxonomy is a snapshot that includes the table, it is used instead.
+        Repeated calls for the same taxonomy return the same table.
+        """
+        key = (path, taxonomy.fingerprint)
+        if not key in loaded_tables:
+            loaded_tables[key] = cls._load(taxonomy, path)
+        return loaded_tables[key]
+
+    @classmethod
+    def _load(cls, taxonomy, path):
+        # Snapshots made before the table was keyed by taxonID don't have it
+        if SNAPSHOT_PREFIX + 'taxonIDs' in taxonomy.snapshot_arrays:
+            return cls.from_arrays(taxonomy.snapshot_arrays, taxonomy.fingerprint,
+                                   SNAPSHOT_PREFIX)
+
+        if os.path.exists(path):
+            try:
+                table = cls.from_file(path)
+                if table.fingerprint == taxonomy.fingerprint:
+                    return table
+                print("The lineage table " + path + " was made with a different " +
+                      "taxonomy, so rebuilding it.")
+            except ValueError as error:
+                print(str(error) + " Rebuilding it.")
+
+        table = cls.build(taxonomy)
+        try:
+            table.save(path)
+        except OSError:
+            print("Could not save the lineage table to " + path)
+        return table
+
+    #--------------------------------------------------------------------------#
+    # Lookups
+    #--------------------------------------------------------------------------#
+    def _columns(self, taxonIDs):
+        """ Returns the column of each taxonID in the lineage array, or -1. """
+        columns = np.full(len(taxonIDs), -1, dtype=np.int64)
+        if len(self.taxonIDs) == 0:
+            return columns
+        positions = np.minimum(np.searchsorted(self.taxonIDs, taxonIDs), len(self.taxonIDs) - 1)
+        found = self.taxonIDs[positions] == taxonIDs
+        columns[found] = positions[found]
+        return columns
+
+    def _rows(self, taxonIDs):
+        """
+        Returns the column of the lineage array for each taxonID, following the
+        merged table, with -1 for taxonIDs that can't be found.
+        """
+        taxonIDs = np.asarray(taxonIDs, dtype=np.int64)
+        rows = self._columns(taxonIDs)
+
+        # Merged taxonIDs aren't in the taxonomy, so only look up those missing
+        missing = np.flatnonzero(rows == -1)
+        if len(missing) > 0 and len(self.merged_old) > 0:
+            positions = np.searchsorted(self.merged_old, taxonIDs[missing])
+            positions = np.minimum(positions, len(self.merged_old) - 1)
+            found = self.merged_old[positions] == taxonIDs[missing]
+            rows[missing[found]] = self._columns(self.merged_new[positions[found]].astype(np.int64))
+        return rows
+
+    def get_prefixed_name(self, taxonID):
+        """
+        Prefixed name of a taxonID at a cannonical rank, e.g. 'g__Simplexvirus'.
+        Returns None if the taxonID isn't at a cannonical rank.
+        """
+        position = np.searchsorted(self.name_taxonIDs, int(taxonID))
+        if position == len(self.name_taxonIDs) or self.name_taxonIDs[position] != int(taxonID):
+            return None
+        start = self.name_offsets[position]
+        end = self.name_offsets[position + 1]
+        return bytes(self.name_blob[start:end]).decode("utf-8")
+
+    def get_rank_vectors(self, taxonIDs, ranks=None):
+        """
+        Returns a (len(ranks), len(taxonIDs)) array with the cannonical taxonIDs
+        of each taxonID, 0 where the lineage has no taxon of that rank or the
+        taxonID is unknown. ranks defaults to all cannonical ranks.
+        """
+        if ranks == None:
+            levels = np.arange(len(self.ranks))
+        else:
+            levels = np.array([self.ranks.index(rank) for rank in ranks], dtype=np.int64)
+
+        rows = self._rows(taxonIDs)
+        found = rows >= 0
+        vectors = np.zeros((len(levels), len(rows)), dtype=np.int32)
+        vectors[:, found] = self.lineage[levels[:, None], rows[found]]
+        return vectors
+
+    def get_cannonical_lineages(self, taxonIDs, ranks=None):
+        """
+        Takes a list of taxonIDs and returns, for each, a list with the prefixed
+        name of its taxon at each of ranks, or 0 where there is none.
+        """
+        vectors = self.get_rank_vectors(taxonIDs, ranks)
+
+        # Decode each distinct taxon name once
+        names = {0: 0}
+        for taxonID in np.unique(vectors).tolist():
+            if taxonID != 0:
+                names[taxonID] = self.get_prefixed_name(taxonID)
+
+        return [[names[taxonID] for taxonID in column]
+                for column in vectors.T.tolist()]
+
+    def get_named_lineage(self, taxonID):
+        """
+        Returns the prefixed names of the cannonical taxa in the lineage of
+        taxonID, from the highest rank down. Returns None if the taxonID is
+        irregular (see __init__), in which case the lineage has to be walked.
+        """
+        row = self._rows([taxonID])[0]
+        if row == -1:
+            return []
+        if self.irregular[row]:
+            return None
+        return [self.get_prefixed_name(taxon)
+                for taxon in self.lineage[:, row].tolist() if taxon != 0]
+
+    def get_named_lineages(self, taxonIDs):
+        """
+        Vectorized get_named_lineage(). Takes a list of taxonIDs and returns a
+        list with the named lineage of each, or None for irregular taxonIDs.
+        """
+        rows = self._rows(taxonIDs)
+        found = rows >= 0
+        vectors = np.zeros((len(self.ranks), len(rows)), dtype=np.int32)
+        vectors[:, found] = self.lineage[:, rows[found]]
+        irregular = np.zeros(len(rows), dtype=bool)
+        irregular[found] = self.irregular[rows[found]]
+
+        # Decode each distinct taxon name once
+        names = dict()
+        for taxonID in np.unique(vectors).tolist():
+            if taxonID != 0:
+                names[taxonID] = self.get_prefixed_name(taxonID)
+
+        return [None if is_irregular else [names[taxon] for taxon in column if taxon != 0]
+                for column, is_irregular in zip(vectors.T.tolist(), irregular.tolist())]
@@ -0,0 +1,724 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Apr  1 18:40:13 2019
+
+@author: jnom
+"""
+#------------------------------------------------------------------------------#
+# Import packages
+#------------------------------------------------------------------------------#
+import pandas as pd
+import inspect
+import argparse
+import time
+import os
+import pathlib
+from .taxonomy_index import TaxonomyIndex
+from .lazy import LazyHandle
+taxonomy = LazyHandle(TaxonomyIndex.load)
+from .lineage_table import LineageTable, CANNONICAL_PREFIXES
+lineage_table = LazyHandle(lambda: LineageTable.load(taxonomy.resolve()))
+from .compressed_io import open_input, open_output
+import numpy as np
+import csv
+import sys
+
+# Lets input feilds be extremely large.
+csv.field_size_limit(sys.maxsize)
+
+"""
+This script has functions to do the following
+
+    1) Add unmarked contig-names to the BLASTN/DIAMOND
+       LCA outputs:
+           get_headers_from_fasta()
+           mark_unassigned_sequences()
+
+    2) Add counts information to the BLASTN/DIAMOND files:
+           make_counts_dictinoary_from_counts_file()
+           add_read_counts_to_dataframe
+
+    ** The functions above can all be called with
+       add_unassigned_and_counts_to_dataframe()
+
+
+    3) Merge DIAMOND/BLASTN LCA dataframes
+            merge_dataframes()
+
+"""
+#------------------------------------------------------------------------------#
+# Defining Functions
+#------------------------------------------------------------------------------#
+#Taxonomy functions
+def get_level(taxonID):
+    level = taxonomy.get_rank(taxonID)
+
+    #Unknown taxonID yields None
+    if level == None:
+        level = "UNKNOWN"
+    return level
+
+def get_name(taxonID):
+    name = taxonomy.get_name(taxonID)
+
+    #Unknown taxonID yields None
+    if name == None:
+        name = "UNKNOWN"
+
+    name = name.replace(" ", "_")
+    return name
+
+def get_lineage(taxonID):
+    try:
+        lineage = taxonomy.get_lineage(taxonID)
+    except ValueError:
+        print("Cannot find taxonID " + str(taxonID))
+        lineage = [taxonID]
+    if lineage == None:
+        lineage = [0]
+
+    return lineage
+
+def get_named_lineage_from_lineage(lineage, prefix_dictionary =
+                                {'strain': 'st__',
+                                'species': 's__',
+                                'genus': 'g__',
+                                'family': 'f__',
+                                'order': 'o__',
+                                'class': 'c__',
+                                'phylum': 'p__',
+                                'kingdom': 'k__',
+                                'superkingdom': 'sk__'}
+):
+
+    named_lineage = []
+
+    # The lineage table holds the prefixed names of taxa at cannonical levels
+    use_lineage_table = prefix_dictionary == CANNONICAL_PREFIXES
+
+    for taxonID in lineage:
+        name = None
+        if use_lineage_table:
+            name = lineage_table.get_prefixed_name(taxonID)
+        if name == None:
+            level = get_level(taxonID)
+            prefix = prefix_dictionary.get(level, 'UNKNOWN__')
+            name = prefix + get_name(taxonID)
+        named_lineage.append(name)
+
+    return named_lineage
+
+
+def write_to_log(log_file, message):
+
+    current_date_time = time.strftime("%c")
+
+    #if the log_file wasn't input, just print message to screen
+    if log_file == '':
+        print(message)
+        print(current_date_time)
+        return None
+
+    #Check if the file exists. If not, make the directory if necessary
+    log_file_directory = os.path.dirname(log_file)
+    pathlib.Path(log_file_directory).mkdir(parents=True, exist_ok=True)
+
+    #Open the log_file in append mode and write message to it
+    with open(log_file, 'a') as infile:
+        infile.write(message + '\n')
+        infile.write(current_date_time + '\n')
+
+def read_data_file(input_data_file, sep = '\t', column_names = ''):
+    """
+    This function reads in a tab-delimited file and assigns the column names appropriately.
+    If column names are provided they're used, else it uses the first line of the file as the header.
+    column_names is a string that is a space-delimited list.
+    """
+
+    #State progress
+    function_name = inspect.stack()[0][3]
+    print(function_name + ': Reading the input file ' + input_data_file)
+
+    #Main
+    with open_input(input_data_file) as infile:
+        if column_names == '':
+            DF = pd.read_csv(infile, engine = 'python', sep = sep, header = 0).fillna(0)
+        else:
+            DF = pd.read_csv(infile, engine = 'python', sep = sep, header = None).fillna(0)
+            DF.columns = column_names.split(" ")
+
+    #Make sure the LCA_taxonID column is the correct datatype
+    DF['LCA_taxonID'] = DF['LCA_taxonID'].astype(int)
+
+    print(function_name + ': Finished.')
+
+    return DF
+
+def get_headers_from_fasta(input_fasta):
+    '''
+    The purpose of this function is to read a fasta and extract an ordered list of fasta headers.
+
+    #Input:
+    # - <input_fasta> - Path to the fasta file to be read
+
+    #Output:
+    # - <headers> - A list of read headers
+    '''
+
+    #State progress
+    function_name = inspect.stack()[0][3]
+    print(function_name + ": Reading fasta headers from " + input_fasta)
+
+    #Main
+    headers = []
+    with open_input(input_fasta) as infile:
+        for line in infile:
+            if line.startswith(">"):
+                header = line.rstrip('\n')[1:]
+                headers.append(header)
+
+    #Make sure the headers are all unique
+    if len(headers) != len(set(headers)):
+        raise ValueError(function_name + ": The headers of the fasta are not all unique.")
+
+    print(function_name + ': Finished.')
+
+    return headers
+
+def mark_unassigned_sequences(input_DF, headers):
+    '''
+    The purpose of this function is to determine which contigs are missing in the input_DF. input_DF must have a column
+    called 'query_ID' and a column named 'superkingdom'. Headers is a list of fasta read headers.
+    '''
+
+    def column_names_in_DF(input_DF, required_column_names):
+        '''
+        The purpose of this function is to determine if each column name in a list of required_column_names
+        is present in the input_DF.
+
+        #Input:
+        # - input_DF - an input DF
+        # - required_column_names - a list of column names that are required
+
+        #Output:
+        # - True if the required column names are in the input_DF, false if not.
+        '''
+        output = True
+        for column_name in required_column_names:
+            if column_name not in input_DF.columns:
+                output = False
+        return output
+
+    #State progress
+    function_name = inspect.stack()[0][3]
+    print(function_name + ': Writing a new dataframe that contains contigs that were not assigned.')
+
+    #Make sure input_DF has a column named 'query_ID' and 'superkingdom'
+    if not column_names_in_DF(input_DF, ['query_ID', 'superkingdom']):
+        raise ValueError(function_name + ": The column names 'query_ID' and 'superkingdom' are required.")
+
+    #Make sure the query_IDs present in the input_DF are unique.
+    if not input_DF['query_ID'].is_unique:
+        raise ValueError(function_name + ": The query_ID's present in the input_DF are not unique.")
+
+    #Reindex the input_DF against the headers, so it has one row per header in
+    #header order. Headers that aren't in the input_DF get an empty row. The
+    #columns are made object dtype first so the empty rows don't turn integer
+    #columns into floats.
+    output_DF = input_DF.astype(object).set_index('query_ID', drop = False).reindex(headers)
+    unassigned = output_DF['query_ID'].isnull().values
+    output_DF['query_ID'] = headers
+    output_DF.loc[unassigned, 'superkingdom'] = 'UNASSIGNED'
+    output_DF = output_DF.reset_index(drop = True)
+
+    if len(output_DF) != len(headers):
+        raise ValueError(function_name + ": The length of the output dataframe is not equal to the length of the input contig name list. Something is wrong.")
+
+    print(function_name + ': Finished.')
+    return output_DF
+
+def make_counts_dictionary_from_counts_file(counts_file, sep = '\t'):
+    """
+    The purpose of this function is to read in a counts file and make it a dictionary.
+    The structure of the counts file must be a two column file with
+    'query_ID' and 'counts' as the columns. There should be no colnames in the file.
+    """
+
+    #State progress
+    function_name = inspect.stack()[0][3]
+    print(function_name + ': Reading in the counts file to make a counts dictionary.')
+
+    counts_dictionary = dict()
+    with open_input(counts_file) as infile:
+        for line in infile:
+            line = line.split(sep)
+
+            if len(line) != 2:
+                raise ValueError(function_name + ": The counts_file should have two columns. Make sure the delimiter, sep, is correct.")
+
+            query_ID = line[0]
+            count = int(line[1])
+
+            if query_ID == '*':
+                continue
+
+            counts_dictionary[query_ID] = count
+
+    print(function_name + ': Finished.')
+    return counts_dictionary
+
+def add_read_counts_to_dataframe(input_DF, counts_dictionary):
+
+    '''
+    The purpose of this function is to add a column, labeled counts, to the input dataframe. This assumes that
+    the dictionary keys of the counts_dictionary are equal to values in the query_ID column of the input dataframe.
+    '''
+
+    #State progress
+    function_name = inspect.stack()[0][3]
+    print(function_name + ': Adding read counts to dataframe.')
+
+    #Make an output DF that is a copy of the input dataframe
+    output_DF = input_DF.copy()
+
+    #Get a list of query_IDs in the input_DF and make sure they are unique
+    output_DF_query_IDs = list(output_DF['query_ID'].unique())
+    if output_DF_query_IDs != list(output_DF['query_ID']):
+        raise ValueError(function_name + ": The query_ID's present in the input_DF are not unique.")
+
+    # If counts dictionary is empty, just set read_counts to 1 (assuming these are reads)
+    if counts_dictionary == '':
+        output_DF['read_count'] = 1
+        print(function_name + ' Did not detect a counts dictionary. Assuming this is reads.')
+        print(function_name + ': Finished.')
+        return output_DF
+
+    #Make sure there is a count for every entry in the input_DF
+    if set(output_DF_query_IDs) != set(counts_dictionary.keys()):
+        raise ValueError(function_name + "The contig names in the dataframe and those in the counts dictionary are not the same.")
+
+    #Add a read_count column to the input dataframe, looking up the counts of
+    #each query_ID
+    output_DF['read_count'] = output_DF['query_ID'].map(counts_dictionary).astype(int)
+
+    print(function_name + ': Finished.')
+    return output_DF
+
+def read_cov_file(input_data_file, sep = ' ', column_names = ''):
+    """
+    This function reads in a tab-delimited file and assigns the column names appropriately.
+    If column names are provided they're used, else it uses the first line of the file as the header.
+    column_names is a string that is a space-delimited list.
+    """
+
+    #State progress
+    function_name = inspect.stack()[0][3]
+    print(function_name + ': Reading the input file ' + input_data_file)
+
+    #Main
+    with open_input(input_data_file) as infile:
+        DF = pd.read_csv(infile, engine = 'python', sep = sep, header = None).fillna(0)
+    DF.columns = column_names.split(" ")
+
+    # Remove the existing headers
+    DF = DF.iloc[1:]
+
+    print(function_name + ': Finished.')
+
+    return DF
+
+def read_shared_inputs(contig_fasta, counts_file, contig_cov_file=''):
+    """
+    Reads the per-contig inputs that are shared by every classifier's results,
+    so they are parsed once however many result files are merged.
+
+    # INPUT:
+    # - [contig_fasta] - Path to the fasta containig all contigs.
+    # - [counts_file] - Path to the file containing counts for each contig, or ''.
+    # - [contig_cov_file] - Path to the contig coverage file, or ''.
+
+    # OUTPUT:
+    # - A tuple of (headers, counts_dictionary, cov_df). counts_dictionary is ''
+        and cov_df is None if the file wasn't given or is empty.
+    """
+
+    #get headers from fasta
+    headers = get_headers_from_fasta(contig_fasta)
+
+    # Make counts_dictionary from counts_file if it was added and has contents
+    if counts_file == '':
+        counts_dictionary = ''
+        print("Did not detect a counts file! Assuming these are reads.")
+    elif os.stat(counts_file).st_size == 0:
+        counts_dictionary = ''
+        print("WARN: Received a counts_file, but it is empty! Continuing without.")
+    else:
+        counts_dictionary = make_counts_dictionary_from_counts_file(counts_file)
+
+    # Read coverage info if it was added and has contents
+    if contig_cov_file == '':
+        print("Did not received a contig coverage file.")
+        cov_df = None
+    elif os.stat(contig_cov_file).st_size == 0:
+        print("WARN: Received a contig cov file, but it is empty. Continuing without.")
+        cov_df = None
+    else:
+        cov_df = read_cov_file(contig_cov_file, column_names = "query_ID average_fold covered_percent")
+
+    return headers, counts_dictionary, cov_df
+
+def format_taxonomy_inputs(contig_taxonomy_file, contig_fasta, counts_file, contig_cov_file='',
+                           shared_inputs=None):
+    """
+    The point of this function is to stitch together functions to add unassigned contigs, as well as contig counts
+    and contig coverage information, to the input contig_taxonomy_file.
+
+    # Function dependencies:
+    # - read_data_file
+    # - read_shared_inputs
+    # - mark_unassigned_sequences
+    # - add_read_counts_to_dataframe
+
+    # INPUT:
+    # - [contig_taxonomy_file] - Path to the contig_taxonomy_file for a given sample. This file must have a column named
+        query_ID and one named superkingdom. It is expected that the column names are in the first row.
+    # - [contig_fasta] - Path to the fasta containig all contigs.
+    # - [counts_file] - Path to the file containing counts for each contig. The structure of the counts file must be a two column file with
+        'query_ID' and 'counts' as the columns. There should be no colnames in the file.
+    # - [shared_inputs] - The output of read_shared_inputs(). If given, contig_fasta, counts_file and contig_cov_file
+        are not read again.
+
+    # OUTPUT:
+    # - output_DF - Contains a pandas dataframe of the input contig_taxonomy_file, but marks which contigs were
+        unassigned and gives each contig read counts
+    """
+
+    #read in contig_taxonomy file
+    raw_data = read_data_file(contig_taxonomy_file)
+
+    #get headers, counts and coverage
+    if shared_inputs == None:
+        shared_inputs = read_shared_inputs(contig_fasta, counts_file, contig_cov_file)
+    headers, counts_dictionary, cov_df = shared_inputs
+
+    #fill in the unassigned contigs
+    data = mark_unassigned_sequences(raw_data, headers)
+
+    # Add counts to the dataframe
+    data_with_counts = add_read_counts_to_dataframe(data, counts_dictionary)
+
+    # If coverage info was added and has contents, add it to the dataframe
+    if cov_df is None:
+        out_df = data_with_counts
+    else:
+        out_df = data_with_counts.merge(cov_df, how='outer')
+
+    return out_df
+
+
+def merge_dataframes(DF1, DF2, origins):
+    """
+    The purpose of this function is to take two DF's, merge them based on contents of the query_ID column.
+
+    # Input:
+    # - DF1, DF2 - Pandas dataframes containing contigs. 'query_ID' column is required. The contig names present
+                   in this column must be the same for each of the two dataframes
+    # - origins - A list of length two containing origins in the following structure - ['DF1_origin', 'DF2_origin'].
+                  An example input is ['BLASTN', 'DIAMOND'] if DF1 is from BLASTN and DF2 is from DIAMOND.
+
+    # Output:
+    # - A dataframe containing the contents of both input dataframes, ordered by query_ID.
+    """
+
+    #Make sure the origins list is of length two
+    if len(origins) != 2:
+        raise ValueError("merge_dataframes: origins variable must be a list of two objects.")
+
+    return merge_multiple_dataframes([DF1, DF2], origins)
+
+def merge_multiple_dataframes(DFs, origins):
+    """
+    Merges any number of DF's based on the contents of their query_ID column.
+
+    # Input:
+    # - DFs - A list of pandas dataframes containing contigs, e.g. one per classifier. 'query_ID' column is
+              required. The contig names present in this column must be the same for each of the dataframes.
+    # - origins - A list with the origin of each DF, e.g. ['megablast', 'DIAMOND'], which is written to the
+                  'origin' column.
+
+    # Output:
+    # - A dataframe with one row per contig and origin. Contigs are in the order of the first DF, and the rows
+        of each contig are in the order of DFs.
+    """
+
+    #State progress
+    function_name = inspect.stack()[0][3]
+    print(function_name + ': Merging dataframes.')
+
+    #Make sure there is an origin for each DF
+    if len(origins) != len(DFs) or len(DFs) == 0:
+        raise ValueError(function_name + ": There must be one origin for each of the input DFs.")
+
+    #Make copies of input DF's so I'm not mutating the inputs, and add the origin
+    DFs = [DF.assign(origin = origin) for DF, origin in zip(DFs, origins)]
+
+    #Make sure the input DF's are of the same length
+    if len(set([len(DF) for DF in DFs])) != 1:
+        raise ValueError(function_name + ": The input dataframes are not of the same length. Are all contigs \
+                         present in all of them?")
+
+    #make sure all input DF's have a query_ID column
+    for DF in DFs:
+        if 'query_ID' not in DF.columns:
+            raise ValueError(function_name + ": query_ID must be a column in all input DFs.")
+
+    # Find colnames. This funny business keeps a sensible colname order.
+    new_colnames = []
+    for DF in DFs:
+        for colname in DF.columns:
+            if colname not in new_colnames:
+                new_colnames.append(colname)
+
+    #Find a list of query_IDs
+    contigs = list(DFs[0]['query_ID'])
+    for DF in DFs:
+        if set(DF['query_ID']) != set(contigs):
+            raise ValueError(function_name + ": All DFs must have the same contig names. Is one DF missing contigs?")
+        if not DF['query_ID'].is_unique:
+            raise ValueError(function_name + ": Not all query_IDs are unique in one of the input DFs.")
+
+    #Line each DF up with the first by query_ID, then interleave the rows so
+    #each contig's rows follow each other in the order of DFs. Object dtype
+    #keeps the values as they are when a column is missing from one DF.
+    aligned = [DFs[0].astype(object).reindex(columns = new_colnames)]
+    for DF in DFs[1:]:
+        DF = DF.astype(object).set_index('query_ID', drop = False).reindex(contigs)
+        aligned.append(DF.reindex(columns = new_colnames))
+    out_DF = pd.concat(aligned, ignore_index = True)
+    order = np.arange(len(DFs) * len(contigs)).reshape(len(DFs), -1).T.ravel()
+    out_DF = out_DF.iloc[order].reset_index(drop = True)
+
+    print(function_name + ': Finished.')
+    return out_DF
+
+def read_contaminant_list(contaminant_file):
+    """
+    This function reads in a contaminant_file, which should consist of a single
+    column containing query_ID's.
+    """
+
+    # Check if contaminant file input or empty
+    if (contaminant_file == '') or (os.stat(contaminant_file).st_size == 0):
+        print("There are no input contaminants.")
+        return set()
+
+    contaminant_list = set()
+    with open_input(contaminant_file) as infile:
+        for line in infile:
+            if (len(line.split('/t')) > 1) or (len(line.split(',')) > 1):
+                raise ValueError("Contaminant file should be a single column of contaminating query_ID.")
+
+            contaminant_list.add(line.rstrip('\n'))
+
+    return contaminant_list
+
+def mark_contaminants(dataframe, contaminant_list):
+    """
+    This function checks each query_ID in the input dataframe to see if it is
+    in the contaminant_list (which is a set) and, if so, marks 1 on a new
+    column called 'possible_contaminant'.
+    """
+
+    # If there are no contaminants...
+    if contaminant_list == set():
+        return dataframe
+
+    out_df = dataframe.assign(possible_contaminant = [1 if query_ID in contaminant_list else 0 for query_ID in dataframe['query_ID']])
+
+    return out_df
+
+def write_output(output_DF, output_path, index=False):
+    #State progress
+    function_name = inspect.stack()[0][3]
+    print(function_name + ': Writing output to ' + output_path)
+
+    #Make the output directory if necessary
+    output_directory = os.path.dirname(output_path)
+    pathlib.Path(output_directory).mkdir(parents=True, exist_ok=True)
+
+    #Write the output file, compressed if its name ends in .gz, .bgz or .zst
+    with open_output(output_path) as outfile:
+        if index == False:
+            output_DF.to_csv(outfile, sep='\t', index=False)
+        elif index == True:
+            output_DF.to_csv(outfile, sep='\t', index=True)
+
+    print('write_output(): Finished.')
+
+
+#------------------------------------------------------------------------------#
+# Define and execute main
+#------------------------------------------------------------------------------#
+def main():
+
+    #---------------------------------------------------------------------------#
+    # Parse inputs
+    #---------------------------------------------------------------------------#
+    parser = argparse.ArgumentParser(description="""
+    The purpose of this script is to add more information to blast and diamond
+    taxonomy output files - it marks which sequences were not assigned, and
+    writes the read counts to each sequence - and to merge the blast and diamond
+    results into a joint dataframe.
+
+    Any number of classifier results can be merged by giving each with
+    --source origin=path, in addition to or instead of -t and -T. The contig
+    fasta, counts and coverage files are read once however many are given.
+    """)
+
+    parser.add_argument(
+        "-t",
+        "--BLASTN_contig_taxonomy_file",
+        type=str,
+        required=False,
+        default="",
+        help='''Path to the BLASTN get_LCA output file. Column names are read from
+        the first row of the file. A column named "query_ID" and one named
+        "superkingdom" are required.''',
+    )
+    parser.add_argument(
+        "-T",
+        "--DIAMOND_contig_taxonomy_file",
+        type=str,
+        required=False,
+        default="",
+        help='''Path to the DIAMOND get_LCA output file. Column names are read
+        from the first row of the file.A column named "query_ID" and one
+        named "superkingdom" are required.''',
+    )
+    parser.add_argument(
+        "-s",
+        "--source",
+        type=str,
+        required=False,
+        action="append",
+        default=[],
+        help='''A get_LCA output file of any classifier, given as origin=path,
+        e.g. --source megablast=sample_blast.tsv. origin is written to the
+        origin column. Can be given several times. Sources are merged after
+        -t (origin megablast) and -T (origin DIAMOND), in the order given.
+        <default: only -t and -T>''',
+    )
+    parser.add_argument(
+        "-f",
+        "--contig_fasta_file",
+        type=str,
+        required=True,
+        help="""Path to the .fasta containing the contigs. This is used to see
+        which sequences weren't assigned.""",
+    )
+    parser.add_argument(
+        "-o",
+        "--output_file",
+        type=str,
+        required=True,
+        help="Path to the merged dataframe output file.",
+    )
+
+    # Optional parameters
+    parser.add_argument(
+        "-c",
+        "--contig_counts_file",
+        type=str,
+        required=False,
+        default="",
+        help="""Path to the .txt (tab-separated) that contains the counts.
+        File is of structure <seq_ID><\t><count>. The usecase if when the
+        seq_IDs refer to contigs, and you have the counts for each contig.
+        <Default: No counts file. Each sequence assigned count 1>
+        """,
+    )
+    parser.add_argument(
+        "-v",
+        "--contig_cov_file",
+        type=str,
+        required=False,
+        default="",
+        help="""Path to the .txt (space-separated) that contains the coverage
+        information. Structure should be seq_ID, average_fold, covered_percent.
+        It should also have a header!
+        """,
+    )
+    parser.add_argument(
+        "-m",
+        "--contaminant_file",
+        type=str,
+        required=False,
+        default="",
+        help="""
+        Path to a contaminant file, which should consist of a single column.
+        The items in the column should all be query_ID's that are possible
+        contaminants. If this file is entered, these query_IDs will be marked
+        on the output dataframe.
+        """,
+    )
+    parser.add_argument(
+        "-l",
+        "--log_file",
+        type=str,
+        required=False,
+        default="",
+        help="Path to the log file.",
+    )
+
+
+    args = parser.parse_args()
+
+    BLASTN_contig_taxonomy_file = args.BLASTN_contig_taxonomy_file
+    DIAMOND_contig_taxonomy_file = args.DIAMOND_contig_taxonomy_file
+    contig_fasta_file = args.contig_fasta_file
+    output_file = args.output_file
+    contig_counts_file = args.contig_counts_file
+    contig_cov_file = args.contig_cov_file
+    contaminant_file = args.contaminant_file
+    log_file = args.log_file
+
+    # Collect the (origin, path) of each classifier's results
+    sources = []
+    if BLASTN_contig_taxonomy_file != "":
+        sources.append(('megablast', BLASTN_contig_taxonomy_file))
+    if DIAMOND_contig_taxonomy_file != "":
+        sources.append(('DIAMOND', DIAMOND_contig_taxonomy_file))
+    for source in args.source:
+        if not "=" in source:
+            raise ValueError("--source must be given as origin=path. Got " + source)
+        origin, path = source.split("=", 1)
+        sources.append((origin, path))
+    if sources == []:
+        raise ValueError("No taxonomy files were given. Use -t, -T or --source.")
+
+    #---------------------------------------------------------------------------#
+    # MAIN
+    #---------------------------------------------------------------------------#
+    write_to_log(log_file, "Starting pyscript.")
+
+    # Read the contig headers, counts and coverage once for all sources
+    shared_inputs = read_shared_inputs(contig_fasta_file, contig_counts_file, contig_cov_file)
+
+    source_dfs = [format_taxonomy_inputs(path, contig_fasta_file, contig_counts_file,
+                                         contig_cov_file, shared_inputs)
+                  for origin, path in sources]
+    MERGED_df = merge_multiple_dataframes(source_dfs, [origin for origin, path in sources])
+
+    # if contaminant file input, mark the possible contaminants
+    if contaminant_file != "":
+        contaminant_list = read_contaminant_list(contaminant_file)
+        MERGED_df = mark_contaminants(MERGED_df, contaminant_list)
+
+    #write outputs
+    write_output(MERGED_df, output_file)
+
+    write_to_log(log_file, "Finished pyscript.")
+
+if __name__ == '__main__':
+    main()
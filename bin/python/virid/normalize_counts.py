@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+
+import os
+import argparse
+import pathlib
+import numpy as np
+import pandas as pd
+
+from . import get_counts
+from .counts_matrix import CountsMatrix
+from .compressed_io import open_input, open_output
+
+# Columns of an aggregate_counts.py table that don't hold sample counts
+AGGREGATED_COLUMNS = ['lineage', 'superkingdom', 'taxon', 'level', 'taxonID']
+
+#------------------------------------------------------------------------------#
+# Define Functions
+#------------------------------------------------------------------------------#
+def read_manifest(manifest_path, denominator_column = 2):
+    """
+    Reads a tab-delimited manifest of per-sample denominators, and returns a
+    dictionary of structure sample:denominator. The sample is in the first
+    column and the denominator in column number denominator_column (counting
+    from 1). The metrics file written by extract_unassigned_reads.py - sample,
+    total reads, unassigned reads - can be used as is. A header line is
+    skipped. As metrics files are appended to, later lines of a sample replace
+    earlier ones.
+    """
+    denominators = dict()
+    with open_input(manifest_path) as infile:
+        for line_number, line in enumerate(infile):
+            line = line.rstrip("\n").split("\t")
+            if line == [""]:
+                continue
+            if len(line) < denominator_column:
+                raise ValueError("Line {0} of the manifest {1} has no column {2}.".format(
+                    line_number + 1, manifest_path, denominator_column))
+            try:
+                denominators[line[0]] = float(line[denominator_column - 1])
+            except ValueError:
+                if line_number == 0:
+                    continue
+                raise ValueError("The denominator of {0} in the manifest {1} is not a number.".format(
+                    line[0], manifest_path))
+    return denominators
+
+def add_sample_suffix(by_sample, sample_suffix):
+    """
+    Returns a copy of a dictionary keyed by sample with sample_suffix added to
+    each sample. Matrices built by build_counts_matrix.py name each sample by
+    its file, e.g. S1_diamond for S1_diamond.tsv, while the metrics file of
+    extract_unassigned_reads.py names it by its sampleID, S1.
+    """
+    return {sample + sample_suffix: value for sample, value in by_sample.items()}
+
+def get_denominators(samples, denominators):
+    """ Returns an array of the denominator of each sample. """
+    missing = [sample for sample in samples if not sample in denominators]
+    if len(missing) > 0:
+        raise ValueError("The manifest has no denominator for the samples " + ", ".join(missing) +
+                         ". If the manifest names them without a suffix, set --sample_suffix.")
+    values = np.array([denominators[sample] for sample in samples], dtype=float)
+    if (values <= 0).any():
+        raise ValueError("The denominators of the samples " +
+                         ", ".join(np.array(samples)[values <= 0].tolist()) + " are not positive.")
+    return values
+
+def read_contig_lengths(contig_fasta):
+    """
+    Returns a dictionary of structure contig:length from a fasta. The contig
+    name is the first word of the header, as in BLAST and DIAMOND outputs.
+    """
+    lengths = dict()
+    name = None
+    with open_input(contig_fasta) as infile:
+        for line in infile:
+            if line.startswith(">"):
+                name = line[1:].split()[0]
+                lengths[name] = 0
+            elif name != None:
+                lengths[name] += len(line.strip())
+    return lengths
+
+def read_taxon_lengths(infile, contig_fasta, origin = ''):
+    """
+    Returns the (taxonIDs, lengths) arrays of the total length of the contigs
+    assigned to each taxon at a cannonical level, assigned to each taxon in
+    the lineage of their LCA just like the counts are.
+    """
+    contig_lengths = read_contig_lengths(contig_fasta)
+    usecols = ['query_ID', 'LCA_taxonID']
+    if origin != '':
+        usecols.append('origin')
+    with open_input(infile) as infile_handle:
+        DF = pd.read_csv(infile_handle, sep = '\t', usecols = usecols)
+    if origin != '':
+        DF = DF[DF['origin'] == origin]
+
+    lengths = DF['query_ID'].astype(str).map(contig_lengths)
+    if lengths.isnull().any():
+        raise ValueError("The contigs " + ", ".join(DF['query_ID'][lengths.isnull()].astype(str).tolist()[:5]) +
+                         " of " + infile + " are not in " + contig_fasta)
+    taxon_lengths = lengths.groupby(DF['LCA_taxonID'].fillna(0).astype(int).values, sort = False).sum()
+    return get_counts.distribute_counts(dict(zip(taxon_lengths.index.tolist(), taxon_lengths.values)))
+
+def read_lengths_manifest(lengths_manifest, origin = ''):
+    """
+    Reads a tab-delimited manifest of sample, get_LCA.py output file and
+    contig fasta, and returns a dictionary of structure
+    sample:(taxonIDs, lengths).
+    """
+    taxon_lengths = dict()
+    with open(lengths_manifest) as infile:
+        for line in infile:
+            line = line.rstrip("\n").split("\t")
+            if line == [""]:
+                continue
+            if len(line) != 3:
+                raise ValueError("The lengths manifest should have three columns - " +
+                                 "sample, get_LCA.py output and contig fasta.")
+            taxon_lengths[line[0]] = read_taxon_lengths(line[1], line[2], origin)
+    return taxon_lengths
+
+def lookup_lengths(taxonIDs, sample_positions, samples, taxon_lengths):
+    """
+    Takes the taxonID and sample position of each count and returns the total
+    contig length of that taxon in that sample, 0 where there is none.
+    """
+    missing = [sample for sample in samples if not sample in taxon_lengths]
+    if len(missing) > 0:
+        raise ValueError("The lengths manifest has no contigs for the samples " + ", ".join(missing))
+
+    # Group the counts by sample once
+    by_sample = np.argsort(sample_positions, kind="mergesort")
+    bounds = np.searchsorted(sample_positions[by_sample], np.arange(len(samples) + 1))
+
+    lengths = np.zeros(len(taxonIDs), dtype=float)
+    for i, sample in enumerate(samples):
+        entries = by_sample[bounds[i]:bounds[i + 1]]
+        length_taxonIDs, sample_lengths = taxon_lengths[sample]
+        if len(length_taxonIDs) == 0:
+            continue
+        order = np.argsort(length_taxonIDs)
+        positions = np.minimum(np.searchsorted(length_taxonIDs[order], taxonIDs[entries]),
+                               len(order) - 1)
+        found = length_taxonIDs[order][positions] == taxonIDs[entries]
+        lengths[entries[found]] = sample_lengths[order][positions[found]]
+    return lengths
+
+def normalize_values(values, taxonIDs, sample_positions, samples, denominators,
+                     multiplier, method, taxon_lengths = None):
+    """
+    Normalizes the count of each (taxonID, sample position) in one pass.
+
+    per_million - count * multiplier / denominator
+    length      - count * 1000 * multiplier / (contig length * denominator),
+                  i.e. reads per kilobase of assigned contig per million reads
+                  when the multiplier is 1M.
+    """
+    normalized = values * multiplier / denominators[sample_positions]
+    if method == 'length':
+        lengths = lookup_lengths(taxonIDs, sample_positions, samples, taxon_lengths)
+        counted = values != 0
+        if (lengths[counted] == 0).any():
+            raise ValueError("Some taxa have counts but no assigned contig length. Make sure " +
+                             "the lengths manifest holds the files the counts came from.")
+        normalized[counted] = normalized[counted] * 1000 / lengths[counted]
+    return normalized
+
+def normalize_matrix(counts_matrix, denominators, multiplier, method, taxon_lengths = None):
+    """ Returns a CountsMatrix of the normalized counts of counts_matrix. """
+    sample_positions = np.repeat(np.arange(len(counts_matrix.samples)), np.diff(counts_matrix.indptr))
+    data = normalize_values(counts_matrix.data.astype(float),
+                            counts_matrix.taxonIDs[counts_matrix.indices], sample_positions,
+                            counts_matrix.samples, get_denominators(counts_matrix.samples, denominators),
+                            multiplier, method, taxon_lengths)
+    return CountsMatrix(counts_matrix.taxonIDs, counts_matrix.samples, data,
+                        counts_matrix.indices, counts_matrix.indptr)
+
+def normalize_aggregated_table(aggregated, denominators, multiplier, method, taxon_lengths = None):
+    """
+    Returns a copy of an aggregate_counts.py table with the counts of every
+    sample column normalized.
+    """
+    samples = [column for column in aggregated.columns if not column in AGGREGATED_COLUMNS]
+    values = aggregated[samples].values.astype(float)
+    n_taxa, n_samples = values.shape
+
+    normalized = normalize_values(values.ravel(),
+                                  np.repeat(aggregated['taxonID'].values.astype(np.int64), n_samples),
+                                  np.tile(np.arange(n_samples), n_taxa), samples,
+                                  get_denominators(samples, denominators), multiplier, method,
+                                  taxon_lengths)
+
+    output = aggregated.copy()
+    output[samples] = normalized.reshape(n_taxa, n_samples)
+    return output
+
+def normalize_count_table(infile_path, outfile_path, host_reads, multiplier):
+    """ Normalizes the count column of a single get_counts.py output. """
+
+    # Open up infile
+    infile = pd.read_csv(infile_path, sep='\t', index_col='taxonID')
+
+    # Modify count column
+    infile['count'] = infile['count']*multiplier/host_reads
+
+    # Make the output directory if necessary
+    output_directory = os.path.dirname(outfile_path)
+    pathlib.Path(output_directory).mkdir(parents=True, exist_ok=True)
+
+    # Write to outfile
+    infile.to_csv(outfile_path, sep='\t')
+
+def main():
+    #--------------------------------------------------------------------------#
+    # Parse Arguments
+    #--------------------------------------------------------------------------#
+    parser = argparse.ArgumentParser(description="""
+    The purpose of this script is to divide the 'count' column by a specified
+    divisor, and multiply by a specified multiplier. Thus,
+
+    New_col_value = (old_col_value * multiplier)/divisor
+
+    Batch mode: if a --manifest of per-sample divisors is given, the infile is
+    instead a counts matrix of many samples - an .npz made by
+    build_counts_matrix.py or virid_counts.py, or a table in the layout of
+    aggregate_counts.py - and every sample is normalized by its own divisor
+    in a single pass. The output has the format of the infile. With
+    --method length, counts are also divided by the length (in kb) of the
+    contigs assigned to each taxon, read from the assemblies listed in a
+    --lengths_manifest.
+    """)
+
+    parser.add_argument(
+        '-i',
+        '--infile',
+        type=str,
+        required=True,
+        help="""
+        The input table. This script assumes it is tab-delimieted. In batch
+        mode, a counts matrix (.npz) or aggregated table.
+        """
+    )
+    parser.add_argument(
+        '-o',
+        '--outfile',
+        type=str,
+        required=True,
+        help="""
+        Path to desired output file. Any required dirs will be made.
+        """
+    )
+
+    parser.add_argument(
+        '-ho',
+        '--host_reads',
+        type=int,
+        required=False,
+        default=0,
+        help="""
+        Interger value you want to divide the specified column by. Required
+        unless a --manifest is given.
+        """
+    )
+
+    parser.add_argument(
+        '-m',
+        '--multiplier',
+        type=int,
+        required=False,
+        default=1000000,
+        help="""
+        Value you want to multiply by. Default is 1M. I.e. if you want
+        reads per 1M host reads, and the divisor is number of host reads, this
+        param should be 1M.
+        """
+    )
+    parser.add_argument(
+        '-M',
+        '--manifest',
+        type=str,
+        required=False,
+        default='',
+        help="""
+        Tab-delimited file with a sample name in the first column and its
+        divisor in another. The metrics file of extract_unassigned_reads.py
+        can be used directly. Turns on batch mode. <default: none>
+        """
+    )
+    parser.add_argument(
+        '-d',
+        '--denominator_column',
+        type=int,
+        required=False,
+        default=2,
+        help="""
+        Column of the manifest holding the divisor, counting from 1. For the
+        extract_unassigned_reads.py metrics file, 2 is the total number of
+        reads and 3 the number of unassigned reads. <default: 2>
+        """
+    )
+    parser.add_argument(
+        '-s',
+        '--sample_suffix',
+        type=str,
+        required=False,
+        default='',
+        help="""
+        Suffix that follows the sample names of the manifests in the sample
+        names of the infile. The samples of a build_counts_matrix.py matrix
+        of <sampleID>_diamond.tsv files are named <sampleID>_diamond, so use
+        _diamond to normalize it with an extract_unassigned_reads.py metrics
+        file. <default: none>
+        """
+    )
+    parser.add_argument(
+        '-n',
+        '--method',
+        type=str,
+        required=False,
+        default='per_million',
+        choices=['per_million', 'length'],
+        help="""
+        Batch normalization method. per_million multiplies by the multiplier
+        and divides by the divisor. length also divides by the total length in
+        kb of the contigs assigned to each taxon, giving reads per kilobase per
+        million. <default: per_million>
+        """
+    )
+    parser.add_argument(
+        '-L',
+        '--lengths_manifest',
+        type=str,
+        required=False,
+        default='',
+        help="""
+        Tab-delimited file of sample, get_LCA.py (or merge_and_postprocess.py)
+        output and assembled contig fasta, one line per sample. Required by
+        --method length.
+        """
+    )
+    parser.add_argument(
+        '-r',
+        '--origin',
+        type=str,
+        required=False,
+        default='',
+        help="""
+        For --method length, only use lines of the get_LCA.py outputs with
+        this value in the origin column, as when building the matrix.
+        <default: every line>
+        """
+    )
+
+    args = parser.parse_args()
+    infile_path = args.infile
+    outfile_path = args.outfile
+    host_reads = args.host_reads
+    multiplier = args.multiplier
+    manifest = args.manifest
+    denominator_column = args.denominator_column
+    method = args.method
+    lengths_manifest = args.lengths_manifest
+    origin = args.origin
+    sample_suffix = args.sample_suffix
+
+    #--------------------------------------------------------------------------#
+    # Main
+    #--------------------------------------------------------------------------#
+    if manifest == '':
+        if host_reads <= 0:
+            raise ValueError("Specify a positive --host_reads, or a --manifest for batch mode.")
+        normalize_count_table(infile_path, outfile_path, host_reads, multiplier)
+        return
+
+    if method == 'length' and lengths_manifest == '':
+        raise ValueError("--method length requires a --lengths_manifest.")
+
+    denominators = add_sample_suffix(read_manifest(manifest, denominator_column), sample_suffix)
+    taxon_lengths = None
+    if method == 'length':
+        taxon_lengths = add_sample_suffix(read_lengths_manifest(lengths_manifest, origin),
+                                          sample_suffix)
+
+    if infile_path.endswith(".npz"):
+        counts_matrix = CountsMatrix.load(infile_path)
+        normalize_matrix(counts_matrix, denominators, multiplier, method,
+                         taxon_lengths).save(outfile_path)
+    else:
+        with open_input(infile_path) as infile:
+            aggregated = pd.read_csv(infile, sep='\t')
+        output = normalize_aggregated_table(aggregated, denominators, multiplier, method,
+                                            taxon_lengths)
+
+        # Make the output directory if necessary
+        output_directory = os.path.dirname(outfile_path)
+        pathlib.Path(output_directory).mkdir(parents=True, exist_ok=True)
+        with open_output(outfile_path) as outfile:
+            output.to_csv(outfile, sep='\t', index=False)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Jan 31 12:13:08 2019
+
+@author: jnom
+"""
+
+import argparse
+import os
+import time
+import math
+import zlib
+import heapq
+import shutil
+import pathlib
+import tempfile
+from .compressed_io import open_input, open_output, detect_compression, COMPRESSION_EXTENSIONS
+
+# Rough size in memory of a record, relative to its size in the fastq, when
+# the records of a bucket are paired in dictionaries
+MEMORY_PER_BYTE = 3
+
+# Rough ratio of uncompressed to compressed fastq size
+COMPRESSION_RATIO = 4
+
+# Rough size in memory of each name remembered to check that pairs are adjacent
+BYTES_PER_NAME = 100
+
+# Upper limit on the number of buckets, which are all open at once
+MAX_BUCKETS = 512
+
+
+def write_to_log(log_file, message):
+
+    import time
+    import os
+    import errno
+
+    current_date_time = time.strftime("%c")
+
+    #if the log_file wasn't input, just print message to screen
+    if log_file == '':
+        print(message)
+        print(current_date_time)
+        return None
+
+
+    #Make the log file directory if necessary
+    log_file_directory = os.path.dirname(log_file)
+    pathlib.Path(log_file_directory).mkdir(parents=True, exist_ok=True)
+
+    #Open the log_file in append mode and write message to it
+    with open(log_file, 'a') as infile:
+        infile.write(message + '\n')
+        infile.write(current_date_time + '\n')
+
+#------------------------------------------------------------------------------#
+# Reading and writing records
+#------------------------------------------------------------------------------#
+def read_records(input_fastq):
+    """
+    Yields the (header, seq, plus, qual) lines of each record of a fastq. An
+    incomplete record at the end of the file is skipped.
+    """
+    with open_input(input_fastq) as infile:
+        record = []
+        for line in infile:
+            record.append(line.rstrip('\n'))
+            if len(record) == 4:
+                yield tuple(record)
+                record = []
+
+def read_name(header):
+    """ Name shared by the two reads of a pair - the header up to the first /. """
+    return header.split('/')[0]
+
+def format_unpaired(name, record):
+    return name + '\n' + record[1] + '\n' + record[2] + '\n' + record[3] + '\n'
+
+def format_paired(name, record1, record2):
+    return (name + '/1' + '\n' + record1[1] + '\n' + record1[2] + '\n' + record1[3] + '\n' +
+            name + '/2' + '\n' + record2[1] + '\n' + record2[2] + '\n' + record2[3] + '\n')
+
+class NotAdjacentError(Exception):
+    """ Raised when the reads of a pair aren't next to each other in the input. """
+    pass
+
+#------------------------------------------------------------------------------#
+# Splitting
+#------------------------------------------------------------------------------#
+def split_adjacent(input_fastq, paired_output_file, unpaired_output_file, memory_budget=None):
+    """
+    Splits a fastq whose pairs are next to each other, such as an interleaved
+    fastq, in a single pass holding one pair at a time. Returns the number of
+    pairs and of unpaired reads written.
+
+    If memory_budget (bytes) is given, the input is checked instead of assumed
+    to be adjacent - the names of unpaired reads are remembered, and
+    NotAdjacentError is raised if one of them turns up again or they outgrow
+    memory_budget.
+    """
+    unpaired_names = set()
+    n_paired = 0
+    n_unpaired = 0
+
+    current_name = None
+    current_record = None
+    mate_record = None
+    for record in read_records(input_fastq):
+        name = read_name(record[0])
+        if name == current_name:
+            # As when pairing with dictionaries, a third read replaces the second
+            mate_record = record
+            continue
+
+        if current_name != None:
+            if mate_record == None:
+                unpaired_output_file.write(format_unpaired(current_name, current_record))
+                n_unpaired += 1
+                if memory_budget != None:
+                    unpaired_names.add(hash(current_name))
+            else:
+                paired_output_file.write(format_paired(current_name, current_record, mate_record))
+                n_paired += 1
+
+        if memory_budget != None:
+            if hash(name) in unpaired_names:
+                raise NotAdjacentError(name + " is not next to its mate.")
+            if len(unpaired_names) * BYTES_PER_NAME > memory_budget:
+                raise NotAdjacentError("Too many unpaired reads to check adjacency.")
+
+        current_name = name
+        current_record = record
+        mate_record = None
+
+    if current_name != None:
+        if mate_record == None:
+            unpaired_output_file.write(format_unpaired(current_name, current_record))
+            n_unpaired += 1
+        else:
+            paired_output_file.write(format_paired(current_name, current_record, mate_record))
+            n_paired += 1
+
+    return n_paired, n_unpaired
+
+def get_n_buckets(input_fastq, memory_budget):
+    """
+    Number of buckets needed for the records of one bucket to be paired within
+    memory_budget bytes, estimated from the size of the input.
+    """
+    input_size = os.path.getsize(input_fastq)
+    if detect_compression(input_fastq) != "":
+        input_size *= COMPRESSION_RATIO
+    n_buckets = math.ceil(input_size * MEMORY_PER_BYTE / memory_budget)
+    return min(max(n_buckets, 1), MAX_BUCKETS)
+
+def partition_records(input_fastq, temp_dir, n_buckets):
+    """
+    Writes each record to one of n_buckets bucket files in temp_dir, chosen
+    by a hash of its read name, so both reads of a pair are in the same
+    bucket. Each record is preceded by its position in the input. Returns the
+    bucket paths.
+    """
+    bucket_paths = [os.path.join(temp_dir, "bucket_" + str(i)) for i in range(n_buckets)]
+    buckets = [open(path, "w") for path in bucket_paths]
+    try:
+        for index, record in enumerate(read_records(input_fastq)):
+            bucket = zlib.crc32(read_name(record[0]).encode()) % n_buckets
+            buckets[bucket].write(str(index) + '\n' + '\n'.join(record) + '\n')
+    finally:
+        for bucket in buckets:
+            bucket.close()
+    return bucket_paths
+
+def read_bucket(bucket_path):
+    """ Yields the (index, record) of each record of a bucket file. """
+    with open(bucket_path) as infile:
+        while True:
+            index = infile.readline()
+            if index == '':
+                return
+            record = tuple(infile.readline().rstrip('\n') for i in range(4))
+            yield int(index), record
+
+def pair_bucket(bucket_path):
+    """
+    Pairs the records of a bucket by read name and writes the pairs and the
+    unpaired reads to two files next to it, in order of the first read of
+    each name, each entry preceded by that read's position in the input.
+    Returns the paths of the two files and the numbers of pairs and unpaired
+    reads.
+    """
+    #Using a series of dictionaries to sort reads
+    dict1 = dict()
+    dict2 = dict()
+    for index, record in read_bucket(bucket_path):
+        name = read_name(record[0])
+        if name in dict1:
+            dict2[name] = record
+        else:
+            dict1[name] = (index, record)
+
+    paired_path = bucket_path + "_paired"
+    unpaired_path = bucket_path + "_unpaired"
+    with open(paired_path, "w") as paired_file, open(unpaired_path, "w") as unpaired_file:
+        for name, (index, record) in sorted(dict1.items(), key=lambda item: item[1][0]):
+            if not name in dict2:
+                unpaired_file.write(str(index) + '\n' + format_unpaired(name, record))
+            else:
+                paired_file.write(str(index) + '\n' + format_paired(name, record, dict2[name]))
+
+    return paired_path, unpaired_path, len(dict2), len(dict1) - len(dict2)
+
+def read_paired_bucket(path, lines_per_entry):
+    """ Yields the (index, text) of each entry written by pair_bucket(). """
+    with open(path) as infile:
+        while True:
+            index = infile.readline()
+            if index == '':
+                return
+            yield int(index), ''.join(infile.readline() for i in range(lines_per_entry))
+
+def merge_buckets(paths, lines_per_entry, output_file):
+    """ Writes the entries of the bucket files to output_file in input order. """
+    entries = heapq.merge(*[read_paired_bucket(path, lines_per_entry) for path in paths],
+                          key=lambda entry: entry[0])
+    for index, text in entries:
+        output_file.write(text)
+
+def split_bucketed(input_fastq, paired_output_file, unpaired_output_file, memory_budget,
+                   temp_dir=''):
+    """
+    Splits a fastq in any order by hash-partitioning its records by read name
+    into buckets on disk, pairing the reads one bucket at a time, and merging
+    the results back into input order. Only one bucket is held in memory, and
+    there are enough buckets for it to fit in memory_budget bytes. Returns the
+    number of pairs and of unpaired reads written.
+    """
+    n_buckets = get_n_buckets(input_fastq, memory_budget)
+    print('Splitting the reads into ' + str(n_buckets) + ' buckets.')
+
+    bucket_dir = tempfile.mkdtemp(prefix="process_read_pairs_", dir=temp_dir or None)
+    try:
+        bucket_paths = partition_records(input_fastq, bucket_dir, n_buckets)
+
+        paired_paths = []
+        unpaired_paths = []
+        n_paired = 0
+        n_unpaired = 0
+        for bucket_path in bucket_paths:
+            paired_path, unpaired_path, bucket_paired, bucket_unpaired = pair_bucket(bucket_path)
+            os.remove(bucket_path)
+            paired_paths.append(paired_path)
+            unpaired_paths.append(unpaired_path)
+            n_paired += bucket_paired
+            n_unpaired += bucket_unpaired
+
+        merge_buckets(paired_paths, 8, paired_output_file)
+        merge_buckets(unpaired_paths, 4, unpaired_output_file)
+    finally:
+        shutil.rmtree(bucket_dir)
+
+    return n_paired, n_unpaired
+
+def split_read_pairs(input_fastq, paired_output_file_name, unpaired_output_file_name,
+                     mode='auto', memory_budget=2000 * 1024**2, temp_dir=''):
+    """
+    Writes the pairs of input_fastq, interleaved, to paired_output_file_name
+    and the unpaired reads to unpaired_output_file_name, in the order their
+    first reads appear in the input.
+
+    mode is 'adjacent' for inputs whose pairs are next to each other,
+    'bucket' for inputs in any order, or 'auto' to try 'adjacent' and start
+    again in 'bucket' mode if a pair turns out not to be adjacent.
+    """
+    if not mode in ['auto', 'adjacent', 'bucket']:
+        raise ValueError("mode must be auto, adjacent or bucket.")
+
+    n_paired = None
+    if mode in ['auto', 'adjacent']:
+        paired_output_file = open_output(paired_output_file_name, "w")
+        unpaired_output_file = open_output(unpaired_output_file_name, "w")
+        try:
+            n_paired, n_unpaired = split_adjacent(input_fastq, paired_output_file,
+                                                  unpaired_output_file,
+                                                  memory_budget if mode == 'auto' else None)
+        except NotAdjacentError as error:
+            print(str(error) + ' Pairing the reads in buckets instead.')
+        finally:
+            unpaired_output_file.close()
+            paired_output_file.close()
+
+    if n_paired == None:
+        paired_output_file = open_output(paired_output_file_name, "w")
+        unpaired_output_file = open_output(unpaired_output_file_name, "w")
+        try:
+            n_paired, n_unpaired = split_bucketed(input_fastq, paired_output_file,
+                                                  unpaired_output_file, memory_budget, temp_dir)
+        finally:
+            unpaired_output_file.close()
+            paired_output_file.close()
+
+    #Leave empty outputs at 0 bytes even when compressed, because the later steps
+    #check whether a file is empty by its size
+    if n_paired == 0:
+        open(paired_output_file_name, "w").close()
+    if n_unpaired == 0:
+        open(unpaired_output_file_name, "w").close()
+
+    return n_paired, n_unpaired
+
+def main():
+    print('The purpose of this script is to take read files and split them into  1) paired (interleaved) and 2) unpaired fastqs.')
+    print('The input for this script is the path to a fastq, and the desired output directory. Use -h for more info.')
+
+    parser = argparse.ArgumentParser(description='This program inputs files that may have a mix of paired and unpaired reads, and creates a file containing interleaved paired reads and a file containing unpaired reads.')
+    parser.add_argument('-f', '--fastq', type=str, required=True, help='Name/path to the input fastq.')
+    parser.add_argument('-o', '--OUT_PREFIX', type=str, required=True, help='Prefix/path to the output files, where output files will be OUT_PREFIX"_paired.fastq" and OUT_PREFIX"_unpaired.fastq".')
+    parser.add_argument('-l', '--log', type=str, required=False, default='', help='Path to the log file. Not required.')
+    parser.add_argument('-z', '--compression', type=str, required=False, default='', choices=['', 'gzip', 'bgzip', 'zstd'], help='Compression of the output fastqs, which get a .gz, .bgz or .zst suffix. The input fastq may be compressed either way. Not required, default is uncompressed.')
+    parser.add_argument('-m', '--mode', type=str, required=False, default='auto', choices=['auto', 'adjacent', 'bucket'], help='How reads are paired. adjacent streams inputs whose pairs are next to each other, such as interleaved fastqs, in constant memory. bucket pairs inputs in any order by splitting them into buckets on disk. auto tries adjacent and switches to bucket if a pair is not adjacent. Not required, default is auto.')
+    parser.add_argument('-M', '--memory', type=int, required=False, default=2000, help='Memory budget in MB for pairing in buckets, which sets the number of buckets. Not required, default is 2000.')
+    parser.add_argument('-T', '--temp_dir', type=str, required=False, default='', help='Directory for the buckets. Not required, default is the system temporary directory.')
+    args = parser.parse_args()
+
+    input_fastq = args.fastq
+    OUT_PREFIX = args.OUT_PREFIX
+    log_file = args.log
+    compression_suffix = COMPRESSION_EXTENSIONS[args.compression]
+    mode = args.mode
+    memory_budget = args.memory * 1024**2
+    temp_dir = args.temp_dir
+
+    write_to_log(log_file, "process_read_pairs.py: Starting for " + str(input_fastq))
+
+    #Make the output directory if it doesn't exit already
+    OUT_DIRNAME = os.path.dirname(OUT_PREFIX)
+    pathlib.Path(OUT_DIRNAME).mkdir(parents=True, exist_ok=True)
+
+
+    print('Detected the infile ' + input_fastq)
+    print('Prefix is set to ' + OUT_PREFIX)
+
+    #Preparing output files
+    paired_output_file_name = OUT_PREFIX + "_paired.fastq" + compression_suffix
+    unpaired_output_file_name= OUT_PREFIX + "_unpaired.fastq" + compression_suffix
+
+    n_paired, n_unpaired = split_read_pairs(input_fastq, paired_output_file_name,
+                                            unpaired_output_file_name, mode, memory_budget,
+                                            temp_dir)
+
+    print('Output files generated for ' + OUT_PREFIX)
+    write_to_log(log_file, "process_read_pairs.py: Wrote " + str(n_paired) + " pairs and " +
+                 str(n_unpaired) + " unpaired reads.")
+    write_to_log(log_file, "process_read_pairs.py: Finished.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+#------------------------------------------------------------------------------#
+# Import packages
+#------------------------------------------------------------------------------#
+import argparse
+import math
+import os
+import pathlib
+
+from .compressed_io import open_input, open_output
+
+# Write buffer of each shard
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+
+#------------------------------------------------------------------------------#
+# Define Functions
+#------------------------------------------------------------------------------#
+def count_residues(infile):
+    """ Returns the total number of residues of the records of a fasta. """
+    residues = 0
+    with open_input(infile) as infile_handle:
+        for line in infile_handle:
+            if not line.startswith(">"):
+                residues += len(line.rstrip("\n"))
+    return residues
+
+def get_n_shards(total_residues, residues_per_shard, max_shards = 0):
+    """
+    Number of shards needed for each to hold about residues_per_shard
+    residues, at most max_shards if it isn't 0.
+    """
+    n_shards = max(int(math.ceil(total_residues / residues_per_shard)), 1)
+    if max_shards > 0:
+        n_shards = min(n_shards, max_shards)
+    return n_shards
+
+def shard_path(out_prefix, shard, n_shards, suffix = ".fasta"):
+    """
+    Path of a shard, <out_prefix>.shard_<shard>_of_<n_shards>.fasta with
+    1-based, zero-padded numbers, so the shards sort in order by name.
+    """
+    return "{0}.shard_{1:04d}_of_{2:04d}{3}".format(out_prefix, shard, n_shards, suffix)
+
+def shard_fasta(infile, out_prefix, n_shards, total_residues, suffix = ".fasta"):
+    """
+    Splits infile into n_shards fastas of consecutive records with similar
+    numbers of residues. A shard is closed once the records written so far
+    reach its share of total_residues, so the shards concatenated in order
+    are the records of infile in order. Records are never split, and there are
+    fewer shards than n_shards if some records are long. Returns the paths of
+    the shards.
+    """
+    paths = []
+    outfile_handle = None
+    written_residues = 0
+    shard = 0
+    with open_input(infile) as infile_handle:
+        for line in infile_handle:
+            if line.startswith(">"):
+                # Start the next shard at a record boundary once this one is full
+                if outfile_handle == None or \
+                        (written_residues >= shard * total_residues / n_shards and shard < n_shards):
+                    if outfile_handle != None:
+                        outfile_handle.close()
+                    shard += 1
+                    paths.append(shard_path(out_prefix, shard, n_shards, suffix))
+                    outfile_handle = open_output(paths[-1], "w", buffering = OUTPUT_BUFFER_SIZE)
+            elif outfile_handle != None:
+                written_residues += len(line.rstrip("\n"))
+
+            if outfile_handle != None:
+                outfile_handle.write(line)
+
+    if outfile_handle != None:
+        outfile_handle.close()
+
+    # Name the shards by how many there are
+    if shard < n_shards:
+        renamed_paths = [shard_path(out_prefix, i + 1, shard, suffix) for i in range(shard)]
+        for path, renamed_path in zip(paths, renamed_paths):
+            os.replace(path, renamed_path)
+        paths = renamed_paths
+    return paths
+
+#------------------------------------------------------------------------------#
+# Define and execute main
+#------------------------------------------------------------------------------#
+def main():
+    parser = argparse.ArgumentParser(description="""
+    The purpose of this script is to split a query fasta into shards that BLAST
+    or DIAMOND can search in parallel. Shards are balanced by their number of
+    residues rather than of records, and hold consecutive records, so the hits
+    of the shards concatenated in shard order are in the order of the queries.
+
+    Output: <out_prefix>.shard_<i>_of_<n>.fasta for i from 1 to n.
+    """)
+
+    parser.add_argument(
+        '-i',
+        '--infile',
+        type=str,
+        required=True,
+        help="""
+        Path to the query fasta. It may be gzip, bgzip or zstd compressed.
+        """
+    )
+    parser.add_argument(
+        '-o',
+        '--out_prefix',
+        type=str,
+        required=True,
+        help="""
+        Prefix/path of the shards.
+        """
+    )
+    parser.add_argument(
+        '-r',
+        '--residues_per_shard',
+        type=int,
+        required=False,
+        default=50000000,
+        help="""
+        Number of residues (bases or amino acids) to put in each shard.
+        <default: 50000000>
+        """
+    )
+    parser.add_argument(
+        '-n',
+        '--max_shards',
+        type=int,
+        required=False,
+        default=0,
+        help="""
+        Largest number of shards to make. <default: 0, no limit>
+        """
+    )
+    parser.add_argument(
+        '-z',
+        '--compression',
+        type=str,
+        required=False,
+        default='',
+        choices=['', '.gz', '.bgz', '.zst'],
+        help="""
+        Suffix compressing the shards. <default: uncompressed>
+        """
+    )
+
+    args = parser.parse_args()
+
+    infile = args.infile
+    out_prefix = args.out_prefix
+    residues_per_shard = args.residues_per_shard
+    max_shards = args.max_shards
+    suffix = ".fasta" + args.compression
+
+    if residues_per_shard < 1:
+        raise ValueError("residues_per_shard must be at least 1.")
+
+    #Make the output directory if necessary
+    pathlib.Path(os.path.dirname(out_prefix)).mkdir(parents=True, exist_ok=True)
+
+    total_residues = count_residues(infile)
+    n_shards = get_n_shards(total_residues, residues_per_shard, max_shards)
+    paths = shard_fasta(infile, out_prefix, n_shards, total_residues, suffix)
+
+    print("shard_fasta.py: Split {0} residues of {1} into {2} shards.".format(
+        total_residues, infile, len(paths)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,511 @@
+#!/usr/bin/env python3
+"""
+In-memory NCBI taxonomy used by get_LCA.py, get_counts.py and
+merge_and_postprocess.py.
+
+The ete3 NCBITaxa object answers every get_rank/get_taxid_translator/
+get_lineage call with a separate SQLite query. TaxonomyIndex instead reads the
+whole taxonomy once and keeps it in flat numpy arrays indexed directly by
+taxonID:
+
+    parent      - parent taxonID of each node (0 for the root, -1 if absent)
+    rank_codes  - index into the ranks list (0 if absent)
+    depth       - number of edges between the node and the root
+    name_offsets/name_blob - all scientific names concatenated into a single
+                  UTF-8 byte string, sliced by offset
+
+Lookups are then a single array access (rank, name) or a walk of the parent
+array (lineage), with no database round-trips.
+
+The index can also be saved as a snapshot - a directory of .npy files and a
+manifest.json, built by virid_taxdb.py. Snapshots are memory-mapped read-only,
+so loading one takes milliseconds, never touches the network, and concurrent
+processes on a node share a single copy of the arrays in the page cache.
+TaxonomyIndex.load() uses the snapshot named by the VIRID_TAXDB environment
+variable if it is set.
+"""
+
+import os
+import io
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import tarfile
+import numpy as np
+
+DEFAULT_ETE3_SQLITE = os.path.join(os.path.expanduser("~"), ".etetoolkit", "taxa.sqlite")
+
+SNAPSHOT_ENV_VAR = "VIRID_TAXDB"
+
+# Indexes returned by TaxonomyIndex.load(), by (sqlite_path, snapshot_path)
+loaded_indexes = dict()
+
+# Bump when the layout of snapshots changes
+SNAPSHOT_VERSION = 1
+
+SNAPSHOT_MANIFEST = "manifest.json"
+
+class TaxonomyIndex(object):
+
+    def __init__(self, parent, rank_codes, ranks, name_offsets, name_blob,
+                 merged_old, merged_new, depth=None):
+        self.parent = parent
+        self.rank_codes = rank_codes
+        self.ranks = list(ranks)
+        self.name_offsets = name_offsets
+        self.name_blob = name_blob
+        self.merged_old = merged_old
+        self.merged_new = merged_new
+        self.max_taxonID = len(parent) - 1
+
+        # Set by from_snapshot(). snapshot_arrays also holds the arrays other
+        # modules stored in the snapshot (i.e. the lineage table).
+        self.snapshot_path = None
+        self.snapshot_arrays = dict()
+
+        if depth is None:
+            depth = compute_depth(parent)
+        self.depth = depth
+
+    #--------------------------------------------------------------------------#
+    # Construction
+    #--------------------------------------------------------------------------#
+    @classmethod
+    def from_rows(cls, rows, merged_rows=()):
+        """
+        Builds the index from an iterable of (taxonID, parent_taxonID, name,
+        rank) tuples and an iterable of (old_taxonID, new_taxonID) tuples. The
+        root is the node without a parent, or whose parent is itself.
+        """
+        taxonIDs = []
+        parents = []
+        names = []
+        rank_labels = []
+        for taxonID, parent_taxonID, name, rank in rows:
+            taxonIDs.append(int(taxonID))
+            try:
+                parent_taxonID = int(parent_taxonID)
+            except (TypeError, ValueError):
+                parent_taxonID = 0
+            parents.append(parent_taxonID)
+            names.append(name if name is not None else "")
+            rank_labels.append(rank if rank is not None else "")
+
+        if taxonIDs == []:
+            raise ValueError("Cannot build a TaxonomyIndex from an empty taxonomy.")
+
+        taxonIDs = np.array(taxonIDs, dtype=np.int64)
+        parents = np.array(parents, dtype=np.int64)
+        parents[parents == taxonIDs] = 0
+        size = int(taxonIDs.max()) + 1
+
+        parent = np.full(size, -1, dtype=np.int32)
+        parent[taxonIDs] = parents
+
+        # Rank code 0 is reserved for taxonIDs that are not in the taxonomy
+        ranks = [None] + sorted(set(rank_labels))
+        rank_lookup = {rank: code for code, rank in enumerate(ranks)}
+        rank_codes = np.zeros(size, dtype=np.uint8)
+        rank_codes[taxonIDs] = [rank_lookup[rank] for rank in rank_labels]
+
+        # Names are stored as one UTF-8 blob. Absent taxonIDs get an empty slice.
+        encoded = [name.encode("utf-8") for name in names]
+        lengths = np.zeros(size, dtype=np.int64)
+        lengths[taxonIDs] = [len(name) for name in encoded]
+        name_offsets = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(lengths, out=name_offsets[1:])
+        order = np.argsort(taxonIDs, kind="mergesort")
+        name_blob = b"".join([encoded[i] for i in order])
+
+        merged = sorted((int(old), int(new)) for old, new in merged_rows)
+        merged_old = np.array([old for old, new in merged], dtype=np.int32)
+        merged_new = np.array([new for old, new in merged], dtype=np.int32)
+
+        return cls(parent, rank_codes, ranks, name_offsets, name_blob,
+                   merged_old, merged_new)
+
+    @classmethod
+    def from_ete3_sqlite(cls, sqlite_path=DEFAULT_ETE3_SQLITE):
+        """
+        Reads the species and merged tables of the ete3 taxa.sqlite database.
+        If the database doesn't exist yet, ete3 is used once to download it.
+        """
+        if not os.path.exists(sqlite_path):
+            print("Did not find " + sqlite_path + ". Using ete3 to download "
+                  "the NCBI taxonomy database.")
+            from ete3 import NCBITaxa
+            NCBITaxa(dbfile=sqlite_path)
+
+        connection = sqlite3.connect(sqlite_path)
+        try:
+            rows = connection.execute("SELECT taxid, parent, spname, rank FROM species")
+            merged_rows = connection.execute("SELECT taxid_old, taxid_new FROM merged").fetchall()
+            index = cls.from_rows(rows, merged_rows)
+        finally:
+            connection.close()
+
+        return index
+
+    @classmethod
+    def from_taxdump(cls, taxdump_path):
+        """
+        Reads nodes.dmp, names.dmp and (if present) merged.dmp from an NCBI
+        taxdump directory or taxdump.tar.gz archive. Uses the scientific name
+        of each taxonID, like ete3.
+        """
+        def read_dmp(file_name, required=True):
+            """ Yields the fields of each line of a .dmp file. """
+            archive = None
+            if os.path.isdir(taxdump_path):
+                path = os.path.join(taxdump_path, file_name)
+                if not os.path.exists(path):
+                    if required:
+                        raise ValueError("Did not find " + file_name + " in " + taxdump_path)
+                    return
+                handle = open(path, encoding="utf-8")
+            else:
+                archive = tarfile.open(taxdump_path)
+                try:
+                    member = archive.getmember(file_name)
+                except KeyError:
+                    archive.close()
+                    if required:
+                        raise ValueError("Did not find " + file_name + " in " + taxdump_path)
+                    return
+                handle = io.TextIOWrapper(archive.extractfile(member), encoding="utf-8")
+
+            with handle:
+                for line in handle:
+                    yield line.rstrip("\n").rstrip("\t|").split("\t|\t")
+            if archive != None:
+                archive.close()
+
+        names = dict()
+        for fields in read_dmp("names.dmp"):
+            if fields[3] == "scientific name":
+                names[fields[0]] = fields[1]
+
+        rows = [(fields[0], fields[1], names.get(fields[0], ""), fields[2])
+                for fields in read_dmp("nodes.dmp")]
+        merged_rows = [(fields[0], fields[1]) for fields in read_dmp("merged.dmp", required=False)]
+
+        return cls.from_rows(rows, merged_rows)
+
+    @classmethod
+    def from_snapshot(cls, snapshot_path):
+        """
+        Memory-maps a snapshot written by save_snapshot(). The arrays are
+        opened read-only and are only read from disk as they are used.
+        """
+        manifest_path = os.path.join(snapshot_path, SNAPSHOT_MANIFEST)
+        if not os.path.exists(manifest_path):
+            raise ValueError("Did not find a taxonomy snapshot at " + snapshot_path)
+        with open(manifest_path) as infile:
+            manifest = json.load(infile)
+        if manifest.get("version") != SNAPSHOT_VERSION:
+            raise ValueError("The taxonomy snapshot at " + snapshot_path + " has version " +
+                             str(manifest.get("version")) + ", but this version of virID " +
+                             "reads version " + str(SNAPSHOT_VERSION) + ". Rebuild it with " +
+                             "virid_taxdb.py build.")
+
+        arrays = dict()
+        for name in manifest["arrays"]:
+            arrays[name] = np.load(os.path.join(snapshot_path, name + ".npy"), mmap_mode="r")
+
+        index = cls(arrays["parent"], arrays["rank_codes"], manifest["ranks"],
+                    arrays["name_offsets"], arrays["name_blob"], arrays["merged_old"],
+                    arrays["merged_new"], arrays["depth"])
+        index._fingerprint = manifest["fingerprint"]
+        index.snapshot_path = snapshot_path
+        index.snapshot_arrays = arrays
+        return index
+
+    @classmethod
+    def load(cls, sqlite_path=DEFAULT_ETE3_SQLITE, snapshot_path=None):
+        """
+        Loads the snapshot at snapshot_path, or at $VIRID_TAXDB if
+        snapshot_path isn't given. Without either, reads the ete3 database.
+        Repeated calls with the same paths return the same index.
+        """
+        if snapshot_path == None:
+            snapshot_path = os.environ.get(SNAPSHOT_ENV_VAR, "")
+
+        # Scripts that import each other share one index per process
+        key = (sqlite_path, snapshot_path)
+        if not key in loaded_indexes:
+            if snapshot_path != "":
+                loaded_indexes[key] = cls.from_snapshot(snapshot_path)
+            else:
+                loaded_indexes[key] = cls.from_ete3_sqlite(sqlite_path)
+        return loaded_indexes[key]
+
+    def save_snapshot(self, snapshot_path, extra_arrays=None, source=""):
+        """
+        Writes the index to snapshot_path as one .npy file per array plus a
+        manifest.json. extra_arrays is a dictionary of other arrays to store,
+        which from_snapshot() exposes in snapshot_arrays. The snapshot is
+        written to a temporary directory first and then moved into place, so
+        processes never see a partially written snapshot.
+        """
+        arrays = {
+            "parent": self.parent,
+            "rank_codes": self.rank_codes,
+            "depth": self.depth,
+            "name_offsets": self.name_offsets,
+            "name_blob": np.frombuffer(bytes(self.name_blob), dtype=np.uint8),
+            "merged_old": self.merged_old,
+            "merged_new": self.merged_new
+        }
+        if extra_arrays != None:
+            arrays.update(extra_arrays)
+
+        snapshot_path = os.path.abspath(snapshot_path)
+        parent_directory = os.path.dirname(snapshot_path)
+        os.makedirs(parent_directory, exist_ok=True)
+        temporary_path = snapshot_path + "." + str(os.getpid()) + ".tmp"
+        os.makedirs(temporary_path)
+
+        for name, array in arrays.items():
+            np.save(os.path.join(temporary_path, name + ".npy"), np.ascontiguousarray(array))
+
+        manifest = {
+            "version": SNAPSHOT_VERSION,
+            "fingerprint": self.fingerprint,
+            "created": time.strftime("%c"),
+            "source": source,
+            "n_taxonIDs": int((self.parent != -1).sum()),
+            "max_taxonID": self.max_taxonID,
+            "ranks": self.ranks,
+            "arrays": sorted(arrays.keys())
+        }
+        with open(os.path.join(temporary_path, SNAPSHOT_MANIFEST), "w") as outfile:
+            json.dump(manifest, outfile, indent=2)
+
+        # Swap the new snapshot in. Processes that already mapped the old
+        # snapshot keep reading it until they exit.
+        if os.path.exists(snapshot_path):
+            old_path = snapshot_path + "." + str(os.getpid()) + ".old"
+            os.rename(snapshot_path, old_path)
+            os.rename(temporary_path, snapshot_path)
+            shutil.rmtree(old_path)
+        else:
+            os.rename(temporary_path, snapshot_path)
+
+    @property
+    def fingerprint(self):
+        """
+        md5 of the parent, rank and name arrays. Identifies the taxonomy that
+        files derived from it (i.e. an LCA cache) were made with.
+        """
+        if getattr(self, "_fingerprint", None) is None:
+            md5 = hashlib.md5()
+            for array in [self.parent, self.rank_codes, self.name_offsets]:
+                md5.update(np.ascontiguousarray(array).tobytes())
+            md5.update(self.name_blob)
+            md5.update("\t".join(str(rank) for rank in self.ranks).encode("utf-8"))
+            self._fingerprint = md5.hexdigest()
+        return self._fingerprint
+
+    #--------------------------------------------------------------------------#
+    # Lookups
+    #--------------------------------------------------------------------------#
+    def _as_taxonID(self, taxonID):
+        """ Returns taxonID as an int, or -1 if it can't be one. """
+        try:
+            return int(taxonID)
+        except (TypeError, ValueError):
+            return -1
+
+    def contains(self, taxonID):
+        """ True if taxonID is a current (non-merged) node of the taxonomy. """
+        taxonID = self._as_taxonID(taxonID)
+        return 0 <= taxonID <= self.max_taxonID and self.parent[taxonID] != -1
+
+    def translate(self, taxonID):
+        """
+        Returns the current taxonID for taxonID, following the merged table if
+        it is an obsolete taxonID. Returns None if it can't be found.
+        """
+        taxonID = self._as_taxonID(taxonID)
+        if 0 <= taxonID <= self.max_taxonID and self.parent[taxonID] != -1:
+            return taxonID
+
+        position = np.searchsorted(self.merged_old, taxonID)
+        if position < len(self.merged_old) and self.merged_old[position] == taxonID:
+            return int(self.merged_new[position])
+        return None
+
+    def translate_array(self, taxonIDs):
+        """
+        Vectorized translate(). Takes an array of taxonIDs and returns an int32
+        array of current taxonIDs, with -1 wherever a taxonID can't be found.
+        """
+        taxonIDs = np.asarray(taxonIDs, dtype=np.int64)
+        translated = np.full(len(taxonIDs), -1, dtype=np.int32)
+
+        in_range = (taxonIDs >= 0) & (taxonIDs <= self.max_taxonID)
+        present = np.zeros(len(taxonIDs), dtype=bool)
+        present[in_range] = self.parent[taxonIDs[in_range]] != -1
+        translated[present] = taxonIDs[present]
+
+        missing = np.flatnonzero(~present)
+        if len(missing) > 0 and len(self.merged_old) > 0:
+            positions = np.searchsorted(self.merged_old, taxonIDs[missing])
+            positions = np.minimum(positions, len(self.merged_old) - 1)
+            found = self.merged_old[positions] == taxonIDs[missing]
+            translated[missing[found]] = self.merged_new[positions[found]]
+
+        return translated
+
+    def get_rank(self, taxonID):
+        """ Rank of taxonID, or None if absent. Merged taxonIDs are not followed, as in ete3. """
+        if not self.contains(taxonID):
+            return None
+        return self.ranks[self.rank_codes[int(taxonID)]]
+
+    def get_name(self, taxonID):
+        """ Scientific name of taxonID, or None if absent. Merged taxonIDs are followed. """
+        taxonID = self.translate(taxonID)
+        if taxonID is None:
+            return None
+        start = self.name_offsets[taxonID]
+        end = self.name_offsets[taxonID + 1]
+        return bytes(self.name_blob[start:end]).decode("utf-8")
+
+    def get_lineage(self, taxonID):
+        """
+        Returns the lineage of taxonID as a list of taxonIDs, starting at the
+        root. Like ete3, returns None for a falsy taxonID and raises ValueError
+        if the taxonID can't be found.
+        """
+        if not taxonID:
+            return None
+        current = self.translate(taxonID)
+        if current is None:
+            raise ValueError("%s taxid not found" % taxonID)
+
+        lineage = [0] * (int(self.depth[current]) + 1)
+        for i in range(len(lineage) - 1, -1, -1):
+            lineage[i] = current
+            current = int(self.parent[current])
+        return lineage
+
+    #--------------------------------------------------------------------------#
+    # Whole-tree structure
+    #--------------------------------------------------------------------------#
+    def nodes_by_depth(self):
+        """
+        Returns a list whose i-th item is an array of the taxonIDs at depth i.
+        Computed once and cached.
+        """
+        if getattr(self, "_nodes_by_depth", None) is None:
+            present = np.flatnonzero(self.parent != -1)
+            present = present[np.argsort(self.depth[present], kind="mergesort")]
+            bounds = np.searchsorted(self.depth[present], np.arange(int(self.depth.max()) + 2))
+            self._nodes_by_depth = [present[bounds[i]:bounds[i + 1]]
+                                    for i in range(len(bounds) - 1)]
+        return self._nodes_by_depth
+
+    def preorder(self):
+        """
+        Returns (preorder_index, subtree_size) arrays indexed by taxonID. The
+        subtree of a node occupies the preorder positions
+        [preorder_index, preorder_index + subtree_size), so clade membership is
+        an interval containment test. Computed once and cached.
+        """
+        if getattr(self, "_preorder", None) is None:
+            levels = self.nodes_by_depth()
+
+            # Subtree sizes, accumulated from the deepest level up
+            subtree_size = np.zeros(len(self.parent), dtype=np.int64)
+            subtree_size[self.parent != -1] = 1
+            for nodes in reversed(levels[1:]):
+                np.add.at(subtree_size, self.parent[nodes], subtree_size[nodes])
+
+            # Preorder positions, assigned from the root down. Siblings are
+            # ordered by taxonID and laid out one subtree after another.
+            preorder_index = np.full(len(self.parent), -1, dtype=np.int64)
+            roots = np.sort(levels[0])
+            preorder_index[roots] = np.cumsum(subtree_size[roots]) - subtree_size[roots]
+            for nodes in levels[1:]:
+                parents = self.parent[nodes]
+                order = np.lexsort((nodes, parents))
+                nodes = nodes[order]
+                parents = parents[order]
+                sizes = subtree_size[nodes]
+
+                # Offset of each node within its parent's subtree
+                preceding = np.cumsum(sizes) - sizes
+                group_start = np.ones(len(nodes), dtype=bool)
+                group_start[1:] = parents[1:] != parents[:-1]
+                first = np.maximum.accumulate(np.where(group_start, np.arange(len(nodes)), 0))
+                preorder_index[nodes] = preorder_index[parents] + 1 + preceding - preceding[first]
+
+            self._preorder = (preorder_index, subtree_size)
+        return self._preorder
+
+    def known_mask(self):
+        """
+        Boolean array indexed by taxonID that is True for every taxonID that
+        can be found in the taxonomy, directly or through the merged table.
+        """
+        size = max(self.max_taxonID, int(self.merged_old.max()) if len(self.merged_old) > 0 else 0) + 1
+        mask = np.zeros(size, dtype=bool)
+        mask[:len(self.parent)] = self.parent != -1
+        mask[self.merged_old] = True
+        return mask
+
+    def clade_mask(self, clade_taxonIDs, size=None):
+        """
+        Boolean array indexed by taxonID that is True for every taxonID in the
+        clade of any of clade_taxonIDs, including the clade taxonIDs
+        themselves. Merged taxonIDs are in a clade if their current taxonID is.
+        """
+        if size is None:
+            size = len(self.parent)
+        mask = np.zeros(size, dtype=bool)
+        clades = self.translate_array(list(clade_taxonIDs))
+        clades = clades[clades >= 0]
+        if len(clades) == 0:
+            return mask
+
+        # Mark the preorder intervals covered by the clades
+        preorder_index, subtree_size = self.preorder()
+        n_nodes = int((self.parent != -1).sum())
+        coverage = np.zeros(n_nodes + 1, dtype=np.int64)
+        np.add.at(coverage, preorder_index[clades], 1)
+        np.add.at(coverage, preorder_index[clades] + subtree_size[clades], -1)
+        in_clade = np.cumsum(coverage)[:-1] > 0
+
+        present = np.flatnonzero(self.parent != -1)
+        mask[present] = in_clade[preorder_index[present]]
+
+        # Merged taxonIDs follow their current taxonID
+        if len(self.merged_old) > 0:
+            merged = self.merged_old < size
+            mask[self.merged_old[merged]] = mask[self.merged_new[merged]]
+        return mask
+
+def compute_depth(parent):
+    """
+    Computes the depth of every node from a parent array, one tree level per
+    iteration. Absent taxonIDs get a depth of -1.
+    """
+    depth = np.full(len(parent), -1, dtype=np.int16)
+    present = np.flatnonzero(parent != -1)
+    roots = present[parent[present] == 0]
+    depth[roots] = 0
+
+    remaining = present[parent[present] != 0]
+    level = 0
+    while len(remaining) > 0:
+        resolved = depth[parent[remaining]] == level
+        if not resolved.any():
+            raise ValueError("The taxonomy contains nodes that are not connected to the root.")
+        level += 1
+        depth[remaining[resolved]] = level
+        remaining = remaining[~resolved]
+
+    return depth
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+
+#------------------------------------------------------------------------------#
+# Import packages
+#------------------------------------------------------------------------------#
+import argparse
+import os
+import sys
+import time
+from glob import glob
+
+from .counts_matrix import CountsMatrix
+from .counts_store import CountsStore
+from .build_counts_matrix import count_samples, get_sample_name, write_taxa_table, \
+    make_aggregated_table, write_table
+
+#------------------------------------------------------------------------------#
+# Functions
+#------------------------------------------------------------------------------#
+def read_sample_list(samples):
+    """
+    Takes a comma-separated list of samples, or the path of a file with one
+    sample per line, and returns a list of samples.
+    """
+    if samples == "":
+        return None
+    if os.path.isfile(samples):
+        with open(samples) as infile:
+            return [line.strip() for line in infile if line.strip() != ""]
+    return [sample for sample in samples.split(",") if sample != ""]
+
+def add(args):
+    """
+    Counts the samples of per-sample get_LCA.py outputs, or takes the samples
+    of a counts matrix, and adds them to the store.
+    """
+    start_time = time.time()
+    store = CountsStore.create(args.store)
+
+    if args.matrix != "":
+        print("Reading the counts matrix " + args.matrix)
+        counts_matrix = CountsMatrix.load(args.matrix)
+        samples = counts_matrix.samples
+        columns = [counts_matrix.get_column(sample) for sample in samples]
+    else:
+        infiles = sorted(glob(args.input_files_glob))
+        if len(infiles) == 0:
+            raise ValueError("Failed to find input files. Check that the glob is " +
+                             "correct and is in quotes.")
+        samples = [get_sample_name(infile) for infile in infiles]
+
+        # Skip samples that are already in the store unless replacing them
+        if not args.replace and args.skip_existing:
+            existing = set(store.samples)
+            infiles = [infile for infile, sample in zip(infiles, samples)
+                       if not sample in existing]
+            samples = [sample for sample in samples if not sample in existing]
+        columns = count_samples(infiles, args.count_column, args.origin, args.threads)
+
+    store.add_samples(samples, columns, args.replace)
+    print("Finished. Added {0} samples to {1} in {2:.1f} seconds. It holds {3} samples.".format(
+        len(samples), args.store, time.time() - start_time, len(store.samples)))
+
+def remove(args):
+    """ Removes samples from the store. """
+    store = CountsStore(args.store)
+    samples = read_sample_list(args.samples)
+    store.remove_samples(samples)
+    print("Finished. Removed {0} samples from {1}. It holds {2} samples.".format(
+        len(samples), args.store, len(store.samples)))
+
+def info(args):
+    """ Prints the samples of the store. """
+    store = CountsStore(args.store)
+    print("sample\tn_taxa\tadded")
+    for entry in store.manifest["samples"]:
+        print("{0}\t{1}\t{2}".format(entry["sample"], entry["n_taxa"], entry["added"]))
+
+def export(args):
+    """ Writes the counts of all or some samples of the store to a matrix. """
+    store = CountsStore(args.store)
+    counts_matrix = store.materialize(read_sample_list(args.samples))
+    counts_matrix.save(args.outfile)
+    print("Wrote the counts of {0} taxa in {1} samples to {2}".format(
+        counts_matrix.shape[0], counts_matrix.shape[1], args.outfile))
+
+    taxa_outfile = args.taxa_outfile
+    if taxa_outfile == "":
+        taxa_outfile = (args.outfile[:-len(".npz")] if args.outfile.endswith(".npz")
+                        else args.outfile) + "_taxa.tsv"
+    taxa_DF = write_taxa_table(counts_matrix, taxa_outfile)
+
+    if args.tsv_outfile != "":
+        write_table(make_aggregated_table(counts_matrix, taxa_DF), args.tsv_outfile)
+
+#------------------------------------------------------------------------------#
+# Main
+#------------------------------------------------------------------------------#
+def main():
+
+    #--------------------------------------------------------------------------#
+    # Take inputs
+    #--------------------------------------------------------------------------#
+    parser = argparse.ArgumentParser(description="""
+    Maintains a counts store - a directory holding the counts of many samples,
+    to which samples can be added, replaced and removed without rereading the
+    samples already in it. Any subset of the samples can be exported to a
+    counts matrix in the format of build_counts_matrix.py.
+
+    Usage:
+    virid_counts.py add -s cohort_store -i "output/diamond/*_diamond.tsv" --skip_existing
+    virid_counts.py export -s cohort_store -o cohort.npz -t cohort.tsv
+    """, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command")
+
+    add_parser = subparsers.add_parser('add', help='''
+        Add samples to a store, creating the store if necessary.''')
+    add_parser.add_argument(
+        '-s',
+        '--store',
+        type=str,
+        required=True,
+        help='''Path to the store directory.'''
+    )
+    add_parser.add_argument(
+        '-i',
+        '--input_files_glob',
+        type=str,
+        required=False,
+        default="",
+        help='''
+        A glob specifying the per-sample get_LCA.py output files, as for
+        build_counts_matrix.py. Must be in quotes.
+        '''
+    )
+    add_parser.add_argument(
+        '-m',
+        '--matrix',
+        type=str,
+        required=False,
+        default="",
+        help='''
+        Path to a counts matrix made by build_counts_matrix.py, whose samples
+        are added instead of those of --input_files_glob.
+        '''
+    )
+    add_parser.add_argument(
+        '--replace',
+        action='store_true',
+        help='''
+        Replace samples that are already in the store. Otherwise adding them
+        is an error.
+        '''
+    )
+    add_parser.add_argument(
+        '--skip_existing',
+        action='store_true',
+        help='''
+        Skip input files whose samples are already in the store, without
+        reading them, so only new samples are counted.
+        '''
+    )
+    add_parser.add_argument(
+        '-c',
+        '--count_column',
+        type=str,
+        required=False,
+        default='read_count',
+        help='''
+        Column holding the number of reads of each line. Each line counts as
+        one read in files without this column. <default: read_count>
+        '''
+    )
+    add_parser.add_argument(
+        '-r',
+        '--origin',
+        type=str,
+        required=False,
+        default='',
+        help='''
+        Only count lines with this value in the origin column.
+        <default: count every line>
+        '''
+    )
+    add_parser.add_argument(
+        '-p',
+        '--threads',
+        type=int,
+        required=False,
+        default=1,
+        help='''Number of samples to read and count in parallel. <default: 1>'''
+    )
+    add_parser.set_defaults(function=add)
+
+    remove_parser = subparsers.add_parser('remove', help='''
+        Remove samples from a store.''')
+    remove_parser.add_argument(
+        '-s',
+        '--store',
+        type=str,
+        required=True,
+        help='''Path to the store directory.'''
+    )
+    remove_parser.add_argument(
+        'samples',
+        type=str,
+        help='''
+        Comma-separated list of the samples to remove, or the path of a file
+        with one sample per line.
+        '''
+    )
+    remove_parser.set_defaults(function=remove)
+
+    info_parser = subparsers.add_parser('info', help='''
+        List the samples of a store.''')
+    info_parser.add_argument(
+        '-s',
+        '--store',
+        type=str,
+        required=True,
+        help='''Path to the store directory.'''
+    )
+    info_parser.set_defaults(function=info)
+
+    export_parser = subparsers.add_parser('export', help='''
+        Write the counts of all or some samples of a store to a counts matrix.''')
+    export_parser.add_argument(
+        '-s',
+        '--store',
+        type=str,
+        required=True,
+        help='''Path to the store directory.'''
+    )
+    export_parser.add_argument(
+        '-o',
+        '--outfile',
+        type=str,
+        required=True,
+        help='''Path to the output .npz matrix.'''
+    )
+    export_parser.add_argument(
+        '--samples',
+        type=str,
+        required=False,
+        default="",
+        help='''
+        Comma-separated list of the samples to export, or the path of a file
+        with one sample per line. <default: all samples, in the order they
+        were added>
+        '''
+    )
+    export_parser.add_argument(
+        '-m',
+        '--taxa_outfile',
+        type=str,
+        required=False,
+        default='',
+        help='''
+        Path to the output taxa table. <default: the outfile with .npz replaced
+        by _taxa.tsv>
+        '''
+    )
+    export_parser.add_argument(
+        '-t',
+        '--tsv_outfile',
+        type=str,
+        required=False,
+        default='',
+        help='''
+        If specified, also write the counts to this path in the layout of
+        aggregate_counts.py. <default: none>
+        '''
+    )
+    export_parser.set_defaults(function=export)
+
+    args = parser.parse_args()
+
+    if args.command == None:
+        parser.print_help()
+        sys.exit(1)
+    if args.command == "add" and (args.input_files_glob == "") == (args.matrix == ""):
+        raise ValueError("Specify exactly one of --input_files_glob and --matrix.")
+
+    #--------------------------------------------------------------------------#
+    # Main
+    #--------------------------------------------------------------------------#
+    args.function(args)
+
+if __name__ == '__main__':
+    main()
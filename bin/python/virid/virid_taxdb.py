@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+#------------------------------------------------------------------------------#
+# Import packages
+#------------------------------------------------------------------------------#
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from .taxonomy_index import TaxonomyIndex, DEFAULT_ETE3_SQLITE, SNAPSHOT_ENV_VAR, SNAPSHOT_MANIFEST
+from .lineage_table import LineageTable, SNAPSHOT_PREFIX as LINEAGE_TABLE_PREFIX
+from .lca_engine import LCAEngine, SNAPSHOT_UP
+
+#------------------------------------------------------------------------------#
+# Functions
+#------------------------------------------------------------------------------#
+def build(args):
+    """
+    Builds a taxonomy snapshot from an NCBI taxdump or an ete3 taxa.sqlite
+    database. Along with the taxonomy itself, the snapshot holds the lineage
+    table and the LCA lifting table, so the scripts don't rebuild either.
+    """
+    start_time = time.time()
+
+    if args.taxdump != "":
+        print("Reading the NCBI taxdump at " + args.taxdump)
+        taxonomy = TaxonomyIndex.from_taxdump(args.taxdump)
+        source = os.path.abspath(args.taxdump)
+    else:
+        if not os.path.exists(args.sqlite):
+            raise ValueError("Did not find the ete3 database " + args.sqlite +
+                             ". Specify a taxdump with --taxdump instead.")
+        print("Reading the ete3 database at " + args.sqlite)
+        taxonomy = TaxonomyIndex.from_ete3_sqlite(args.sqlite)
+        source = os.path.abspath(args.sqlite)
+
+    print("Building the lineage and LCA tables.")
+    extra_arrays = LineageTable.build(taxonomy).to_arrays(LINEAGE_TABLE_PREFIX)
+    extra_arrays[SNAPSHOT_UP] = np.stack(LCAEngine(taxonomy).up)
+
+    print("Writing the snapshot to " + args.outdir)
+    taxonomy.save_snapshot(args.outdir, extra_arrays, source)
+
+    print("Finished. Wrote {0} taxonIDs in {1:.1f} seconds. Set {2}={3} to use it.".format(
+        int((taxonomy.parent != -1).sum()), time.time() - start_time,
+        SNAPSHOT_ENV_VAR, os.path.abspath(args.outdir)))
+
+def info(args):
+    """ Prints the manifest of a snapshot and checks that it loads. """
+    with open(os.path.join(args.snapshot, SNAPSHOT_MANIFEST)) as infile:
+        manifest = json.load(infile)
+    for key in ["version", "fingerprint", "created", "source", "n_taxonIDs", "max_taxonID"]:
+        print(key + "\t" + str(manifest.get(key)))
+
+    start_time = time.time()
+    TaxonomyIndex.from_snapshot(args.snapshot)
+    print("load_seconds\t{0:.4f}".format(time.time() - start_time))
+
+#------------------------------------------------------------------------------#
+# Main
+#------------------------------------------------------------------------------#
+def main():
+
+    #--------------------------------------------------------------------------#
+    # Take inputs
+    #--------------------------------------------------------------------------#
+    parser = argparse.ArgumentParser(description="""
+    Builds and inspects taxonomy snapshots.
+
+    A snapshot is a directory of fixed-width binary arrays (.npy files) and a
+    manifest.json holding the NCBI taxonomy, the cannonical lineage table and
+    the LCA lookup table. get_LCA.py, get_counts.py and merge_and_postprocess.py
+    memory-map the snapshot named by the {0} environment variable
+    read-only, so startup takes milliseconds, concurrent tasks on a node share
+    one copy of the taxonomy in memory, and ete3 is never asked to download
+    the taxonomy.
+
+    Usage:
+    virid_taxdb.py build --taxdump taxdump.tar.gz -o /path/to/taxdb
+    export {0}=/path/to/taxdb
+    """.format(SNAPSHOT_ENV_VAR), formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command")
+
+    build_parser = subparsers.add_parser('build', help='''
+        Build a snapshot from an NCBI taxdump or an ete3 taxa.sqlite database.''')
+    build_parser.add_argument(
+        '-o',
+        '--outdir',
+        type=str,
+        required=True,
+        help='''
+        Path to the snapshot directory. An existing snapshot there is replaced.
+        '''
+    )
+    build_parser.add_argument(
+        '-t',
+        '--taxdump',
+        type=str,
+        required=False,
+        default="",
+        help='''
+        Path to a directory with the NCBI nodes.dmp, names.dmp and (optionally)
+        merged.dmp files, or to the taxdump.tar.gz archive holding them.
+        <default: use the ete3 database>
+        '''
+    )
+    build_parser.add_argument(
+        '-s',
+        '--sqlite',
+        type=str,
+        required=False,
+        default=DEFAULT_ETE3_SQLITE,
+        help='''
+        Path to the ete3 taxa.sqlite database, used if --taxdump isn't given.
+        <default: ~/.etetoolkit/taxa.sqlite>
+        '''
+    )
+    build_parser.set_defaults(function=build)
+
+    info_parser = subparsers.add_parser('info', help='''
+        Print the manifest of a snapshot and time loading it.''')
+    info_parser.add_argument(
+        'snapshot',
+        type=str,
+        help='''Path to the snapshot directory.'''
+    )
+    info_parser.set_defaults(function=info)
+
+    args = parser.parse_args()
+
+    if args.command == None:
+        parser.print_help()
+        sys.exit(1)
+
+    #--------------------------------------------------------------------------#
+    # Main
+    #--------------------------------------------------------------------------#
+    args.function(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+#!/usr/bin/env python3
+# Runs virid/virid_taxdb.py. Kept so the script can still be run, and imported, by
+# this name - see virid/cli.py.
+from virid.cli import shim
+
+shim(__name__, "virid_taxdb")
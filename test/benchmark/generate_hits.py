@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+#------------------------------------------------------------------------------#
+# Import packages
+#------------------------------------------------------------------------------#
+import argparse
+import os
+import sys
+import numpy as np
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIRECTORY, "..", "..", "bin", "python"))
+from virid.taxonomy_index import TaxonomyIndex, SNAPSHOT_MANIFEST
+
+DEFAULT_TAXONOMY = os.path.join(BENCHMARK_DIRECTORY, "taxonomy")
+DEFAULT_BLACKLIST = os.path.join(BENCHMARK_DIRECTORY, "blacklist.tsv")
+
+# Number of queries generated and written at a time
+QUERY_CHUNK_SIZE = 50000
+
+#------------------------------------------------------------------------------#
+# Functions
+#------------------------------------------------------------------------------#
+def load_taxonomy(taxonomy_path):
+    """
+    Loads a taxonomy snapshot, or an NCBI taxdump directory/archive such as
+    the bundled fixture.
+    """
+    if os.path.exists(os.path.join(taxonomy_path, SNAPSHOT_MANIFEST)):
+        return TaxonomyIndex.from_snapshot(taxonomy_path)
+    return TaxonomyIndex.from_taxdump(taxonomy_path)
+
+def parse_distribution(distribution):
+    """
+    Parses a hits-per-query distribution. Returns a function that takes a
+    numpy RandomState and a number of queries and returns the number of hits
+    of each query (at least 1), and the mean of the distribution. Accepts
+    fixed:N, uniform:MIN-MAX, poisson:MEAN and geometric:MEAN.
+    """
+    try:
+        kind, value = distribution.split(":")
+        if kind == "fixed":
+            n = int(value)
+            return (lambda random, size: np.full(size, max(n, 1))), float(max(n, 1))
+        elif kind == "uniform":
+            low, high = [int(item) for item in value.split("-")]
+            return (lambda random, size: random.randint(max(low, 1), high + 1, size)), \
+                   (max(low, 1) + high) / 2.0
+        elif kind == "poisson":
+            mean = float(value)
+            return (lambda random, size: np.maximum(random.poisson(mean, size), 1)), max(mean, 1.0)
+        elif kind == "geometric":
+            mean = float(value)
+            return (lambda random, size: random.geometric(1.0 / mean, size)), mean
+    except ValueError:
+        pass
+    raise ValueError("Could not parse the hits-per-query distribution " + distribution +
+                     ". Use fixed:N, uniform:MIN-MAX, poisson:MEAN or geometric:MEAN.")
+
+def read_blacklist(blacklist_path):
+    """ Returns the exact taxonIDs and clade taxonIDs (ending in '+') of a blacklist file. """
+    blacklist = []
+    clade_blacklist = []
+    with open(blacklist_path) as infile:
+        for line in infile:
+            taxonID = line.rstrip("\n").split("\t")[0]
+            if taxonID.endswith("+"):
+                clade_blacklist.append(int(taxonID[:-1]))
+            elif taxonID != "":
+                blacklist.append(int(taxonID))
+    return blacklist, clade_blacklist
+
+def generate_hits(outfile, n_queries, hits_per_query="poisson:5", spread=2,
+                  na_fraction=0.01, blacklisted_fraction=0.01, score_spread=3.0,
+                  taxonomy=None, blacklist_path=DEFAULT_BLACKLIST, seed=1):
+    """
+    Writes a synthetic BLAST/DIAMOND outfmt-6 file with the columns
+    query_ID seq_title seq_ID taxonID evalue bitscore pident length, grouped
+    by query_ID.
+
+    Each query gets an anchor species, and its hits are drawn from the clade
+    of the anchor's ancestor spread levels up, so spread controls how far
+    apart its hits are in the taxonomy. na_fraction of the hits get "N/A" as
+    their taxonID and blacklisted_fraction get a blacklisted taxonID. Hit
+    bitscores are within score_spread percent of the query's top bitscore.
+
+    Returns the number of lines written.
+    """
+    if taxonomy == None:
+        taxonomy = load_taxonomy(DEFAULT_TAXONOMY)
+    random = np.random.RandomState(seed)
+    draw_hits, mean_hits = parse_distribution(hits_per_query)
+
+    # Anchors are species outside the blacklist
+    blacklist, clade_blacklist = read_blacklist(blacklist_path)
+    blacklisted = taxonomy.clade_mask(clade_blacklist)
+    blacklisted[[taxonID for taxonID in blacklist if taxonID <= taxonomy.max_taxonID]] = True
+    species_code = taxonomy.ranks.index("species")
+    anchors = np.flatnonzero((taxonomy.rank_codes == species_code) & ~blacklisted)
+    if len(anchors) == 0:
+        raise ValueError("The taxonomy has no species outside the blacklist to anchor queries on.")
+    if blacklisted_fraction > 0 and blacklist == []:
+        raise ValueError("blacklisted_fraction is above 0, but the blacklist has no taxonIDs.")
+    blacklist = np.array(blacklist, dtype=np.int64)
+
+    # Nodes in preorder, so the nodes of a clade are a contiguous range
+    preorder_index, subtree_size = taxonomy.preorder()
+    present = np.flatnonzero(taxonomy.parent != -1)
+    in_preorder = np.empty(len(present), dtype=np.int64)
+    in_preorder[preorder_index[present]] = present
+
+    parent = np.asarray(taxonomy.parent, dtype=np.int64)
+    n_lines = 0
+    with open(outfile, "w") as outfile_handle:
+        for chunk_start in range(0, n_queries, QUERY_CHUNK_SIZE):
+            n_chunk = min(QUERY_CHUNK_SIZE, n_queries - chunk_start)
+
+            # Clade of each query
+            clades = anchors[random.randint(0, len(anchors), n_chunk)]
+            for level in range(spread):
+                clades = np.where(parent[clades] > 0, parent[clades], clades)
+
+            # Hits of each query, drawn uniformly from its clade
+            n_hits = draw_hits(random, n_chunk)
+            query_of_hit = np.repeat(np.arange(n_chunk), n_hits)
+            hit_clades = clades[query_of_hit]
+            offsets = (random.random_sample(len(hit_clades)) * subtree_size[hit_clades]).astype(np.int64)
+            taxonIDs = in_preorder[preorder_index[hit_clades] + offsets].astype(object)
+
+            # N/A and blacklisted taxonIDs
+            roll = random.random_sample(len(taxonIDs))
+            taxonIDs[roll < na_fraction] = "N/A"
+            blacklisted_hits = np.flatnonzero((roll >= na_fraction) &
+                                              (roll < na_fraction + blacklisted_fraction))
+            if len(blacklisted_hits) > 0:
+                taxonIDs[blacklisted_hits] = blacklist[random.randint(0, len(blacklist), len(blacklisted_hits))]
+
+            # Scores. The first hit of each query has the top bitscore.
+            top_scores = random.uniform(50, 800, n_chunk)[query_of_hit]
+            bitscores = top_scores * (1 - random.uniform(0, score_spread / 100.0, len(taxonIDs)))
+            first_hits = np.concatenate([[0], np.cumsum(n_hits)[:-1]])
+            bitscores[first_hits] = top_scores[first_hits]
+            evalues = 10.0 ** -random.uniform(3, 150, len(taxonIDs))
+            pidents = random.uniform(70, 100, len(taxonIDs))
+            lengths = random.randint(50, 300, len(taxonIDs))
+            subjects = random.randint(1, 10 ** 8, len(taxonIDs))
+
+            lines = []
+            for query, taxonID, evalue, bitscore, pident, length, subject in zip(
+                    (query_of_hit + chunk_start).tolist(), taxonIDs.tolist(), evalues.tolist(),
+                    bitscores.tolist(), pidents.tolist(), lengths.tolist(), subjects.tolist()):
+                lines.append("query{0}\tsynthetic subject {1}\tSYN{1}\t{2}\t{3:.2e}\t{4:.1f}\t{5:.1f}\t{6}\n".format(
+                    query, subject, taxonID, evalue, bitscore, pident, length))
+            outfile_handle.write("".join(lines))
+            n_lines += len(lines)
+
+    return n_lines
+
+#------------------------------------------------------------------------------#
+# Main
+#------------------------------------------------------------------------------#
+def main():
+
+    #--------------------------------------------------------------------------#
+    # Take inputs
+    #--------------------------------------------------------------------------#
+    parser = argparse.ArgumentParser(description="""
+    Generates a synthetic BLAST/DIAMOND outfmt-6 file for benchmarking
+    get_LCA.py. Columns are query_ID seq_title seq_ID taxonID evalue bitscore
+    pident length, matching the default get_LCA.py column names.
+    """)
+    parser.add_argument('-o', '--outfile', type=str, required=True,
+        help='''Path to the output file.''')
+    parser.add_argument('-n', '--n_queries', type=int, required=True,
+        help='''Number of queries to generate.''')
+    parser.add_argument('-d', '--hits_per_query', type=str, required=False,
+        default="poisson:5",
+        help='''Distribution of the number of hits per query - fixed:N,
+        uniform:MIN-MAX, poisson:MEAN or geometric:MEAN. Every query has at
+        least one hit. <default: poisson:5>''')
+    parser.add_argument('-s', '--spread', type=int, required=False, default=2,
+        help='''Taxonomic spread - the hits of a query are drawn from the clade
+        of its anchor species' ancestor this many levels up. 0 makes every hit
+        of a query the same species. <default: 2>''')
+    parser.add_argument('--na_fraction', type=float, required=False, default=0.01,
+        help='''Fraction of hits with "N/A" as their taxonID. <default: 0.01>''')
+    parser.add_argument('--blacklisted_fraction', type=float, required=False, default=0.01,
+        help='''Fraction of hits with a blacklisted taxonID. <default: 0.01>''')
+    parser.add_argument('--score_spread', type=float, required=False, default=3.0,
+        help='''Hit bitscores are within this percent of the top bitscore of
+        their query. <default: 3>''')
+    parser.add_argument('-t', '--taxonomy', type=str, required=False,
+        default=DEFAULT_TAXONOMY,
+        help='''Taxonomy snapshot directory, or NCBI taxdump directory or
+        archive. <default: the bundled fixture>''')
+    parser.add_argument('-b', '--blacklist', type=str, required=False,
+        default=DEFAULT_BLACKLIST,
+        help='''Blacklist file to draw blacklisted taxonIDs from. <default: the
+        bundled fixture blacklist>''')
+    parser.add_argument('--seed', type=int, required=False, default=1,
+        help='''Random seed. <default: 1>''')
+    args = parser.parse_args()
+
+    #--------------------------------------------------------------------------#
+    # Main
+    #--------------------------------------------------------------------------#
+    n_lines = generate_hits(args.outfile, args.n_queries, args.hits_per_query,
+                            args.spread, args.na_fraction, args.blacklisted_fraction,
+                            args.score_spread, load_taxonomy(args.taxonomy),
+                            args.blacklist, args.seed)
+    print("Wrote {0} lines for {1} queries to {2}".format(n_lines, args.n_queries, args.outfile))
+
+if __name__ == '__main__':
+    main()
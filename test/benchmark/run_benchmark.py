@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+
+#------------------------------------------------------------------------------#
+# Import packages
+#------------------------------------------------------------------------------#
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_DIRECTORY = os.path.join(BENCHMARK_DIRECTORY, "..", "..", "bin", "python")
+sys.path.insert(0, SCRIPT_DIRECTORY)
+from virid.taxonomy_index import SNAPSHOT_ENV_VAR
+from generate_hits import (generate_hits, load_taxonomy, parse_distribution,
+                           DEFAULT_TAXONOMY, DEFAULT_BLACKLIST)
+
+GET_LCA = os.path.join(SCRIPT_DIRECTORY, "get_LCA.py")
+VIRID_TAXDB = os.path.join(SCRIPT_DIRECTORY, "virid_taxdb.py")
+
+# get_LCA.py's default
+WITHIN_PERCENT_OF_TOP_SCORE = 1
+
+STAGES = ["parse", "filter", "score_filter", "LCA", "lineage", "write"]
+
+# Runs a script and writes its peak RSS in kB to a file on exit. The rusage
+# of a child started from this process would include this process' own RSS
+# (Linux carries the high-water mark across exec), so the child reads the
+# high-water mark of its own address space from /proc instead. Forked worker
+# processes are covered by RUSAGE_CHILDREN.
+RSS_WRAPPER = """
+import atexit, os, resource, runpy, sys
+rss_file = sys.argv[1]
+def write_peak_rss():
+    peak = 0
+    if os.path.exists("/proc/self/status"):
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    peak = int(line.split()[1])
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if peak > 0:
+        with open(rss_file, "w") as outfile:
+            outfile.write(str(max(peak, children)))
+atexit.register(write_peak_rss)
+sys.argv = sys.argv[2:]
+sys.path.insert(0, os.path.dirname(os.path.abspath(sys.argv[0])))
+runpy.run_path(sys.argv[0], run_name="__main__")
+"""
+
+#------------------------------------------------------------------------------#
+# Functions
+#------------------------------------------------------------------------------#
+def build_snapshot(taxonomy_path, snapshot_path):
+    """ Builds a taxonomy snapshot with virid_taxdb.py, unless taxonomy_path is one. """
+    if os.path.exists(os.path.join(taxonomy_path, "manifest.json")):
+        return os.path.abspath(taxonomy_path)
+    subprocess.check_call([sys.executable, VIRID_TAXDB, "build", "--taxdump", taxonomy_path,
+                           "--outdir", snapshot_path], stdout=subprocess.DEVNULL)
+    return snapshot_path
+
+def run_end_to_end(infile, outfile, blacklist, snapshot_path, mode, threads, log_path):
+    """
+    Runs get_LCA.py in a child process. Returns the wall time in seconds and
+    the peak resident set size in MB of the largest get_LCA.py process.
+    """
+    rss_file = outfile + ".rss"
+    command = [sys.executable, "-c", RSS_WRAPPER, rss_file,
+               GET_LCA, "-i", infile, "-o", outfile, "-b", blacklist]
+    if mode == "streaming":
+        command.append("--streaming")
+    elif mode == "threads":
+        command.extend(["--threads", str(threads)])
+
+    environment = dict(os.environ)
+    environment[SNAPSHOT_ENV_VAR] = snapshot_path
+
+    with open(log_path, "a") as log_handle:
+        start_time = time.time()
+        process = subprocess.Popen(command, stdout=log_handle, stderr=log_handle,
+                                   env=environment)
+
+        # wait4 gives the resource usage of just this child
+        pid, status, usage = os.wait4(process.pid, 0)
+        seconds = time.time() - start_time
+
+    if not os.WIFEXITED(status) or os.WEXITSTATUS(status) != 0:
+        raise ValueError("get_LCA.py failed in " + mode + " mode. See " + log_path)
+
+    if os.path.exists(rss_file):
+        with open(rss_file) as infile_handle:
+            peak_rss_mb = int(infile_handle.read()) / 1024.0
+        os.remove(rss_file)
+    else:
+        # Without /proc, fall back to the rusage of the child. ru_maxrss is in
+        # bytes on macOS.
+        scale = 1024.0 * 1024.0 if sys.platform == "darwin" else 1024.0
+        peak_rss_mb = usage.ru_maxrss / scale
+    return seconds, peak_rss_mb
+
+def profile_stages(get_LCA, infile, outfile, blacklist_path):
+    """
+    Runs the get_LCA.py streaming pipeline in this process, timing each stage
+    separately. The LCA cache is not used, so the LCA and lineage stages show
+    the cost of looking up every query. Returns an OrderedDict of seconds per
+    stage.
+    """
+    timings = OrderedDict((stage, 0.0) for stage in STAGES)
+    clock = time.perf_counter
+
+    colnames = "query_ID seq_title seq_ID taxonID evalue bitscore pident length".split(" ")
+    taxonomy_column_index = colnames.index("taxonID")
+    score_index = colnames.index("bitscore")
+    prefix_dictionary = get_LCA.CANNONICAL_PREFIXES
+    ranks = list(prefix_dictionary.keys())
+    n_output_columns = len(colnames) + 1 + len(ranks)
+
+    blacklist, clade_blacklist = get_LCA.read_blacklist_file(blacklist_path)
+    taxon_filter = get_LCA.build_taxon_filter(blacklist, clade_blacklist)
+
+    def process_block(block, outfile_handle):
+        start = clock()
+        taxonID_groups = [[int(item[taxonomy_column_index]) for item in current_contents]
+                          for query_ID, current_contents in block]
+        LCA_taxonIDs = get_LCA.lca_engine.lca_batch(taxonID_groups)
+        timings["LCA"] += clock() - start
+
+        start = clock()
+        lineages = get_LCA.lineage_table.get_cannonical_lineages(LCA_taxonIDs, ranks)
+        timings["lineage"] += clock() - start
+
+        start = clock()
+        for (query_ID, current_contents), LCA_taxonID, lineage in zip(block, LCA_taxonIDs, lineages):
+            outfile_handle.write(get_LCA.format_LCA_output_line(
+                query_ID, current_contents, LCA_taxonID, lineage, n_output_columns) + "\n")
+        timings["write"] += clock() - start
+
+    # get_LCA.py reports each query_ID without passing hits
+    with open(infile) as infile_handle, \
+         open(outfile, "w", buffering=get_LCA.OUTPUT_BUFFER_SIZE) as outfile_handle, \
+         open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+
+        groups = get_LCA.iterate_query_groups(infile_handle, len(colnames))
+        block = []
+        while True:
+            start = clock()
+            group = next(groups, None)
+            timings["parse"] += clock() - start
+            if group == None:
+                break
+            query_ID, lines = group
+
+            start = clock()
+            current_contents = []
+            current_taxonIDs = set()
+            for line in lines:
+                if get_LCA.taxonID_passes_filtration(line, taxonomy_column_index,
+                                                     current_taxonIDs, taxon_filter):
+                    current_contents.append(line)
+            timings["filter"] += clock() - start
+
+            start = clock()
+            current_contents = get_LCA.prepare_query_group(query_ID, current_contents,
+                                                           score_index, WITHIN_PERCENT_OF_TOP_SCORE)
+            timings["score_filter"] += clock() - start
+            if current_contents == None:
+                continue
+
+            block.append((query_ID, current_contents))
+            if len(block) == get_LCA.LCA_BLOCK_SIZE:
+                process_block(block, outfile_handle)
+                block = []
+
+        process_block(block, outfile_handle)
+
+    return timings
+
+def parse_line_counts(line_counts):
+    """ Parses a comma-delimited list of line counts, which can be written as 1e6. """
+    return [int(float(item)) for item in line_counts.split(",") if item != ""]
+
+#------------------------------------------------------------------------------#
+# Main
+#------------------------------------------------------------------------------#
+def main():
+
+    #--------------------------------------------------------------------------#
+    # Take inputs
+    #--------------------------------------------------------------------------#
+    parser = argparse.ArgumentParser(description="""
+    Benchmarks get_LCA.py on synthetic BLAST/DIAMOND output. For each input
+    size it generates a hit file with generate_hits.py, runs get_LCA.py end to
+    end in each requested mode (reporting wall time, lines per second and peak
+    RSS), and times each stage of the pipeline - parse, filter, score_filter,
+    LCA, lineage and write - in-process. Runs offline against the bundled
+    taxonomy fixture by default. Results are written as JSON.
+    """)
+    parser.add_argument('-n', '--lines', type=str, required=False, default="1e5",
+        help='''Comma-delimited list of approximate input sizes in lines, e.g.
+        1e5,1e6,1e7,1e8. <default: 1e5>''')
+    parser.add_argument('-m', '--modes', type=str, required=False, default="legacy,streaming",
+        help='''Comma-delimited list of get_LCA.py modes to run end to end -
+        legacy (whole file in memory), streaming and threads. Legacy holds the
+        whole input in memory, so leave it out for the largest sizes.
+        <default: legacy,streaming>''')
+    parser.add_argument('-p', '--threads', type=int, required=False, default=4,
+        help='''Number of processes for the threads mode. <default: 4>''')
+    parser.add_argument('-d', '--hits_per_query', type=str, required=False,
+        default="poisson:5",
+        help='''Hits-per-query distribution, see generate_hits.py. <default: poisson:5>''')
+    parser.add_argument('-s', '--spread', type=int, required=False, default=2,
+        help='''Taxonomic spread, see generate_hits.py. <default: 2>''')
+    parser.add_argument('--na_fraction', type=float, required=False, default=0.01,
+        help='''Fraction of hits with "N/A" taxonIDs. <default: 0.01>''')
+    parser.add_argument('--blacklisted_fraction', type=float, required=False, default=0.01,
+        help='''Fraction of hits with blacklisted taxonIDs. <default: 0.01>''')
+    parser.add_argument('-t', '--taxonomy', type=str, required=False,
+        default=DEFAULT_TAXONOMY,
+        help='''Taxonomy snapshot directory, or NCBI taxdump directory or
+        archive. <default: the bundled fixture>''')
+    parser.add_argument('-b', '--blacklist', type=str, required=False,
+        default=DEFAULT_BLACKLIST,
+        help='''Blacklist file. <default: the bundled fixture blacklist>''')
+    parser.add_argument('-w', '--workdir', type=str, required=False, default="",
+        help='''Directory for the generated inputs and outputs. Inputs that
+        already exist there are reused. <default: a temporary directory that is
+        removed afterwards>''')
+    parser.add_argument('-o', '--outfile', type=str, required=False,
+        default="benchmark_results.json",
+        help='''Path to the JSON results file. <default: benchmark_results.json>''')
+    parser.add_argument('--no_stages', action='store_true',
+        help='''Skip the per-stage timings.''')
+    parser.add_argument('--seed', type=int, required=False, default=1,
+        help='''Random seed for generate_hits.py. <default: 1>''')
+    args = parser.parse_args()
+
+    modes = [mode for mode in args.modes.split(",") if mode != ""]
+    for mode in modes:
+        if not mode in {"legacy", "streaming", "threads"}:
+            raise ValueError("Unknown mode " + mode + ". Use legacy, streaming or threads.")
+    draw_hits, mean_hits = parse_distribution(args.hits_per_query)
+
+    #--------------------------------------------------------------------------#
+    # Main
+    #--------------------------------------------------------------------------#
+    remove_workdir = args.workdir == ""
+    workdir = tempfile.mkdtemp(prefix="virID_benchmark_") if remove_workdir else args.workdir
+    os.makedirs(workdir, exist_ok=True)
+    log_path = os.path.join(workdir, "get_LCA.log")
+
+    try:
+        snapshot_path = build_snapshot(args.taxonomy, os.path.join(workdir, "taxdb"))
+
+        # Load the taxonomy up front, so it isn't timed as part of a stage
+        os.environ[SNAPSHOT_ENV_VAR] = snapshot_path
+        if not args.no_stages:
+            from virid import get_LCA
+            get_LCA.load_taxonomy_handles()
+
+        taxonomy = load_taxonomy(snapshot_path)
+        results = []
+        for n_lines in parse_line_counts(args.lines):
+            n_queries = max(1, int(round(n_lines / mean_hits)))
+            infile = os.path.join(workdir, "hits_{0}_{1}_{2}_{3}_{4}_{5}.tsv".format(
+                n_queries, args.hits_per_query.replace(":", "-"), args.spread,
+                args.na_fraction, args.blacklisted_fraction, args.seed))
+
+            print("Generating {0} queries (about {1} lines).".format(n_queries, n_lines))
+            if not os.path.exists(infile):
+                generate_hits(infile + ".tmp", n_queries, args.hits_per_query, args.spread,
+                              args.na_fraction, args.blacklisted_fraction,
+                              taxonomy=taxonomy, blacklist_path=args.blacklist,
+                              seed=args.seed)
+                os.replace(infile + ".tmp", infile)
+            with open(infile) as infile_handle:
+                actual_lines = sum(1 for line in infile_handle)
+
+            result = OrderedDict([
+                ("lines", actual_lines),
+                ("queries", n_queries),
+                ("input_mb", os.path.getsize(infile) / 1024.0 / 1024.0),
+                ("end_to_end", [])
+            ])
+
+            for mode in modes:
+                print("Running get_LCA.py in {0} mode on {1} lines.".format(mode, actual_lines))
+                seconds, peak_rss_mb = run_end_to_end(
+                    infile, os.path.join(workdir, "LCA_" + mode + ".tsv"), args.blacklist,
+                    snapshot_path, mode, args.threads, log_path)
+                result["end_to_end"].append(OrderedDict([
+                    ("mode", mode),
+                    ("threads", args.threads if mode == "threads" else 1),
+                    ("seconds", seconds),
+                    ("lines_per_second", actual_lines / seconds),
+                    ("peak_rss_mb", peak_rss_mb)
+                ]))
+
+            if not args.no_stages:
+                print("Timing each stage on {0} lines.".format(actual_lines))
+                timings = profile_stages(get_LCA, infile, os.path.join(workdir, "LCA_stages.tsv"),
+                                         args.blacklist)
+                total = sum(timings.values())
+                timings["total"] = total
+                timings["lines_per_second"] = actual_lines / total
+                result["stages"] = timings
+
+            results.append(result)
+
+        output = OrderedDict([
+            ("benchmark", "get_LCA.py"),
+            ("created", time.strftime("%c")),
+            ("machine", OrderedDict([
+                ("platform", platform.platform()),
+                ("python", platform.python_version()),
+                ("numpy", np.__version__),
+                ("cpu_count", os.cpu_count())
+            ])),
+            ("taxonomy", os.path.abspath(args.taxonomy)),
+            ("generator", OrderedDict([
+                ("hits_per_query", args.hits_per_query),
+                ("spread", args.spread),
+                ("na_fraction", args.na_fraction),
+                ("blacklisted_fraction", args.blacklisted_fraction),
+                ("seed", args.seed)
+            ])),
+            ("results", results)
+        ])
+    finally:
+        if remove_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output_directory = os.path.dirname(args.outfile)
+    if output_directory != "":
+        os.makedirs(output_directory, exist_ok=True)
+    with open(args.outfile, "w") as outfile:
+        json.dump(output, outfile, indent=2)
+        outfile.write("\n")
+
+    for result in results:
+        for run in result["end_to_end"]:
+            print("{0} lines, {1}: {2:.2f} s, {3:.0f} lines/s, peak RSS {4:.0f} MB".format(
+                result["lines"], run["mode"], run["seconds"], run["lines_per_second"],
+                run["peak_rss_mb"]))
+    print("Wrote results to " + args.outfile)
+
+if __name__ == '__main__':
+    main()
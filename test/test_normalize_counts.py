@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Normalizes a matrix of build_counts_matrix.py samples with the metrics file of
+extract_unassigned_reads.py as the manifest. Run with
+python -m pytest test or python -m unittest discover test.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+TEST_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+SCRIPT_DIRECTORY = os.path.join(TEST_DIRECTORY, "..", "bin", "python")
+sys.path.insert(0, SCRIPT_DIRECTORY)
+from virid.build_counts_matrix import get_sample_name
+from virid.counts_matrix import CountsMatrix
+
+NORMALIZE_COUNTS = os.path.join(SCRIPT_DIRECTORY, "normalize_counts.py")
+
+class TestNormalizeWithMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.TemporaryDirectory()
+        self.matrix_path = os.path.join(self.workdir.name, "cohort.npz")
+        self.metrics_path = os.path.join(self.workdir.name, "metrics.tsv")
+
+        # Columns named as build_counts_matrix.py names them
+        samples = [get_sample_name("output/diamond/S1_diamond.tsv"),
+                   get_sample_name("output/diamond/S2_diamond.tsv.gz")]
+        CountsMatrix.from_columns(samples, [
+            (np.array([10239, 2]), np.array([50, 10])),
+            (np.array([10239]), np.array([4]))]).save(self.matrix_path)
+
+        # Lines as extract_unassigned_reads.py appends them - sampleID, total
+        # reads and unassigned reads - with S1 rerun after a failed attempt
+        with open(self.metrics_path, "w") as metrics:
+            metrics.write("S1\t9\t1\n")
+            metrics.write("S1\t1000\t200\n")
+            metrics.write("S2\t2000\t100\n")
+
+    def tearDown(self):
+        self.workdir.cleanup()
+
+    def normalize(self, *arguments):
+        outfile = os.path.join(self.workdir.name, "cohort_rpm.npz")
+        subprocess.run([sys.executable, NORMALIZE_COUNTS, "-i", self.matrix_path,
+                        "-o", outfile, "-M", self.metrics_path, "-m", "1000"] + list(arguments),
+                       check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return CountsMatrix.load(outfile)
+
+    def test_total_reads(self):
+        normalized = self.normalize("-s", "_diamond")
+        self.assertEqual(normalized.samples, ["S1_diamond", "S2_diamond"])
+        np.testing.assert_allclose(normalized.to_dense(), [[50, 2], [10, 0]])
+
+    def test_unassigned_reads(self):
+        normalized = self.normalize("-s", "_diamond", "-d", "3")
+        np.testing.assert_allclose(normalized.to_dense(), [[250, 40], [50, 0]])
+
+    def test_missing_suffix(self):
+        with self.assertRaises(subprocess.CalledProcessError) as error:
+            self.normalize()
+        self.assertIn(b"--sample_suffix", error.exception.stderr)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -21,6 +21,17 @@ include './bin/modules/spades_assembly' params(params)
 
 include './bin/modules/diamond'  params(params)
 
+// Searches batches and shards, whose hits are published once split or gathered
+include diamond as diamond_unpublished from './bin/modules/diamond' params(
+  diamond_database: params.diamond_database,
+  diamond_outfmt: params.diamond_outfmt,
+  temp_dir: params.temp_dir,
+  diamond_evalue: params.diamond_evalue,
+  out_dir: params.out_dir,
+  log_file: params.log_file,
+  publish_hits: "F"
+  )
+
 include blast_to_LCA as convert_diamond from './bin/modules/blast_to_LCA' params(
   LCA_top_percent: params.LCA_top_percent,
   out_dir: params.out_dir,
@@ -29,17 +40,40 @@ include blast_to_LCA as convert_diamond from './bin/modules/blast_to_LCA' params
   taxid_blacklist: params.taxid_blacklist,
   within_percent_of_top_score: params.within_percent_of_top_score = "1",
   taxonomy_column: params.taxonomy_column,
-  score_column:params.score_column
+  score_column:params.score_column,
+  LCA_cache_file: params.LCA_cache_file,
+  LCA_counts: params.reads_pipeline,
+  LCA_table: params.reads_pipeline == "T" ? params.reads_pipeline_LCA_table : "T",
+  compress_intermediates: params.compress_intermediates
   )
 
 include './bin/modules/blast' params(params)
 
+include blast as blast_unpublished from './bin/modules/blast' params(
+  blast_database: params.blast_database,
+  blast_evalue: params.blast_evalue,
+  blast_outfmt: params.blast_outfmt,
+  blast_log_file: params.blast_log_file,
+  blast_type: params.blast_type,
+  blast_max_hsphs: params.blast_max_hsphs,
+  blast_max_targets: params.blast_max_targets,
+  blast_restrict_to_taxids: params.blast_restrict_to_taxids,
+  blast_ignore_taxids: params.blast_ignore_taxids,
+  out_dir: params.out_dir,
+  log_file: params.log_file,
+  publish_hits: "F"
+  )
+
 include blast_to_LCA as convert_blast from './bin/modules/blast_to_LCA' params(
   LCA_top_percent: params.LCA_top_percent,
   out_dir: params.out_dir,
   column_names: params.blast_readable_colnames,
   source: 'blast',
-  taxid_blacklist: params.taxid_blacklist
+  taxid_blacklist: params.taxid_blacklist,
+  LCA_cache_file: params.LCA_cache_file,
+  LCA_counts: params.reads_pipeline,
+  LCA_table: params.reads_pipeline == "T" ? params.reads_pipeline_LCA_table : "T",
+  compress_intermediates: params.compress_intermediates
   )
 
 include blast as blast_contaminant from './bin/modules/blast' params(
@@ -60,14 +94,40 @@ include './bin/modules/generate_output' params(params)
 
 include './bin/modules/fastq_to_fasta' params(params)
 
-include get_counts as get_counts_blast from './bin/modules/get_counts' params(
+include concatenate_batch from './bin/modules/batch_search' params(params)
+
+include split_batch as split_diamond_batch from './bin/modules/batch_search' params(
+  out_dir: params.out_dir,
+  search: 'diamond'
+  )
+
+include split_batch as split_blast_batch from './bin/modules/batch_search' params(
+  out_dir: params.out_dir,
+  search: 'blast'
+  )
+
+include shard_queries as shard_diamond_queries from './bin/modules/shard_queries' params(
+  out_dir: params.out_dir,
+  shard_max_Mbp: params.shard_max_Mbp,
+  search: 'diamond'
+  )
+
+include gather_hits as gather_diamond_hits from './bin/modules/shard_queries' params(
+  out_dir: params.out_dir,
+  search: 'diamond',
+  publish_hits: params.batch_search == "T" ? "F" : "T"
+  )
+
+include shard_queries as shard_blast_queries from './bin/modules/shard_queries' params(
   out_dir: params.out_dir,
-  source: "blast"
+  shard_max_Mbp: params.shard_max_Mbp,
+  search: 'blast'
   )
 
-include get_counts as get_counts_diamond from './bin/modules/get_counts' params(
+include gather_hits as gather_blast_hits from './bin/modules/shard_queries' params(
   out_dir: params.out_dir,
-  source: "diamond"
+  search: 'blast',
+  publish_hits: params.batch_search == "T" ? "F" : "T"
   )
 
 //============================================================================//
@@ -86,9 +146,193 @@ def sampleID_set_from_infile(input) {
   return ch
 }
 
+def size_balanced_batches(input_ch) {
+  // The purpose of this function is to pack the samples of a channel of sets
+  // of structure sampleID:file_path into batches for DIAMOND and BLAST. It
+  // returns a channel of sets of structure batchID:[sampleIDs]:[file_paths].
+  // There are enough batches for each to hold at most params.batch_max_MB of
+  // sequences and params.batch_max_samples samples, and each sample goes to
+  // the batch with the fewest bytes so far, largest samples first, so the
+  // batches are of similar size. This waits for all samples.
+  return input_ch.toList().flatMap{ samples ->
+    if (samples.size() == 0) {
+      return []
+    }
+    def max_bytes = (params.batch_max_MB as long) * 1024 * 1024
+    def max_samples = params.batch_max_samples as int
+    def total_bytes = samples.sum{ it[1].size() }
+    def n_batches = Math.max(Math.ceil(total_bytes / max_bytes) as int,
+                             Math.ceil(samples.size() / max_samples) as int)
+    n_batches = Math.max(n_batches, 1)
+
+    def batches = (0..<n_batches).collect{ [] }
+    def batch_bytes = (0..<n_batches).collect{ 0L }
+    samples.sort(false){ -it[1].size() }.each{ sample ->
+      def i = (0..<n_batches)
+        .findAll{ batches[it].size() < max_samples }
+        .min{ batch_bytes[it] }
+      batches[i].add(sample)
+      batch_bytes[i] += sample[1].size()
+    }
+
+    batches
+      .findAll{ it.size() > 0 }
+      .withIndex()
+      .collect{ batch, i -> ["batch_${i}".toString(), batch.collect{ it[0] }, batch.collect{ it[1] }] }
+  }
+}
+
+def per_sample_outputs(split_ch, suffix) {
+  // The purpose of this function is to turn the per-sample files of split
+  // batches, named <sampleID><suffix>, back into a channel of sets of
+  // structure sampleID:file_path.
+  return split_ch
+    .flatten()
+    .map{ file -> [file.name - suffix, file] }
+}
+
+def is_large_query(sample) {
+  // Whether the query file of a set of structure sampleID:file_path is split
+  // into shards. A file of at most params.shard_max_Mbp bytes can't have more
+  // than that many residues, so it is searched whole.
+  return sample[1].size() > (params.shard_max_Mbp as long) * 1000000
+}
+
+def is_shard(sampleID) {
+  return sampleID.toString() ==~ /.*\.shard_\d+_of_\d+/
+}
+
+def per_shard_inputs(shard_ch) {
+  // The purpose of this function is to turn the shards of each sample, named
+  // <sampleID>.shard_<i>_of_<n>.fasta, into a channel of sets of structure
+  // shardID:file_path, where the shardID is the file name without .fasta.
+  return shard_ch.flatMap{ sampleID, shards ->
+    (shards instanceof List ? shards : [shards])
+      .collect{ shard -> [shard.name - ~/\.fasta$/, shard] }
+  }
+}
+
+def grouped_shard_outputs(hits_ch) {
+  // The purpose of this function is to group the hits of the shards of each
+  // sample, in a channel of sets of structure shardID:file_path, into sets of
+  // structure sampleID:[file_paths]. A sample is emitted as soon as the hits
+  // of all its shards are in.
+  return hits_ch
+    .map{ shardID, hits ->
+      def match = (shardID.toString() =~ /^(.*)\.shard_\d+_of_(\d+)$/)[0]
+      [groupKey(match[1], match[2] as int), hits]
+    }
+    .groupTuple()
+    .map{ sampleID, hits -> [sampleID.toString(), hits] }
+}
+
 //============================================================================//
 // Define workflows
 //============================================================================//
+workflow diamond_search {
+  // Runs DIAMOND on a channel of sets of structure sampleID:fasta, where the
+  // fastas may be batches of samples, and emits the per-sample hits.
+  get: search_input
+  main:
+
+  // Split large query files into shards that are searched in parallel
+  if (params.shard_search == "T") {
+    shard_diamond_queries(search_input.filter{ is_large_query(it) })
+    diamond_queries = search_input
+      .filter{ !is_large_query(it) }
+      .mix(per_shard_inputs(shard_diamond_queries.out))
+  }
+  else {
+    diamond_queries = search_input
+  }
+
+  // Only the hits of whole samples are published as they are
+  if (params.batch_search == "T") {
+    diamond_unpublished(diamond_queries)
+    diamond_out = diamond_unpublished.out
+  }
+  else if (params.shard_search == "T") {
+    diamond(diamond_queries.filter{ !is_shard(it[0]) })
+    diamond_unpublished(diamond_queries.filter{ is_shard(it[0]) })
+    diamond_out = diamond.out.mix(diamond_unpublished.out)
+  }
+  else {
+    diamond(diamond_queries)
+    diamond_out = diamond.out
+  }
+
+  // Gather the hits of the shards of each sample, in query order
+  if (params.shard_search == "T") {
+    gather_diamond_hits(grouped_shard_outputs(diamond_out.filter{ is_shard(it[0]) }))
+    diamond_hits = diamond_out
+      .filter{ !is_shard(it[0]) }
+      .mix(gather_diamond_hits.out)
+  }
+  else {
+    diamond_hits = diamond_out
+  }
+
+  // Split the hits of batches back into samples
+  if (params.batch_search == "T") {
+    diamond_hits = per_sample_outputs(split_diamond_batch(diamond_hits), "_diamond.out")
+  }
+
+  emit:
+  diamond_hits
+}
+
+workflow blast_search {
+  // Runs BLAST on a channel of sets of structure sampleID:fasta, where the
+  // fastas may be batches of samples, and emits the per-sample hits.
+  get: search_input
+  main:
+
+  // Split large query files into shards that are searched in parallel
+  if (params.shard_search == "T") {
+    shard_blast_queries(search_input.filter{ is_large_query(it) })
+    blast_queries = search_input
+      .filter{ !is_large_query(it) }
+      .mix(per_shard_inputs(shard_blast_queries.out))
+  }
+  else {
+    blast_queries = search_input
+  }
+
+  // Only the hits of whole samples are published as they are
+  if (params.batch_search == "T") {
+    blast_unpublished(blast_queries)
+    blast_out = blast_unpublished.out
+  }
+  else if (params.shard_search == "T") {
+    blast(blast_queries.filter{ !is_shard(it[0]) })
+    blast_unpublished(blast_queries.filter{ is_shard(it[0]) })
+    blast_out = blast.out.mix(blast_unpublished.out)
+  }
+  else {
+    blast(blast_queries)
+    blast_out = blast.out
+  }
+
+  // Gather the hits of the shards of each sample, in query order
+  if (params.shard_search == "T") {
+    gather_blast_hits(grouped_shard_outputs(blast_out.filter{ is_shard(it[0]) }))
+    blast_hits = blast_out
+      .filter{ !is_shard(it[0]) }
+      .mix(gather_blast_hits.out)
+  }
+  else {
+    blast_hits = blast_out
+  }
+
+  // Split the hits of batches back into samples
+  if (params.batch_search == "T") {
+    blast_hits = per_sample_outputs(split_blast_batch(blast_hits), "_blast.out")
+  }
+
+  emit:
+  blast_hits
+}
+
 workflow assembly_pipeline {
 
   get: input_ch
@@ -105,13 +349,23 @@ workflow assembly_pipeline {
     .join(process_read_pairs.out) \
     | bwa_mem_contigs
 
+  // Batch the samples for DIAMOND and BLAST if requested
+  if (params.batch_search == "T") {
+    search_input = concatenate_batch(size_balanced_batches(contigs))
+  }
+  else {
+    search_input = contigs
+  }
+
   // DIAMOND processing
-  diamond(contigs)
+  diamond_search(search_input)
+  diamond_search.out
     .filter{ it[1].size() > 0 } \
     | convert_diamond
 
   // BLAST Processing
-  blast(contigs)
+  blast_search(search_input)
+  blast_search.out
     .filter{ it[1].size()>0 } \
     | convert_blast
 
@@ -119,8 +373,8 @@ workflow assembly_pipeline {
   blast_contaminant(contigs)
 
   // Merge channels and generate output
-  convert_blast.out
-    .join(convert_diamond.out)
+  convert_blast.out[0]
+    .join(convert_diamond.out[0])
     .join(contigs)
     .join(bwa_mem_contigs.out)
     .join(blast_contaminant.out) \
@@ -137,20 +391,28 @@ workflow read_pipeline {
   // Convert input to fasta
   fastq_to_fasta(process_read_pairs.out)
 
-  // Run DIAMOND
+  // Batch the samples for DIAMOND and BLAST if requested
+  if (params.batch_search == "T") {
+    search_input = concatenate_batch(size_balanced_batches(fastq_to_fasta.out))
+  }
+  else {
+    search_input = fastq_to_fasta.out
+  }
+
+  // Run DIAMOND. The counts are made while converting.
   if (params.reads_pipeline_no_diamond == "F") {
-    diamond(fastq_to_fasta.out)
+    diamond_search(search_input)
+    diamond_search.out
       .filter{ it[1].size() > 0 } \
-      | convert_diamond \
-      | get_counts_diamond
+      | convert_diamond
   }
 
-  // Run BLAST
+  // Run BLAST. The counts are made while converting.
   if (params.reads_pipeline_no_blast == "F") {
-    blast(fastq_to_fasta.out)
+    blast_search(search_input)
+    blast_search.out
       .filter{ it[1].size()>0 } \
-      | convert_blast \
-      | get_counts_blast
+      | convert_blast
   }
 
   // Run contaminant blast
@@ -170,6 +432,14 @@ else if( (params.assembly_pipeline == "T") && (params.reads_pipeline == "T") ) {
   be set to T."
 }
 
+if( !(params.batch_search in ["T", "F"]) ) {
+  error "params.batch_search must be T or F."
+}
+
+if( !(params.shard_search in ["T", "F"]) ) {
+  error "params.shard_search must be T or F."
+}
+
 if( (params.reads_pipeline_no_diamond == "T") && (params.reads_pipeline_no_blast == "T") ) {
   error "Only one of params.reads_pipeline_no_diamond or \
   params.reads_pipeline_no_blast may be set to 'T'."